@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# Copyright 2009 by Wade Brainerd.
+# This file is part of Bounce.
+#
+# Bounce is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bounce is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bounce.  If not, see <http://www.gnu.org/licenses/>.
+"""Headless rendering benchmark for Bounce.
+
+Renders scripted frames of the game sequences into an in-memory image, without a display, Sugar or sound, and
+reports the throughput of each pongc primitive and the frame times of each sequence, stage and resolution.
+
+    ./benchmark.py [--backend numpy] [--backend native] [--frames 200] [--sizes 1200x900,800x600] [--threads 1,4]
+                   [--scale 2] [--quality 3]
+
+The native backend draws into a cairo.ImageSurface, so it needs pycairo but no display.  Blobs built before draw
+lists draw into a gtk.gdk.Image, which needs PyGTK and a display.  The NumPy backend needs neither."""
+
+import os, sys, time, types, random, subprocess, array
+from optparse import OptionParser
+
+SEQUENCES = ['PlaySequence', 'ScoreSequence', 'WinSequence']
+SIZES = '1200x900,800x600,1920x1080'
+
+#---------------------------------------------------------------------------------------------------------------------
+# Stand-ins for the user interface modules bounce.py imports.  Only the game and rendering code runs here.
+
+class _DummyType(type):
+    def __getattr__(cls, name):
+        return _Dummy()
+
+class _Dummy(object):
+    """Accepts any use: calling, attribute access, subclassing and appending strings."""
+    __metaclass__ = _DummyType
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Dummy()
+
+    def __getattr__(self, name):
+        return _Dummy()
+
+    def __add__(self, other):
+        return other
+
+class _DummyModule(types.ModuleType):
+    __all__ = []
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _Dummy
+
+def install_stand_ins(names, required):
+    """Replaces the modules in names that cannot be imported, and those in required regardless."""
+    for name in names:
+        if name not in required:
+            try:
+                __import__(name)
+                continue
+            except ImportError:
+                pass
+        module = _DummyModule(name)
+        sys.modules[name] = module
+        if '.' in name:
+            parent, child = name.rsplit('.', 1)
+            setattr(sys.modules[parent], child, module)
+
+def import_bounce(backend):
+    os.environ['PONGC_BACKEND'] = backend
+
+    # Sound and Sugar are never used, while the native backend needs the real cairo for its images.
+    names = ['gobject', 'pygtk', 'gtk', 'pango', 'cairo']
+    required = ['pygame', 'pygame.mixer', 'sugar', 'sugar.activity', 'sugar.graphics', 'sugar.presence']
+    if backend == 'numpy':
+        required = names + required
+    install_stand_ins(names + required, required)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import bounce
+    return bounce
+
+#---------------------------------------------------------------------------------------------------------------------
+# Measurement
+
+def new_drawimage(bounce, width, height):
+    if bounce.PONGC_BACKEND != 'native':
+        return bounce.new_image(width, height)
+    import cairo
+    return cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+
+def new_renderimage(bounce, width, height):
+    """Returns an image to render into at the current render scale."""
+    scale = bounce.get_render_scale()
+    if scale == 1:
+        return new_drawimage(bounce, width, height)
+    return new_drawimage(bounce, max((width + scale - 1) / scale, 1), max((height + scale - 1) / scale, 1))
+
+def set_screen_size(bounce, width, height):
+    bounce.screen_width = width
+    bounce.screen_height = height
+    bounce.set_3d_params(width, height, bounce.viewport_scale)
+
+def count_primitives(bounce, cmds):
+    args = { bounce.DRAW_LINE_2X: 5, bounce.DRAW_ELLIPSE_2X: 5, bounce.DRAW_FILL_ELLIPSE_2X: 5,
+             bounce.DRAW_LINE_3D: 7, bounce.DRAW_RECT_3D: 6, bounce.DRAW_CIRCLE_3D: 5,
+             bounce.DRAW_FILL_CIRCLE_3D: 5, bounce.DRAW_ELLIPSE_3D: 6, bounce.DRAW_TEXT_2X: 5,
+             bounce.DRAW_ICON_2X: 5, bounce.DRAW_SPRITE_2X: 4 }
+    count = 0
+    pos = 0
+    while pos < len(cmds) and cmds[pos] in args:
+        n = args[cmds[pos]]
+        if cmds[pos] == bounce.DRAW_TEXT_2X:
+            n += cmds[pos+5]
+        pos += 1 + n
+        count += 1
+    return count
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(p*(len(values)-1))]
+
+def bench_primitives(bounce, width, height, count, repeats):
+    """Returns a list of (name, primitives per second) for each draw list primitive."""
+    to_fixed = bounce.to_fixed
+    set_screen_size(bounce, width, height)
+    img = new_renderimage(bounce, width, height)
+
+    def rnd(a, b):
+        return random.randint(a, b)
+
+    # Sizes and positions resemble the ones used by the game.
+    w, h = width/2, height/2
+    makers = [
+        ('line_2x',         lambda l: l.line_2x(rnd(0, w), rnd(0, h), rnd(0, w), rnd(0, h), 255)),
+        ('ellipse_2x',      lambda l: l.ellipse_2x(rnd(0, w), rnd(0, h), 6, 6, 255)),
+        ('fill_ellipse_2x', lambda l: l.fill_ellipse_2x(rnd(0, w), rnd(0, h), 6, 6, 255)),
+        ('line_3d',         lambda l: l.line_3d(rnd(0, to_fixed(99)), rnd(0, to_fixed(99)), 1,
+                                                rnd(0, to_fixed(99)), rnd(0, to_fixed(99)), to_fixed(160), 1.0)),
+        ('rect_3d',         lambda l: l.rect_3d(rnd(0, to_fixed(50)), rnd(0, to_fixed(50)),
+                                                rnd(to_fixed(50), to_fixed(99)), rnd(to_fixed(50), to_fixed(99)),
+                                                rnd(0, to_fixed(160)), 1.0)),
+        ('circle_3d',       lambda l: l.circle_3d(rnd(0, to_fixed(99)), rnd(0, to_fixed(99)), rnd(0, to_fixed(160)),
+                                                  to_fixed(rnd(1, 10)), 1.0)),
+        ('fill_circle_3d',  lambda l: l.fill_circle_3d(rnd(0, to_fixed(99)), rnd(0, to_fixed(99)),
+                                                       rnd(0, to_fixed(160)), to_fixed(1), 1.0)),
+        ('ellipse_3d',      lambda l: l.ellipse_3d(rnd(0, to_fixed(99)), rnd(0, to_fixed(99)), rnd(0, to_fixed(160)),
+                                                   to_fixed(2), to_fixed(1), 0.5)),
+        ('text_2x',         lambda l: l.text_2x(rnd(0, w), rnd(0, h), '60.00 fps', 1, 255)),
+        ('icon_2x',         lambda l: l.icon_2x(rnd(0, w), rnd(0, h), bounce.HUD_ICON_X, 1, 255)),
+        ('sprite_2x',       lambda l: l.sprite_2x(rnd(0, w), rnd(0, h), bounce.SPRITE_PIP, 255)),
+    ]
+
+    results = []
+    for name, make in makers:
+        random.seed(0)
+        drawlist = bounce.DrawList()
+        for i in range(count):
+            make(drawlist)
+        best = None
+        for i in range(repeats):
+            bounce.clear_image(img)
+            t0 = time.time()
+            drawlist.draw(img)
+            t = time.time() - t0
+            if best is None or t < best:
+                best = t
+        results.append((name, count/max(best, 1e-9)))
+
+    # Bulk projection, without any rasterization.
+    random.seed(0)
+    points = array.array('i')
+    for i in range(count):
+        points.extend((rnd(0, to_fixed(99)), rnd(0, to_fixed(99)), rnd(0, to_fixed(160))))
+    out = array.array('i', [0]*(count*2))
+    best = None
+    for i in range(repeats):
+        t0 = time.time()
+        bounce.project_points(points, out)
+        t = time.time() - t0
+        if best is None or t < best:
+            best = t
+    results.append(('project_points', count/max(best, 1e-9)))
+    return results
+
+def script_input(bounce, frame):
+    """Follows the ball with the paddle and swings at it regularly, so rallies keep going."""
+    game = bounce.game
+    game.mousex = bounce.from_fixed(game.ball.pos.x) * bounce.screen_width / 100
+    game.mousey = bounce.from_fixed(game.ball.pos.y) * bounce.screen_height / 100
+    game.mousedown = int(frame % 20 < 4)
+
+def bench_frames(bounce, seqname, level, width, height, frames):
+    """Runs a sequence for a number of frames, restarting it whenever it ends.  Returns the frame times in
+    seconds and the number of primitives drawn.  Below render scale 1 the times include scaling the changed area
+    up to the screen."""
+    game = bounce.game
+    seqclass = getattr(bounce, seqname)
+
+    set_screen_size(bounce, width, height)
+    img = new_renderimage(bounce, width, height)
+    screenimg = None
+    if bounce.get_render_scale() > 1:
+        screenimg = new_drawimage(bounce, width, height)
+
+    random.seed(0)
+    game.stage_descs = [desc.copy() for desc in bounce.DEFAULT_STAGE_DESCS]
+    game.player1 = bounce.ComputerBuddy()
+    game.player2 = bounce.ComputerBuddy()
+    game.set_level(level)
+
+    # ScoreSequence animates the last movement of the ball.
+    game.ball.update(game.paddle1, game.paddle2, game.stage)
+    game.set_sequence(seqclass())
+
+    times = []
+    primitives = 0
+    lastdirty = None
+    for frame in range(frames):
+        script_input(bounce, frame)
+
+        t0 = time.time()
+        game.sequence.update()
+        if not isinstance(game.sequence, seqclass):
+            game.set_sequence(seqclass())
+            lastdirty = None
+        prevdirty = lastdirty
+        full, lastdirty = game.render_3d(img, lastdirty)
+        if screenimg is not None:
+            if full or prevdirty is None:
+                bounce.upscale_image(img, screenimg, 0, 0, width, height)
+            else:
+                bounce.upscale_image(img, screenimg, *bounce.union_rect(prevdirty, lastdirty))
+        times.append(time.time() - t0)
+
+        primitives += count_primitives(bounce, game.drawlist.cmds)
+    return times, primitives
+
+#---------------------------------------------------------------------------------------------------------------------
+# Reporting
+
+def run(backend, options):
+    bounce = import_bounce(backend)
+    sizes = [tuple(int(v) for v in s.split('x')) for s in options.sizes.split(',')]
+
+    threads = [bounce.get_raster_threads()]
+    if options.threads:
+        threads = [int(n) for n in options.threads.split(',')]
+
+    if options.scale:
+        bounce.set_render_scale(options.scale)
+    if options.quality is not None:
+        bounce.game.set_quality(options.quality)
+
+    for n in threads:
+        bounce.set_raster_threads(n)
+        print('backend %s, %d raster thread(s), render scale %d, quality tier %d' % (
+            bounce.PONGC_BACKEND, bounce.get_raster_threads(), bounce.get_render_scale(), bounce.game.qualitytier))
+        print('')
+        print('%-16s %12s' % ('primitive', 'prims/s'))
+        for name, rate in bench_primitives(bounce, sizes[0][0], sizes[0][1], options.primitives, 5):
+            print('%-16s %12.0f' % (name, rate))
+        print('')
+
+        print('%-14s %-10s %-10s %9s %9s %9s %12s' % ('sequence', 'stage', 'size', 'ms/frame', 'p50 ms', 'p99 ms', 'prims/s'))
+        for seqname in SEQUENCES:
+            for level, desc in enumerate(bounce.DEFAULT_STAGE_DESCS):
+                for width, height in sizes:
+                    times, primitives = bench_frames(bounce, seqname, level, width, height, options.frames)
+                    total = sum(times)
+                    print('%-14s %-10s %-10s %9.2f %9.2f %9.2f %12.0f' % (
+                        seqname, desc['Name'], '%dx%d' % (width, height), 1000.0*total/len(times),
+                        1000.0*percentile(times, 0.5), 1000.0*percentile(times, 0.99), primitives/max(total, 1e-9)))
+        print('')
+    sys.stdout.flush()
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--backend', action='append', dest='backends', choices=['native', 'numpy'],
+                      help='pongc backend to measure, may be repeated (default: whichever pongc picks)')
+    parser.add_option('--frames', type='int', default=200, help='frames rendered per run')
+    parser.add_option('--primitives', type='int', default=2000, help='primitives drawn per primitive benchmark')
+    parser.add_option('--sizes', default=SIZES, help='comma separated list of WIDTHxHEIGHT resolutions')
+    parser.add_option('--threads', help='comma separated list of raster thread counts to measure (default: as bounce sets)')
+    parser.add_option('--scale', type='int', help='render scale, from 1 to 4 (default: as bounce sets)')
+    parser.add_option('--quality', type='int', help='quality tier, 0 being the best (default: as bounce sets)')
+    options, args = parser.parse_args()
+
+    backends = options.backends or ['']
+    if len(backends) == 1:
+        run(backends[0], options)
+        return
+
+    # The backend is chosen when pongc is imported, so measure each one in its own process.
+    for backend in backends:
+        subprocess.call([sys.executable, os.path.abspath(__file__), '--backend', backend,
+                         '--frames', str(options.frames), '--primitives', str(options.primitives),
+                         '--sizes', options.sizes] + (options.threads and ['--threads', options.threads] or []) +
+                        (options.scale and ['--scale', str(options.scale)] or []) +
+                        (options.quality is not None and ['--quality', str(options.quality)] or []))
+        print('')
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,7 @@
 #!/usr/bin/env python
 """Bounce - 3D action game by Wade Brainerd <wadetb@gmail.com>."""
 
-import logging, os, time, math, threading, random, time
+import logging, os, time, math, threading, random, time, array, bisect, collections, cProfile
 from gettext import gettext as _
 
 try:
@@ -49,6 +49,29 @@ log.setLevel(logging.DEBUG)
 logging.basicConfig()
 gtk.add_log_handlers()
 
+# Rasterize draw lists in bands across the available processors, up to four.  BOUNCE_RENDER_THREADS overrides this.
+def default_render_threads():
+    try:
+        import multiprocessing
+        return min(multiprocessing.cpu_count(), 4)
+    except (ImportError, NotImplementedError):
+        return 1
+
+try:
+    render_threads = int(os.environ.get('BOUNCE_RENDER_THREADS', 0))
+except ValueError:
+    render_threads = 0
+set_raster_threads(render_threads or default_render_threads())
+log.debug('rasterizing with %d thread(s)' % get_raster_threads())
+
+# Frames may be rendered at a lower resolution and scaled up when shown, trading detail for speed.  The render scale
+# is the number of screen pixels per rendered pixel, from 1 to 4.  At 2 the output looks the same as at 1, since
+# pongc draws everything in 2x2 pixel blocks anyway.  BOUNCE_RENDER_SCALE overrides the default.
+try:
+    set_render_scale(int(os.environ.get('BOUNCE_RENDER_SCALE', 1)))
+except ValueError:
+    pass
+
 # This section can be modified to change the default stages that are built into the activity.
 DEFAULT_STAGE_DESCS = [
     { 'Name': _('practice'), 'StageDepth': 160, 'StageXGravity': 0,   'StageYGravity': 0,   'BallSize': 1, 'BallSpeed':  2, 'PaddleWidth': 20, 'PaddleHeight': 20, 'AISpeed': 1, 'AIRecenter': 1, },
@@ -66,6 +89,16 @@ def clamp(a, b, c):
     elif (a>c): return c
     else: return a
 
+def union_rect(a, b):
+    """Returns the bounding box of two (x, y, w, h) rectangles, ignoring empty ones."""
+    if a[2] <= 0 or a[3] <= 0: return b
+    if b[2] <= 0 or b[3] <= 0: return a
+    x0 = min(a[0], b[0])
+    y0 = min(a[1], b[1])
+    x1 = max(a[0]+a[2], b[0]+b[2])
+    y1 = max(a[1]+a[3], b[1]+b[3])
+    return (x0, y0, x1-x0, y1-y0)
+
 def to_fixed(a):
     return int(a * 256)
 
@@ -84,6 +117,16 @@ class Vector:
 
 zerovec = Vector(0, 0, 0)
 
+def interpolate(obj):
+    """Returns where to draw obj: game.alpha of the way from its position before the last game step to its current
+    one."""
+    prev = obj.prevpos
+    if prev is None or game.alpha >= 1.0:
+        return obj.pos
+    a = game.alpha
+    return Vector(int(prev.x + (obj.pos.x-prev.x)*a), int(prev.y + (obj.pos.y-prev.y)*a),
+                  int(prev.z + (obj.pos.z-prev.z)*a))
+
 # RGB color class.
 class Color:
     def __init__(self, r=255, g=255, b=255):
@@ -107,23 +150,222 @@ viewport_scale = to_fixed(100)
 # Game constants
 time_res = 32
 
+# The game advances this many steps per second, which all speeds and timers are tuned for, whatever the frame rate.
+# Frames in between steps show the moving objects interpolated between their last two positions.
+step_rate = 20.0
+
+# When the game falls behind, it runs the steps it missed, up to this many seconds worth, before showing the next
+# frame.  Only longer stalls slow the game down.
+max_step_lag = 0.5
+
+# Visual quality tiers, from best to cheapest.  The governor in BounceActivity moves between them depending on how
+# long frames take.  Each sets the frame rate target, the number of divisions of the wall grids, whether the ball
+# casts shadows, the number of rings shown when scoring, and whether optional cairo overlays are drawn.
+QUALITY_TIERS = [
+    { 'fps': 60, 'grid': 5, 'shadows': True,  'rings': 10, 'overlays': True },
+    { 'fps': 40, 'grid': 5, 'shadows': True,  'rings': 10, 'overlays': True },
+    { 'fps': 30, 'grid': 5, 'shadows': True,  'rings': 10, 'overlays': True },
+    { 'fps': 20, 'grid': 5, 'shadows': True,  'rings': 10, 'overlays': True },
+    { 'fps': 20, 'grid': 3, 'shadows': True,  'rings': 5,  'overlays': False },
+    { 'fps': 15, 'grid': 2, 'shadows': False, 'rings': 3,  'overlays': False },
+    { 'fps': 10, 'grid': 0, 'shadows': False, 'rings': 0,  'overlays': False },
+]
+
+# The tier used until frames have been measured, which matches what the XO can handle.
+DEFAULT_QUALITY = 3
+
+# Version of the journal format written by write_file.  Version 1 documents are a single JSON object holding
+# everything; from version 2 the first line is a JSON object with the stages and the activity state, and every
+# following line is one game of the score history as a compact JSON array (see ScoreStore.entry_row).
+JOURNAL_VERSION = 2
+
+# Packed list of drawing commands for a frame, rasterized by pongc in a single draw_list call.
+class DrawList:
+    def __init__(self):
+        self.cmds = array.array('i')
+
+    def reset(self):
+        del self.cmds[:]
+
+    def line_2x(self, x0, y0, x1, y1, color):
+        self.cmds.extend((DRAW_LINE_2X, x0, y0, x1, y1, color))
+
+    def ellipse_2x(self, x, y, rx, ry, color):
+        self.cmds.extend((DRAW_ELLIPSE_2X, x, y, rx, ry, color))
+
+    def fill_ellipse_2x(self, x, y, rx, ry, color):
+        self.cmds.extend((DRAW_FILL_ELLIPSE_2X, x, y, rx, ry, color))
+
+    def line_3d(self, x0, y0, z0, x1, y1, z1, c):
+        self.cmds.extend((DRAW_LINE_3D, x0, y0, z0, x1, y1, z1, int(c*255.0)))
+
+    def rect_3d(self, x0, y0, x1, y1, depth, c):
+        self.cmds.extend((DRAW_RECT_3D, x0, y0, x1, y1, depth, int(c*255.0)))
+
+    def circle_3d(self, x, y, z, radius, c):
+        self.cmds.extend((DRAW_CIRCLE_3D, x, y, z, radius, int(c*255.0)))
+
+    def fill_circle_3d(self, x, y, z, radius, c):
+        self.cmds.extend((DRAW_FILL_CIRCLE_3D, x, y, z, radius, int(c*255.0)))
+
+    def ellipse_3d(self, x, y, z, rx, ry, c):
+        self.cmds.extend((DRAW_ELLIPSE_3D, x, y, z, rx, ry, int(c*255.0)))
+
+    def text_2x(self, x, y, text, scale, color):
+        self.cmds.extend((DRAW_TEXT_2X, x, y, scale, color, len(text)))
+        self.cmds.extend([ord(ch) for ch in text])
+
+    def icon_2x(self, x, y, icon, scale, color):
+        self.cmds.extend((DRAW_ICON_2X, x, y, icon, scale, color))
+
+    def sprite_2x(self, x, y, id, brightness):
+        self.cmds.extend((DRAW_SPRITE_2X, x, y, id, brightness))
+
+    def draw(self, img):
+        draw_list(img, self.cmds)
+
+# Records the cairo calls of an overlay, so it can be drawn later along with the frame it belongs to.  The calls are
+# mirrored on a small private context to measure the area the overlay covers, which the frame it is drawn into has to
+# restore afterwards.
+class CairoRecording:
+    measure = None
+
+    def __init__(self):
+        self.calls = []
+        self.extents = (0, 0, 0, 0)
+        if CairoRecording.measure is None:
+            CairoRecording.measure = cairo.Context(cairo.ImageSurface(cairo.FORMAT_A8, 1, 1))
+        self.measure.new_path()
+
+    def __getattr__(self, name):
+        def record(*args):
+            self.calls.append((name, args))
+            self.mirror(name, args)
+        return record
+
+    def mirror(self, name, args):
+        measure = self.measure
+        if name == 'show_text':
+            x, y = measure.get_current_point()
+            x_bearing, y_bearing, width, height = measure.text_extents(args[0])[:4]
+            self.add_extents(x + x_bearing, y + y_bearing, x + x_bearing + width, y + y_bearing + height)
+        elif name == 'mask_surface':
+            surface, x, y = args
+            self.add_extents(x, y, x + surface.get_width(), y + surface.get_height())
+        elif name in ('stroke', 'fill'):
+            if name == 'stroke':
+                self.add_extents(*measure.stroke_extents())
+            else:
+                self.add_extents(*measure.fill_extents())
+            measure.new_path()
+        else:
+            getattr(measure, name)(*args)
+
+    def add_extents(self, x0, y0, x1, y1):
+        # Leave a pixel around the edges for antialiasing.
+        x0 = int(math.floor(x0)) - 1
+        y0 = int(math.floor(y0)) - 1
+        x1 = int(math.ceil(x1)) + 1
+        y1 = int(math.ceil(y1)) + 1
+        self.extents = union_rect(self.extents, (x0, y0, x1-x0, y1-y0))
+
+    def replay(self, ctx):
+        for name, args in self.calls:
+            getattr(ctx, name)(*args)
+
+# Everything needed to show one frame, captured right after the simulation step.  Frames are rasterized and shown
+# while the game goes on to simulate the next one, so they must not refer to any game state that changes.
+class Frame:
+    def __init__(self, cmds, stagecmds, stageversion, stagedepth, brightness, dirty_rects, overlay):
+        self.cmds = cmds
+        self.stagecmds = stagecmds
+        self.stageversion = stageversion
+        self.stagedepth = stagedepth
+        self.brightness = brightness
+        self.dirty_rects = dirty_rects
+        self.overlay = overlay
+
+        # When the oldest input first simulated for this frame arrived, or None.  See LatencyMeter.
+        self.inputtime = None
+
+# Keeps text rendered into alpha masks, keyed by (text, size), so strings that show up frame after frame are only
+# shaped and rendered once.  The colour is applied when a mask is drawn.
+class TextCache:
+    # Strings kept before the least recently used one is dropped.
+    MAX_STRINGS = 32
+
+    def __init__(self):
+        self.strings = {}
+        self.clock = 0
+
+    def render_string (self, text, size):
+        # The whole string is shown at once, so cairo takes care of kerning and multibyte characters.
+        ctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_A8, 1, 1))
+        ctx.set_font_size(size)
+        x_bearing, y_bearing, width, height = ctx.text_extents(text)[:4]
+        if width <= 0 or height <= 0:
+            return None
+
+        # Leave a pixel around the edges for antialiasing.
+        x0 = int(math.floor(x_bearing)) - 1
+        y0 = int(math.floor(y_bearing)) - 1
+        x1 = int(math.ceil(x_bearing + width)) + 1
+        y1 = int(math.ceil(y_bearing + height)) + 1
+        surface = cairo.ImageSurface(cairo.FORMAT_A8, x1-x0, y1-y0)
+        ctx = cairo.Context(surface)
+        ctx.set_font_size(size)
+        ctx.move_to(-x0, -y0)
+        ctx.show_text(text)
+        return surface
+
+    def get (self, text, size):
+        """Returns the mask of a string, or None if it has nothing to draw."""
+        # Translations come as UTF-8 byte strings.
+        if isinstance(text, str):
+            text = text.decode('utf-8', 'replace')
+
+        self.clock += 1
+        key = (text, size)
+        entry = self.strings.get(key)
+        if entry is None:
+            if len(self.strings) >= TextCache.MAX_STRINGS:
+                oldest = min(self.strings, key=lambda k: self.strings[k][1])
+                del self.strings[oldest]
+            entry = [self.render_string(text, size), self.clock]
+            self.strings[key] = entry
+        entry[1] = self.clock
+        return entry[0]
+
+text_cache = TextCache()
+
 def text_cairo (text, x, y, size, c):
+    mask = text_cache.get(text, size)
+    if mask is None:
+        return
+
+    if x == -1: x = screen_width/2
+    if y == -1: y = screen_height/2
+
     game.cairo.set_source_rgb(c, c, c)
+    game.cairo.mask_surface(mask, int(round(x - mask.get_width()/2.0)), int(round(y - mask.get_height()/2.0)))
 
-    game.cairo.set_font_size(size)
-    x_bearing, y_bearing, width, height = game.cairo.text_extents(text)[:4]
-    
+# Draws text with the built in font of pongc into the frame, centered on (x, y) like text_cairo.  Each font pixel is
+# scale 2x pixels.  The font only has ASCII characters, so this is meant for numbers and punctuation, while text that
+# may be translated goes through text_cairo.
+def text_hud (text, x, y, scale, c):
     if x == -1: x = screen_width/2
     if y == -1: y = screen_height/2
 
-    game.cairo.move_to(x - width/2 - x_bearing, y - height/2 - y_bearing)
-    game.cairo.show_text(text)
+    width = (len(text)*HUD_CELL_WIDTH - 1)*scale
+    height = HUD_GLYPH_HEIGHT*scale
+    game.drawlist.text_2x(x/2 - width/2, y/2 - height/2, text, scale, int(c*255.0))
 
 class Ball:
     def __init__(self):
         self.lastpos = Vector()
         self.lastvel = Vector()
         self.pos = Vector()
+        self.prevpos = None
         self.vel = Vector()
         self.size = 1
         self.speed = 1
@@ -136,14 +378,18 @@ class Ball:
         self.vel = Vector(to_fixed(2), to_fixed(2), self.speed)
 
     def draw_3d (self, stage):
+        pos = interpolate(self)
+
         # Draw the ball.
-        fill_circle_3d(game.drawimage, self.pos.x, self.pos.y, self.pos.z, self.size, game.brightness/100.0)
+        game.drawlist.fill_circle_3d(pos.x, pos.y, pos.z, self.size, game.brightness/100.0)
 
         # Draw the shadows.
-        draw_ellipse_3d(game.drawimage, self.pos.x, stage.window.bottom, self.pos.z, self.size*2, self.size, game.brightness/2/100.0)
-        draw_ellipse_3d(game.drawimage, self.pos.x, stage.window.top, self.pos.z, self.size*2, self.size, game.brightness/2/100.0)
-        draw_ellipse_3d(game.drawimage, stage.window.left, self.pos.y, self.pos.z, self.size, self.size*2, game.brightness/2/100.0)
-        draw_ellipse_3d(game.drawimage, stage.window.right, self.pos.y, self.pos.z, self.size, self.size*2, game.brightness/2/100.0)
+        if not game.quality['shadows']:
+            return
+        game.drawlist.ellipse_3d(pos.x, stage.window.bottom, pos.z, self.size*2, self.size, game.brightness/2/100.0)
+        game.drawlist.ellipse_3d(pos.x, stage.window.top, pos.z, self.size*2, self.size, game.brightness/2/100.0)
+        game.drawlist.ellipse_3d(stage.window.left, pos.y, pos.z, self.size, self.size*2, game.brightness/2/100.0)
+        game.drawlist.ellipse_3d(stage.window.right, pos.y, pos.z, self.size, self.size*2, game.brightness/2/100.0)
 
     # 0 if nobody scored, 1 if Paddle1 scored, 2 if Paddle2 scored.
     def update (self, paddle1, paddle2, stage):
@@ -339,8 +585,9 @@ class Ball:
 
 class Paddle:
     def __init__(self):
-        # Center of the paddle
+        # Center of the paddle, and where it was before the last game step.
         self.pos = Vector()
+        self.prevpos = None
         
         # Physics stuff
         self.delta = Vector() # Amount moved since last update for spin calc.
@@ -361,17 +608,18 @@ class Paddle:
 
     def draw_3d (self, stage):
         v = game.brightness/100.0
+        pos = interpolate(self)
 
         r = Rect()
-        r.left = self.pos.x - self.halfwidth 
-        r.right = self.pos.x + self.halfwidth    
-        r.top = self.pos.y - self.halfheight 
-        r.bottom = self.pos.y + self.halfheight  
+        r.left = pos.x - self.halfwidth 
+        r.right = pos.x + self.halfwidth    
+        r.top = pos.y - self.halfheight 
+        r.bottom = pos.y + self.halfheight  
         
-        draw_rect_3d( game.drawimage, r.left, r.top, r.right, r.bottom, self.pos.z, v )
+        game.drawlist.rect_3d( r.left, r.top, r.right, r.bottom, pos.z, v )
     
         x = r.left + ( ( r.right - r.left ) / 2 )
-        draw_line_3d( game.drawimage, x, r.bottom, self.pos.z, x, stage.window.bottom, self.pos.z, v )
+        game.drawlist.line_3d( x, r.bottom, pos.z, x, stage.window.bottom, pos.z, v )
 
     def clip_position (self):
         self.pos.x = max(self.pos.x, self.halfwidth)
@@ -515,47 +763,48 @@ class Stage:
         self.window.top = 0
         self.window.bottom = to_fixed(99)
 
-    def draw_3d (self):
+    def draw_3d (self, drawlist):
         window = self.window
 
         # Wall grids.
         v = game.brightness/4/100.0
+        grid = game.quality['grid']
         
         i = 1
-        while i < 5:
-            x = i*(window.right-window.left)/5
+        while i < grid:
+            x = i*(window.right-window.left)/grid
             i += 1
-            draw_line_3d(game.drawimage, x, window.top, 1, x, window.top, self.depth, v)
-            draw_line_3d(game.drawimage, x, window.bottom, 1, x, window.bottom, self.depth, v)
+            drawlist.line_3d(x, window.top, 1, x, window.top, self.depth, v)
+            drawlist.line_3d(x, window.bottom, 1, x, window.bottom, self.depth, v)
         
         i = 1
-        while i < 5:
-            x = i*(window.bottom-window.top)/5
+        while i < grid:
+            x = i*(window.bottom-window.top)/grid
             i += 1
-            draw_line_3d(game.drawimage, window.left, x, 1, window.left, x, self.depth, v)
-            draw_line_3d(game.drawimage, window.right, x, 1, window.right, x, self.depth, v)
+            drawlist.line_3d(window.left, x, 1, window.left, x, self.depth, v)
+            drawlist.line_3d(window.right, x, 1, window.right, x, self.depth, v)
             
         i = 1
-        while i < 5:
-            x = i*(self.depth)/5
+        while i < grid:
+            x = i*(self.depth)/grid
             i += 1
-            draw_line_3d(game.drawimage, window.left, window.top, x, window.right, window.top, x, v)
-            draw_line_3d(game.drawimage, window.left, window.bottom, x, window.right, window.bottom, x, v)
-            draw_line_3d(game.drawimage, window.left, window.top, x, window.left, window.bottom, x, v)
-            draw_line_3d(game.drawimage, window.right, window.top, x, window.right, window.bottom, x, v)
+            drawlist.line_3d(window.left, window.top, x, window.right, window.top, x, v)
+            drawlist.line_3d(window.left, window.bottom, x, window.right, window.bottom, x, v)
+            drawlist.line_3d(window.left, window.top, x, window.left, window.bottom, x, v)
+            drawlist.line_3d(window.right, window.top, x, window.right, window.bottom, x, v)
 
         # The actual stage.
         v = game.brightness/100.0
     
         # Near and far rectangles   
-        draw_rect_3d( game.drawimage, window.left, window.top, window.right, window.bottom, 0, v )
-        draw_rect_3d( game.drawimage, window.left, window.top, window.right, window.bottom, self.depth, v )
+        drawlist.rect_3d( window.left, window.top, window.right, window.bottom, 0, v )
+        drawlist.rect_3d( window.left, window.top, window.right, window.bottom, self.depth, v )
     
         # Diagonals
-        draw_line_3d( game.drawimage, window.left, window.top, 1, window.left, window.top, self.depth, v )
-        draw_line_3d( game.drawimage, window.left, window.bottom, 1, window.left, window.bottom, self.depth, v )
-        draw_line_3d( game.drawimage, window.right, window.top, 1, window.right, window.top, self.depth, v )
-        draw_line_3d( game.drawimage, window.right, window.bottom, 1, window.right, window.bottom, self.depth, v )
+        drawlist.line_3d( window.left, window.top, 1, window.left, window.top, self.depth, v )
+        drawlist.line_3d( window.left, window.bottom, 1, window.left, window.bottom, self.depth, v )
+        drawlist.line_3d( window.right, window.top, 1, window.right, window.top, self.depth, v )
+        drawlist.line_3d( window.right, window.bottom, 1, window.right, window.bottom, self.depth, v )
 
 class AI:
     def __init__(self):
@@ -579,8 +828,6 @@ class IntroSequence:
             game.draw_3d()
 
     def draw_cairo (self):
-        if (self.timer1 == 1):
-            game.draw_cairo()
         text_cairo(_("b o u n c e"), -1, -1, 100, self.timer0/100.0)
 
     def update (self):
@@ -613,7 +860,6 @@ class NewStageSequence:
         game.draw_3d()
 
     def draw_cairo (self):
-        game.draw_cairo()
         text_cairo(game.stage_descs[self.nextlevel]['Name'], -1, -1, 100, (100-game.brightness)/100.0)
 
     def update (self):
@@ -646,10 +892,11 @@ class BallReleaseSequence:
 
     def draw_3d (self):
         game.draw_3d()
+        c = max(math.sin(math.pi*self.timer0/35), 0.0)
+        game.drawlist.sprite_2x(screen_width/4, screen_height/4, SPRITE_DIGIT_0 + 3-self.timer1, int(c*255.0))
 
     def draw_cairo (self):
-        game.draw_cairo()
-        text_cairo(str(3-self.timer1), -1, -1, 20, math.sin(math.pi*self.timer0/35))
+        pass
 
     def update (self):
         if (game.brightness < 100): game.brightness += 1
@@ -661,6 +908,9 @@ class BallReleaseSequence:
             game.set_sequence(PlaySequence())
 
 class PlaySequence:
+    # Only the moving objects change from frame to frame, so only their areas need to be redrawn.
+    dirty_rects = True
+
     def enter (self):
         self.timer0 = 0
         self.timer1 = 0
@@ -674,7 +924,7 @@ class PlaySequence:
         game.draw_3d()
 
     def draw_cairo (self):
-        game.draw_cairo()
+        pass
 
     def update (self):
         # Process player input and AI.
@@ -690,6 +940,8 @@ class PlaySequence:
             game.set_sequence(ScoreSequence())
 
 class ScoreSequence:
+    dirty_rects = True
+
     def enter (self):
         self.step = 0
         self.num_steps = 20
@@ -702,20 +954,20 @@ class ScoreSequence:
     def draw_3d (self):
         ring_spacing = to_fixed(1)
         ring_speed = to_fixed(1)
-        num_rings = 10
+        num_rings = game.quality['rings']
 
         v = (1.0-float(self.step)/self.num_steps)
 
-        fill_circle_3d(game.drawimage, game.ball.lastpos.x+game.ball.lastvel.x*self.step/2, game.ball.lastpos.y+game.ball.lastvel.y*self.step/2, game.ball.lastpos.z+game.ball.lastvel.z*self.step/2, game.ball.size, v)
+        game.drawlist.fill_circle_3d(game.ball.lastpos.x+game.ball.lastvel.x*self.step/2, game.ball.lastpos.y+game.ball.lastvel.y*self.step/2, game.ball.lastpos.z+game.ball.lastvel.z*self.step/2, game.ball.size, v)
         random.seed(12345678)
         for ring in range(0, num_rings):
             b = (1.0-float(self.step)/self.num_steps)*(0.5+0.5*math.cos(math.pi*float(ring)/num_rings))
-            draw_circle_3d(game.drawimage, game.ball.lastpos.x+game.ball.lastvel.x*ring, game.ball.lastpos.y+game.ball.lastvel.y*ring, game.ball.lastpos.z+game.ball.lastvel.z*ring, (-ring+1)*ring_spacing + ring_speed*self.step, b)
+            game.drawlist.circle_3d(game.ball.lastpos.x+game.ball.lastvel.x*ring, game.ball.lastpos.y+game.ball.lastvel.y*ring, game.ball.lastpos.z+game.ball.lastvel.z*ring, (-ring+1)*ring_spacing + ring_speed*self.step, b)
 
         game.draw_3d()
 
     def draw_cairo (self):
-        game.draw_cairo()
+        pass
 
     def update (self):
         self.step += 1
@@ -723,6 +975,7 @@ class ScoreSequence:
             # Record the scores.
             game.stage_descs[game.curlevel]['Paddle1Score'] = game.paddle1.score
             game.stage_descs[game.curlevel]['Paddle2Score'] = game.paddle2.score
+            game.scores.stage_result(game.curlevel, game.stage.name, game.paddle1.score, game.paddle2.score)
             # Win, Lose or Keep Playing.
             if game.paddle1.score == 5:
                 if (game.curlevel == len(game.stage_descs)-1):
@@ -746,7 +999,6 @@ class LoseSequence:
         game.draw_3d()
 
     def draw_cairo (self):
-        game.draw_cairo()
         text_cairo("; - {", -1, -1, 24, self.timer0/100.0)
 
     def update (self):
@@ -766,14 +1018,9 @@ class LoseSequence:
 class WinSequence:
     def enter (self):
         # Create a new score history entry.
-        paddle1_score = 0
-        paddle2_score = 0
-        for i in range(0, len(game.stage_descs)):
-            paddle1_score += game.stage_descs[i].get('Paddle1Score', 0)
-            paddle2_score += game.stage_descs[i].get('Paddle2Score', 0)
-
-        game.scores.append({'Player1Name':game.player1.props.nick, 'Player1Score':paddle1_score,
-                            'Player2Name':game.player2.props.nick, 'Player2Score':paddle2_score})
+        score = game.scores.finish_game(game.player1.props.nick, game.player2.props.nick)
+        if game.scorepanel:
+            game.scorepanel.append(score)
 
         self.timer0 = 0
         self.timer1 = 0
@@ -803,9 +1050,8 @@ class WinSequence:
     def draw_3d (self):
         game.draw_3d()
 
-    def draw_cairo (self):
-        game.draw_cairo()
-
+        # The score table is drawn natively, along with the rest of the frame.  Stage names may be in any language,
+        # which the built in font can't show, so they are left to draw_cairo.
         starty = 250
         total_score = 0
         for i in range(0, len(game.stage_descs)):
@@ -815,32 +1061,25 @@ class WinSequence:
             ai_score = game.stage_descs[i].get('Paddle2Score', 0)
             diff_score = player_score - ai_score
 
-            game.draw_score_cairo(250, starty + i*50, player_score, 1, v)
-            text_cairo('-', 475, starty + i*50, 20, v)
-            game.draw_score_cairo(550, starty + i*50, ai_score, 2, v)
-            text_cairo('=', 775, starty + i*50, 20, v)
-            game.draw_score_cairo(850, starty + i*50, diff_score, 1, v)
-
-            text_cairo(game.stage_descs[i]['Name'], 125, starty + i*50, 24, v)
+            game.draw_score_3d(250, starty + i*50, player_score, 1, v)
+            text_hud('-', 475, starty + i*50, 1, v)
+            game.draw_score_3d(550, starty + i*50, ai_score, 2, v)
+            text_hud('=', 775, starty + i*50, 1, v)
+            game.draw_score_3d(850, starty + i*50, diff_score, 1, v)
 
             total_score += diff_score
     
-        v = self.timer0/60.0
-        game.cairo.set_source_rgb(v, v, v)
-        game.cairo.move_to(250, starty + len(game.stage_descs)*50)
-        game.cairo.line_to(950, starty + len(game.stage_descs)*50)
-        game.cairo.stroke()
+        v = min(self.timer0/60.0, 1.0)
+        y = starty + len(game.stage_descs)*50
+        game.drawlist.line_2x(125, y/2, 475, y/2, int(v*255.0))
         x = 250
         y = starty + (len(game.stage_descs)+1)*50
         for j in range(0, 5*len(game.stage_descs)):
-            game.cairo.move_to(game.xpoints[0][0]*20-10+x, game.xpoints[0][1]*20-10+y)
-            for p in game.xpoints:
-                game.cairo.line_to(p[0]*20-10+x, p[1]*20-10+y)
-            game.cairo.line_to(game.xpoints[0][0]*20-10+x, game.xpoints[0][1]*20-10+y)
             if j >= total_score:
-                game.cairo.stroke()
+                sprite = SPRITE_X_OUTLINE
             else:
-                game.cairo.fill()
+                sprite = SPRITE_X
+            game.drawlist.sprite_2x(x/2, y/2, sprite, int(v*255.0))
             x += 30
             if (x > 980):
                 x = 250
@@ -855,9 +1094,17 @@ class WinSequence:
             text = "; - )"
         elif (total_score >= 2*len(game.stage_descs)):
             text = "; - }"
-        text_cairo(text, -1, 150, 24, v)
+        text_hud(text, -1, 150, 2, v)
+
+    def draw_cairo (self):
+        starty = 250
+        for i in range(0, len(game.stage_descs)):
+            v = clamp(255*self.timer0/60.0 - i*60, 0, 255)/255.0
+            text_cairo(game.stage_descs[i]['Name'], 125, starty + i*50, 24, v)
 
 class EditSequence:
+    dirty_rects = True
+
     def enter (self):
         game.brightness = 100
 
@@ -868,12 +1115,14 @@ class EditSequence:
         game.draw_3d()
 
     def draw_cairo (self):
-        game.draw_cairo()
+        pass
 
     def update (self):
         pass
 
 class TestSequence:
+    dirty_rects = True
+
     def enter (self):
         game.brightness = 100
 
@@ -894,6 +1143,251 @@ class TestSequence:
         # Run the ball simulation.
         game.ball.update(game.paddle1, game.paddle2, game.stage)
 
+# History of finished games.  The entries are the dicts saved in the journal; next to them the store keeps indexes
+# that are updated as results arrive, so the summaries don't have to scan the history:
+#  - every player's game scores, sorted, for top(),
+#  - the best score difference reached on every stage, for stage_best(),
+#  - every player's games, wins, losses and points, for record().
+# The stage results of the game in progress are kept as running totals, and become an entry in finish_game.
+# Histories read from the journal are kept as text by load_rows and only parsed when they are first used.
+class ScoreStore:
+    def __init__ (self):
+        self.load([])
+
+    def load (self, entries):
+        self.entries = []
+        self.unparsed = None
+        self.player_scores = {}
+        self.stage_bests = {}
+        self.records = {}
+        self.start_game()
+        for s in entries:
+            self.add(s)
+
+    def load_rows (self, text):
+        self.load([])
+        self.unparsed = text
+
+    def parse (self):
+        if self.unparsed is not None:
+            text = self.unparsed
+            self.unparsed = None
+            for line in text.splitlines():
+                if line.strip():
+                    self.add(self.row_entry(json.loads(line)))
+
+    def rows (self):
+        """Returns the journal lines of the history, without parsing it if it hasn't been yet."""
+        if self.unparsed is not None:
+            return [line for line in self.unparsed.splitlines() if line.strip()]
+        return [json.dumps(self.entry_row(s), separators=(',', ':')) for s in self.entries]
+
+    def entry_row (self, s):
+        return [s['Player1Name'], s['Player1Score'], s['Player2Name'], s['Player2Score'], s.get('Stages', [])]
+
+    def row_entry (self, row):
+        s = {'Player1Name':row[0], 'Player1Score':row[1], 'Player2Name':row[2], 'Player2Score':row[3]}
+        if row[4]:
+            s['Stages'] = row[4]
+        return s
+
+    def clear (self):
+        self.load([])
+
+    def __len__ (self):
+        self.parse()
+        return len(self.entries)
+
+    def __iter__ (self):
+        self.parse()
+        return iter(self.entries)
+
+    def start_game (self):
+        self.stage_scores = {}
+        self.total1 = 0
+        self.total2 = 0
+
+    def stage_result (self, level, name, score1, score2):
+        old1, old2 = self.stage_scores.get(level, (None, 0, 0))[1:]
+        self.stage_scores[level] = (name, score1, score2)
+        self.total1 += score1 - old1
+        self.total2 += score2 - old2
+
+    def finish_game (self, player1, player2):
+        stages = [self.stage_scores[level] for level in sorted(self.stage_scores)]
+        s = {'Player1Name':player1, 'Player1Score':self.total1, 'Player2Name':player2, 'Player2Score':self.total2,
+             'Stages':[list(stage) for stage in stages]}
+        self.add(s)
+        self.start_game()
+        return s
+
+    def add (self, s):
+        self.parse()
+        self.entries.append(s)
+
+        player1, score1 = s['Player1Name'], int(s['Player1Score'])
+        player2, score2 = s['Player2Name'], int(s['Player2Score'])
+        bisect.insort(self.player_scores.setdefault(player1, []), score1)
+        bisect.insort(self.player_scores.setdefault(player2, []), score2)
+        self.count_result(player1, score1, score2)
+        self.count_result(player2, score2, score1)
+
+        # Entries from older journals only have the totals.
+        for name, stage1, stage2 in s.get('Stages', []):
+            best = self.stage_bests.get(name)
+            if best is None or stage1 - stage2 > best[0]:
+                self.stage_bests[name] = (stage1 - stage2, player1)
+
+    def count_result (self, player, score, other):
+        # games, wins, losses, points
+        r = self.records.setdefault(player, [0, 0, 0, 0])
+        r[0] += 1
+        if score > other:
+            r[1] += 1
+        elif score < other:
+            r[2] += 1
+        r[3] += score
+
+    def top (self, player, n):
+        """Returns the n best game scores of the player, best first."""
+        self.parse()
+        scores = self.player_scores.get(player, [])
+        return scores[:-n-1:-1]
+
+    def stage_best (self, name):
+        """Returns (score difference, player) of the best result on the named stage, or None."""
+        self.parse()
+        return self.stage_bests.get(name)
+
+    def record (self, player):
+        """Returns (games, wins, losses, points) of the player."""
+        self.parse()
+        return tuple(self.records.get(player, (0, 0, 0, 0)))
+
+# Rolling timings of the phases of a frame, to find out which one takes the frame budget on a given machine.  Every
+# phase keeps a histogram of its last WINDOW timings.  With BOUNCE_TIMERS set, the averages are shown on screen and
+# the histograms are written to the activity's instance directory every DUMP_INTERVAL seconds.
+class FrameTimers:
+    # step: simulation steps, draw_3d: building the draw list, cairo: recording the overlay, submit: waiting for the
+    # renderer to take the frame, rasterize: drawing it on the worker thread, blit: showing it on expose.
+    PHASES = ['step', 'draw_3d', 'cairo', 'submit', 'rasterize', 'blit']
+
+    # Upper bounds of the histogram buckets in milliseconds.  The last bucket takes everything slower.
+    BUCKETS = [0.5, 1, 2, 4, 8, 16, 33, 66]
+
+    # Timings kept per phase.
+    WINDOW = 300
+
+    # Seconds between dumps.
+    DUMP_INTERVAL = 60
+
+    def __init__ (self):
+        self.enabled = bool(os.environ.get('BOUNCE_TIMERS'))
+        self.samples = {}
+        self.counts = {}
+        self.totals = {}
+        for phase in FrameTimers.PHASES:
+            self.samples[phase] = collections.deque()
+            self.counts[phase] = [0]*(len(FrameTimers.BUCKETS)+1)
+            self.totals[phase] = 0.0
+        self.lastdump = time.time()
+
+    def add (self, phase, seconds):
+        """Records that phase took seconds.  Every phase must only be timed from one thread."""
+        bucket = bisect.bisect_left(FrameTimers.BUCKETS, seconds*1000)
+        samples = self.samples[phase]
+        samples.append((seconds, bucket))
+        self.counts[phase][bucket] += 1
+        self.totals[phase] += seconds
+        if len(samples) > FrameTimers.WINDOW:
+            seconds, bucket = samples.popleft()
+            self.counts[phase][bucket] -= 1
+            self.totals[phase] -= seconds
+
+    def mean (self, phase):
+        n = len(self.samples[phase])
+        if not n:
+            return 0.0
+        return self.totals[phase] / n
+
+    def draw_3d (self):
+        if not self.enabled:
+            return
+        y = 12 + HUD_CELL_HEIGHT
+        for phase in FrameTimers.PHASES:
+            game.drawlist.text_2x(5, y, "%-9s %6.2f ms" % (phase, self.mean(phase)*1000), 1, 255)
+            y += HUD_CELL_HEIGHT
+
+    def dump (self, path):
+        """Writes the average and the histogram of every phase to path."""
+        lines = ['%-9s %8s  ' % ('phase', 'mean ms') + ' '.join(['<%-5s' % b for b in FrameTimers.BUCKETS] + ['more'])]
+        for phase in FrameTimers.PHASES:
+            counts = list(self.counts[phase])
+            lines.append('%-9s %8.2f  ' % (phase, self.mean(phase)*1000) + ' '.join(['%6d' % c for c in counts]))
+        fd = open(path, 'w')
+        try:
+            fd.write('\n'.join(lines) + '\n')
+        finally:
+            fd.close()
+
+    def dump_due (self, path):
+        """Dumps to path if enabled and DUMP_INTERVAL has passed since the last dump."""
+        if not self.enabled or time.time() - self.lastdump < FrameTimers.DUMP_INTERVAL:
+            return
+        self.lastdump = time.time()
+        try:
+            self.dump(path)
+        except IOError:
+            log.exception('failed to write frame timers')
+
+timers = FrameTimers()
+
+# Profiles every sequence class separately with cProfile, so the play loop can be looked at without the menus and the
+# editor.  The stats of a class add up over all the times it runs, and are written to <class name>.prof in the
+# activity's instance directory whenever one of its sequences is left.  BOUNCE_PROFILE=1 turns profiling on from the
+# start, and with BOUNCE_PROFILE set at all the game toolbar gets a toggle for it.
+class SequenceProfiler:
+    def __init__ (self):
+        self.available = 'BOUNCE_PROFILE' in os.environ
+        self.enabled = False
+        self.profiles = {}
+        self.current = None
+
+    def set_enabled (self, enabled, seq):
+        """Starts or stops profiling, while seq is the current sequence."""
+        if enabled == self.enabled:
+            return
+        if enabled:
+            self.enabled = True
+            self.enter(seq)
+        else:
+            self.leave(seq)
+            self.enabled = False
+
+    def enter (self, seq):
+        if not self.enabled:
+            return
+        name = seq.__class__.__name__
+        if name not in self.profiles:
+            self.profiles[name] = cProfile.Profile()
+        self.current = self.profiles[name]
+        self.current.enable()
+
+    def leave (self, seq):
+        if self.current is None:
+            return
+        self.current.disable()
+        self.current = None
+
+        name = seq.__class__.__name__
+        path = os.path.join(activity.get_activity_root(), 'instance', name + '.prof')
+        try:
+            self.profiles[name].dump_stats(path)
+        except IOError:
+            log.exception('failed to write the profile of %s' % name)
+
+profiler = SequenceProfiler()
+
 class Game:
     def __init__(self):
         self.endtimeout = 0
@@ -908,11 +1402,21 @@ class Game:
         # Current stage.
         self.curlevel = 0
 
+        # Visual quality tier, see QUALITY_TIERS.
+        self.qualitytier = DEFAULT_QUALITY
+        self.quality = QUALITY_TIERS[DEFAULT_QUALITY]
+
+        # Measured frame rate, shown when the quality tier has overlays.
+        self.fps = 0.0
+
         # Variables affecting the sequencer.
         self.sequence = IntroSequence()
         self.sequence.enter()
         self.brightness = 100
 
+        # How far the frame being drawn is from the state before the last step to the current one, see interpolate.
+        self.alpha = 1.0
+
         # Current mouse state.
         self.mousex = 0
         self.mousey = 0
@@ -921,11 +1425,19 @@ class Game:
         # Default stages.
         self.stage_descs = DEFAULT_STAGE_DESCS 
 
-        # Scores.
-        self.scores = []
+        # Scores, and the panel listing them when the activity shows one.
+        self.scores = ScoreStore()
+        self.scorepanel = None
+
+        # Drawing commands for the current frame, and for the cached static stage background.
+        self.drawlist = DrawList()
+        self.stagelist = DrawList()
 
-        # The 'X' shape used as an icon.
-        self.xpoints = [ (0,0), (0.3,0), (0.5,0.3), (0.7,0), (1,0), (0.7,0.5), (1,1), (0.7,1), (0.5,0.6), (0.3,1), (0,1), (0.3,0.5) ]
+        # Incremented whenever the stage changes.  The background cache is checked against it when frames are
+        # rasterized, since that may happen on another thread.
+        self.stageversion = 0
+        self.stagekey = None
+        self.bgversion = None
 
         # Create sounds.
         self.scoresnd = pygame.mixer.Sound(activity.get_bundle_path()+'/sound/score.wav')
@@ -936,7 +1448,9 @@ class Game:
 
     def set_sequence (self, seq):
         self.sequence.leave()
+        profiler.leave(self.sequence)
         self.sequence = seq
+        profiler.enter(self.sequence)
         self.sequence.enter()
 
     def set_level(self, level):
@@ -947,48 +1461,67 @@ class Game:
         desc = self.stage_descs[self.curlevel]
 
         self.stage.setup(desc)
+        self.stageversion += 1
         self.ball.setup(desc)
         self.ai.setup(desc)
 
         self.paddle1.setup_player(desc)
         self.paddle2.setup_ai(desc)
 
+        # The objects start the level where they are, rather than being interpolated from where they were.
+        for obj in (self.ball, self.paddle1, self.paddle2):
+            obj.prevpos = None
+
+    def step(self):
+        """Advances the game by one step, remembering where the moving objects were for interpolate."""
+        for obj in (self.ball, self.paddle1, self.paddle2):
+            obj.prevpos = Vector(obj.pos.x, obj.pos.y, obj.pos.z)
+        self.sequence.update()
+
     def new_game(self):
+        self.scores.start_game()
         self.set_level(0)
 
+    def set_quality(self, tier):
+        tier = clamp(tier, 0, len(QUALITY_TIERS)-1)
+        quality = QUALITY_TIERS[tier]
+        if quality['grid'] != self.quality['grid']:
+            # The stage background has to be drawn again.
+            self.stageversion += 1
+        self.qualitytier = tier
+        self.quality = quality
+
     def draw_score_3d(self, x, y, score, player, v):
         for j in range(0, 5):
             px = x + j*30
             py = y
             if j < score:
-                fill_ellipse_2x(game.drawimage, px/2, py/2, 6, 6, int(v*255.0))
+                game.drawlist.sprite_2x(px/2, py/2, SPRITE_PIP, int(v*255.0))
             else:
-                draw_ellipse_2x(game.drawimage, px/2, py/2, 6, 6, int(v*255.0))
-
-    def draw_score_cairo(self, x, y, score, player, c):
-        game.cairo.set_source_rgb(c,c,c)
-        for j in range(0, 5):
-            px = x + j*30
-            py = y
-
-            #if player == 1:
-            #    game.cairo.move_to(game.xpoints[0][0]*20-10+px, game.xpoints[0][1]*20-10+py)
-            #    for p in game.xpoints:
-            #        game.cairo.line_to(p[0]*20-10+px, p[1]*20-10+py)
-            #    game.cairo.line_to(game.xpoints[0][0]*20-10+px, game.xpoints[0][1]*20-10+py)
-            #elif player == 2:
-            
-            game.cairo.move_to(px + 10, py)
-            game.cairo.arc(px, py, 10, 0, 2*math.pi)
-
-            if j < score:
-                game.cairo.fill()
-            else:
-                game.cairo.stroke()
-
+                game.drawlist.sprite_2x(px/2, py/2, SPRITE_PIP_OUTLINE, int(v*255.0))
+
+    def stage_cmds(self):
+        # The stage only changes with the level and the brightness, so its draw list is only rebuilt then.
+        key = (self.stageversion, self.brightness)
+        if self.stagekey != key:
+            self.stagelist = DrawList()
+            self.stage.draw_3d(self.stagelist)
+            self.stagekey = key
+        return self.stagelist.cmds
+
+    def draw_background(self, img, frame):
+        # The stage is rasterized once into a cached background that each frame starts from.
+        if frame.stageversion != self.bgversion:
+            invalidate_background()
+            # Projection is fastest within the depth covered by its tables.  Score rings reach a little further.
+            set_projection_depth(frame.stagedepth + to_fixed(20))
+            self.bgversion = frame.stageversion
+        if not restore_background(img, frame.brightness):
+            clear_image(img)
+            draw_list(img, frame.stagecmds)
+            store_background(img, frame.brightness)
 
     def draw_3d(self):
-        self.stage.draw_3d()
         self.paddle1.draw_3d(self.stage)
         self.paddle2.draw_3d(self.stage)
         self.ball.draw_3d(self.stage)
@@ -997,11 +1530,51 @@ class Game:
         self.draw_score_3d(screen_width*1/4-75, 30, self.paddle1.score, 1, v)
         self.draw_score_3d(screen_width*3/4-75, 30, self.paddle2.score, 2, v)
 
-    def draw_cairo (self):
-        #game.cairo.set_source_rgb(color[0]/255.0, color[1]/255.0, color[2]/255.0)
-        #text_cairo(game.stage_descs[game.curlevel]['Name'], -1, 30, 24, v)
-
-        text_cairo("%.2f fps" % self.fps, 50, 30, 12, 1.0)
+        if self.quality['overlays']:
+            self.drawlist.text_2x(5, 12, "%.2f fps" % self.fps, 1, 255)
+        timers.draw_3d()
+
+    def snapshot(self, overlay=True):
+        """Captures the current sequence as a Frame.  The cairo overlay is recorded too, unless overlay is False."""
+        # The sequence only builds the draw list, which is rasterized later in a single call.
+        t0 = time.time()
+        self.drawlist.reset()
+        self.sequence.draw_3d()
+        timers.add('draw_3d', time.time() - t0)
+
+        recording = None
+        if overlay:
+            t0 = time.time()
+            self.cairo = recording = CairoRecording()
+            self.sequence.draw_cairo()
+            self.cairo = None
+            timers.add('cairo', time.time() - t0)
+
+            # Text drawn with the built in font is already part of the draw list, so most frames have no overlay.
+            if not recording.calls:
+                recording = None
+
+        return Frame(self.drawlist.cmds[:], self.stage_cmds(), self.stageversion, self.stage.depth, self.brightness,
+                     getattr(self.sequence, 'dirty_rects', False), recording)
+
+    def rasterize(self, img, frame, lastdirty):
+        """Rasterizes frame into img.  lastdirty is the area of the moving objects last drawn into img, or None.
+        Returns whether the whole image was redrawn, and the area of the moving objects."""
+        # If only moving objects changed, erase the old ones by restoring the background underneath them.
+        # Otherwise the frame starts from the whole cached stage background.
+        full = lastdirty is None or not frame.dirty_rects or frame.stageversion != self.bgversion
+        if not full:
+            full = not restore_background_rect(img, frame.brightness, *lastdirty)
+        if full:
+            self.draw_background(img, frame)
+
+        begin_dirty()
+        draw_list(img, frame.cmds)
+        return full, get_dirty_rect()
+
+    def render_3d(self, img, lastdirty):
+        """Renders the current sequence into img, like rasterize."""
+        return self.rasterize(img, self.snapshot(False), lastdirty)
 
 # Global game instance.
 game = Game()
@@ -1206,6 +1779,9 @@ class EditorPanel(gtk.EventBox):
         self.propbox.show_all()
 
 # Panel that appears over the game, showing a list of scores.  Can be toggled on and off without pausing the game.
+# Lists the history of games.  The rows live in a ListStore shown by a TreeView, which only renders the visible
+# rows, so long histories stay cheap.  Finished games are appended as they happen; when game.scores is replaced the
+# panel is marked stale, and only rebuilt once it is shown, so the history isn't parsed before it is needed.
 class ScorePanel(gtk.VBox):
     def __init__ (self):
         gtk.VBox.__init__(self)
@@ -1217,58 +1793,62 @@ class ScorePanel(gtk.VBox):
         lbl.set_markup("<span size='x-large'><b>"+_('History of Games')+"</b></span>")
         headerbox.pack_start(lbl, False)
         headerbox.pack_start(gtk.HSeparator(), False)
-        hbox = gtk.HBox()
-        hbox.set_homogeneous(True)
-        lbl = gtk.Label()
-        lbl.set_markup('<b>'+_('Player 1')+'</b>')
-        hbox.pack_start(lbl)
-        lbl = gtk.Label()
-        lbl.set_markup('<b>'+_('Score')+'</b>')
-        hbox.pack_start(lbl)
-        lbl = gtk.Label()
-        lbl.set_markup('<b>'+_('Player 2')+'</b>')
-        hbox.pack_end(lbl)
-        lbl = gtk.Label()
-        lbl.set_markup('<b>'+_('Score')+'</b>')
-        hbox.pack_end(lbl)
-        headerbox.pack_start(hbox, False)
-        headerbox.pack_start(gtk.HSeparator(), False)
 
-        # Score box.
-        self.scorebox = gtk.VBox()
-        self.scorebox.set_spacing(10)
+        # Score list.
+        self.store = gtk.ListStore(str, str, str, str)
+        self.treeview = gtk.TreeView(self.store)
+        self.treeview.set_headers_clickable(False)
+        self.treeview.set_enable_search(False)
+        self.treeview.get_selection().set_mode(gtk.SELECTION_NONE)
+        for i, title in enumerate([_('Player 1'), _('Score'), _('Score'), _('Player 2')]):
+            cell = gtk.CellRendererText()
+            cell.set_property('xalign', 0.5)
+            column = gtk.TreeViewColumn(title, cell, text=i)
+            column.set_alignment(0.5)
+            column.set_expand(True)
+            self.treeview.append_column(column)
+
+        self.scroll = gtk.ScrolledWindow()
+        self.scroll.set_policy(gtk.POLICY_NEVER, gtk.POLICY_AUTOMATIC)
+        self.scroll.add(self.treeview)
 
         vbox = gtk.VBox()
         vbox.set_border_width(20)
         vbox.set_spacing(10)
         vbox.pack_start(headerbox, False)
-        vbox.pack_start(self.scorebox, False)
-        vbox.pack_start(gtk.HSeparator(), False)
-
-        self.scroll = gtk.ScrolledWindow()
-        self.scroll.set_policy(gtk.POLICY_NEVER, gtk.POLICY_AUTOMATIC)
-        self.scroll.add_with_viewport(vbox)
+        vbox.pack_start(self.scroll, True, True)
 
         frame = gtk.Frame()
         frame.set_shadow_type(gtk.SHADOW_OUT)
-        frame.add(self.scroll)
+        frame.add(vbox)
         self.add(frame)
 
         self.rebuild()
         self.show_all()
 
-    def rebuild (self):
-        for w in self.scorebox.get_children():
-            w.destroy()
+    def invalidate (self):
+        self.stale = True
+
+    def refresh (self):
+        if self.stale:
+            self.rebuild()
+        return False
 
+    def rebuild (self):
+        self.stale = False
+        # Detach the model while refilling it, so the view isn't updated once per row.
+        self.treeview.set_model(None)
+        self.store.clear()
         for s in game.scores:
-            hbox = gtk.HBox()
-            hbox.set_homogeneous(True)
-            hbox.pack_start(gtk.Label(s['Player1Name']))
-            hbox.pack_start(gtk.Label(s['Player1Score']))
-            hbox.pack_end(gtk.Label(s['Player2Name']))
-            hbox.pack_end(gtk.Label(s['Player2Score']))
-            self.scorebox.pack_start(hbox, False)
+            self.store.append(self.score_row(s))
+        self.treeview.set_model(self.store)
+
+    def append (self, s):
+        if not self.stale:
+            self.store.append(self.score_row(s))
+
+    def score_row (self, s):
+        return [s['Player1Name'], str(s['Player1Score']), str(s['Player2Score']), s['Player2Name']]
 
 # This is a fake Presence Service Buddy object that represents computer players.
 class ComputerBuddyProps:
@@ -1281,6 +1861,275 @@ class ComputerBuddy:
 
 # Activity class for the game.  Defines the game user interface (toolbar, etc), controls loading & saving, interacts
 # with the Sugar environment.
+# Rasterizes frames on a worker thread, so the game can simulate the next frame meanwhile.  pongc releases the GIL
+# while it rasterizes, so the two really run at the same time.  Frames are drawn into two images in turn: the front
+# one holds the last finished frame and is the one shown, while the other is drawn into.  Below render scale 1 the
+# images are smaller than the screen, and the shown areas are scaled up into a screen sized image first.
+class FrameRenderer:
+    def __init__ (self, present):
+        # Called in the main loop after each frame, with the area of the screen that changed or None for all of it.
+        self.present = present
+
+        # Guards everything below, and is held while the front image is shown.
+        self.cond = threading.Condition()
+        self.pending = None
+        self.busy = False
+        self.running = True
+
+        # The native rasterizer draws straight into cairo image surfaces, so overlays are drawn onto the same pixels
+        # and the frame reaches the window in a single paint.  Older blobs draw into gtk.gdk.Images instead.
+        self.surfaces = PONGC_BACKEND == 'native'
+
+        self.images = []
+        self.screenimage = None
+        self.lastdirty = []
+        self.front = 0
+        self.frontframe = None
+        self.frontdirty = None
+
+        # Seconds the last frame took to draw, which the quality governor weighs along with the main loop.
+        self.drawtime = 0.0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def new_image (self, width, height):
+        # The NumPy rasterizer draws into its own grayscale image, older blobs into a gtk.gdk.Image.
+        if not self.surfaces:
+            return new_image(width, height)
+        return cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+
+    def resize (self, width, height):
+        self.wait()
+        scale = get_render_scale()
+        if scale == 1:
+            self.images = [self.new_image(width, height), self.new_image(width, height)]
+            self.screenimage = None
+        else:
+            w = max((width + scale - 1) / scale, 1)
+            h = max((height + scale - 1) / scale, 1)
+            self.images = [self.new_image(w, h), self.new_image(w, h)]
+            self.screenimage = self.new_image(width, height)
+        self.lastdirty = [None, None]
+        self.frontframe = None
+        self.frontdirty = None
+
+    def wait (self):
+        """Waits until the frame being rasterized, if any, is finished."""
+        self.cond.acquire()
+        try:
+            while self.pending is not None or self.busy:
+                self.cond.wait()
+        finally:
+            self.cond.release()
+
+    def submit (self, frame):
+        """Queues a frame for the worker.  Only one frame is in flight at a time, so this waits for the last one."""
+        self.cond.acquire()
+        try:
+            while self.pending is not None or self.busy:
+                self.cond.wait()
+            self.pending = frame
+            self.cond.notifyAll()
+        finally:
+            self.cond.release()
+
+    def render (self, frame):
+        """Rasterizes a frame on the calling thread and returns the area that changed, like the worker does."""
+        self.wait()
+        return self.draw(frame)
+
+    def draw (self, frame):
+        start = time.time()
+        back = 1 - self.front
+        img = self.images[back]
+        if self.surfaces:
+            img.flush()
+        t0 = time.time()
+        full, dirty = game.rasterize(img, frame, self.lastdirty[back])
+        timers.add('rasterize', time.time() - t0)
+
+        # Without scaling the overlay is drawn into the image right away, and is erased along with the moving objects
+        # next time.  Otherwise it is drawn over the scaled up image when shown.
+        overlay = (0, 0, 0, 0)
+        if frame.overlay is not None:
+            overlay = frame.overlay.extents
+        if self.surfaces:
+            img.mark_dirty()
+            if self.screenimage is None and frame.overlay is not None:
+                frame.overlay.replay(cairo.Context(img))
+                dirty = union_rect(dirty, overlay)
+        self.lastdirty[back] = dirty
+        shown = union_rect(dirty, overlay)
+
+        # The other image still has the old background, so it has to be redrawn in full next time.
+        if full:
+            self.lastdirty[self.front] = None
+
+        self.cond.acquire()
+        try:
+            area = None
+            if not full and self.frontdirty is not None:
+                area = union_rect(self.frontdirty, shown)
+            # A frame shown before the last one ever was still has its input to report.
+            if self.frontframe is not None and self.frontframe.inputtime is not None:
+                if frame.inputtime is None or self.frontframe.inputtime < frame.inputtime:
+                    frame.inputtime = self.frontframe.inputtime
+            self.front = back
+            self.frontframe = frame
+            self.frontdirty = shown
+            self.drawtime = time.time() - start
+        finally:
+            self.cond.release()
+        return area
+
+    def run (self):
+        while True:
+            self.cond.acquire()
+            try:
+                while self.pending is None and self.running:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                frame = self.pending
+                self.pending = None
+                self.busy = True
+            finally:
+                self.cond.release()
+
+            area = None
+            try:
+                area = self.draw(frame)
+            except:
+                log.exception('failed to render frame')
+
+            self.cond.acquire()
+            self.busy = False
+            self.cond.notifyAll()
+            self.cond.release()
+
+            gobject.idle_add(self.present, area)
+
+    def blit (self, drawable, gc, x, y, w, h):
+        """Shows an area of the last finished frame along with its overlay.  The caller must hold cond."""
+        img = self.images[self.front]
+        overlay = self.frontframe.overlay
+
+        if not self.surfaces:
+            if self.screenimage is not None:
+                upscale_image(img, self.screenimage, x, y, w, h)
+                img = self.screenimage
+            if PONGC_BACKEND == 'legacy':
+                drawable.draw_image(gc, img, x, y, x, y, w, h)
+            else:
+                buf = img.mem[y:y+h, x:x+w].tostring()
+                drawable.draw_gray_image(gc, x, y, w, h, gtk.gdk.RGB_DITHER_NONE, buf, w)
+            if overlay is not None:
+                overlay.replay(drawable.cairo_create())
+            return
+
+        if self.screenimage is not None:
+            img = self.screenimage
+            img.flush()
+            upscale_image(self.images[self.front], img, x, y, w, h)
+            img.mark_dirty()
+            if overlay is not None:
+                ctx = cairo.Context(img)
+                ctx.rectangle(x, y, w, h)
+                ctx.clip()
+                overlay.replay(ctx)
+
+        ctx = drawable.cairo_create()
+        ctx.rectangle(x, y, w, h)
+        ctx.clip()
+        ctx.set_operator(cairo.OPERATOR_SOURCE)
+        ctx.set_source_surface(img, 0, 0)
+        ctx.paint()
+
+    def stop (self):
+        self.cond.acquire()
+        self.running = False
+        self.cond.notifyAll()
+        self.cond.release()
+
+# Picks the visual quality tier from measured frame costs.  Frames that take most of their budget at the current
+# frame rate move down a tier right away, while moving up takes several cheap measurement windows in a row, so the
+# quality doesn't flip back and forth.
+class QualityGovernor:
+    # Frames per measurement window.
+    WINDOW = 30
+
+    # Fractions of the frame budget above which quality goes down, and below which it may go up.
+    DOWNGRADE = 0.9
+    UPGRADE = 0.5
+
+    # Cheap windows in a row needed to go up a tier.
+    UPGRADE_WINDOWS = 3
+
+    def __init__ (self):
+        self.costs = []
+        self.cheapwindows = 0
+
+        # A tier may be pinned with BOUNCE_QUALITY, which turns the governor off.
+        self.pinned = False
+        try:
+            game.set_quality(int(os.environ['BOUNCE_QUALITY']))
+            self.pinned = True
+        except (KeyError, ValueError):
+            pass
+
+    def frame (self, cost):
+        """Records the time in seconds a frame took to simulate or draw, and changes tiers when it's time to."""
+        if self.pinned:
+            return
+        self.costs.append(cost)
+        if len(self.costs) < QualityGovernor.WINDOW:
+            return
+
+        # The slowest frames are the ones that drop, so look at the 90th percentile rather than the average.
+        costs = sorted(self.costs)
+        cost = costs[len(costs)*9/10]
+        self.costs = []
+
+        budget = 1.0/game.quality['fps']
+        if cost > budget*QualityGovernor.DOWNGRADE and game.qualitytier < len(QUALITY_TIERS)-1:
+            game.set_quality(game.qualitytier+1)
+            self.cheapwindows = 0
+            log.debug('frames take %.1fms, quality lowered to tier %d' % (cost*1000, game.qualitytier))
+        elif cost < budget*QualityGovernor.UPGRADE and game.qualitytier > 0:
+            self.cheapwindows += 1
+            if self.cheapwindows >= QualityGovernor.UPGRADE_WINDOWS:
+                game.set_quality(game.qualitytier-1)
+                self.cheapwindows = 0
+                log.debug('frames take %.1fms, quality raised to tier %d' % (cost*1000, game.qualitytier))
+        else:
+            self.cheapwindows = 0
+
+# Measures how long input takes to reach the screen, from the arrival of the oldest input event a frame reflects to
+# the frame being shown.  The percentiles are logged for every window of measurements.
+class LatencyMeter:
+    # Measurements per window.
+    WINDOW = 100
+
+    def __init__ (self):
+        self.latencies = []
+        self.percentiles = None
+
+    def shown (self, frame):
+        """Records the latency of a frame that was just shown, if it reflects new input."""
+        if frame.inputtime is None:
+            return
+        self.latencies.append(time.time() - frame.inputtime)
+        frame.inputtime = None
+        if len(self.latencies) < LatencyMeter.WINDOW:
+            return
+
+        latencies = sorted(self.latencies)
+        self.latencies = []
+        self.percentiles = [latencies[int(p*(len(latencies)-1))] for p in (0.5, 0.9, 0.99)]
+        log.debug('input latency %.1fms p50, %.1fms p90, %.1fms p99' % tuple([t*1000 for t in self.percentiles]))
+
 class BounceActivity(activity.Activity):
 
     # Game mode definitions.
@@ -1291,6 +2140,9 @@ class BounceActivity(activity.Activity):
         activity.Activity.__init__(self, handle)
         self.set_title(_("Bounce"))
 
+        # Profile from the start if asked to, before the toolbar shows whether it does.
+        profiler.set_enabled(os.environ.get('BOUNCE_PROFILE') == '1', game.sequence)
+
         # Build the toolbars.
         self.build_toolbox()
 
@@ -1303,9 +2155,10 @@ class BounceActivity(activity.Activity):
         # Build the score panel.
         self.build_scorepanel()
 
-        # Turn off double buffering except for the drawarea, which mixes cairo and custom drawing.
+        # Turn off double buffering.  Overlays are drawn into the frame before it is shown, except with the NumPy
+        # rasterizer and older blobs, which draw them straight onto the window and need the drawarea double buffered.
         self.set_double_buffered(False)
-        self.drawarea.set_double_buffered(True)
+        self.drawarea.set_double_buffered(PONGC_BACKEND != 'native')
 
         # Initialize the game.
         game.new_game()
@@ -1313,10 +2166,20 @@ class BounceActivity(activity.Activity):
         self.paused = False
         self.mode = BounceActivity.MODE_GAME
 
-        # Initialize the FPS counter & limiter.
+        # Initialize the FPS counter.  The frame rate follows the quality tier, which the governor adjusts to what
+        # the machine can handle, while the game itself always advances at step_rate.
         self.lastclock = time.time()
         game.fps = 0.0
-        self.limitfps = 20.0 # 20fps is what the XO can currently handle.
+        self.governor = QualityGovernor()
+        self.steptime = 0.0
+
+        # Pointer state, handed to the game right before each simulation, and when the oldest input not simulated
+        # yet arrived.
+        self.mousex = 0
+        self.mousey = 0
+        self.mousedown = 0
+        self.inputtime = None
+        self.latency = LatencyMeter()
 
         # Get current player info for the scores table.
         self.pservice = presenceservice.get_instance()
@@ -1330,8 +2193,17 @@ class BounceActivity(activity.Activity):
         self.set_canvas(self.drawarea)
         self.show_interface()
         
+        # The main loop runs from a GLib timeout while the game animates.  While it is paused, edited or hidden the
+        # timeout is removed, so the activity sleeps until an event comes in.
+        self.running = True
+        self.visible = True
+        self.mainloop_id = None
+        self.mainloop_fps = None
+        self.add_events(gtk.gdk.VISIBILITY_NOTIFY_MASK)
+        self.connect('visibility-notify-event', self.on_visibility)
+
         # Get the mainloop ready to run (this should come last).
-        gobject.timeout_add(50, self.mainloop)
+        self.update_mainloop()
 
     #-----------------------------------------------------------------------------------------------------------------
     # User interface building.
@@ -1348,13 +2220,15 @@ class BounceActivity(activity.Activity):
         #self.drawarea.connect('configure-event', self.on_drawarea_resize)
         self.drawarea.connect('expose-event', self.on_drawarea_expose)
 
-        self.drawarea.add_events(gtk.gdk.POINTER_MOTION_MASK|gtk.gdk.BUTTON_PRESS_MASK|gtk.gdk.BUTTON_RELEASE_MASK)
+        self.drawarea.add_events(gtk.gdk.POINTER_MOTION_MASK|gtk.gdk.POINTER_MOTION_HINT_MASK|
+                                 gtk.gdk.BUTTON_PRESS_MASK|gtk.gdk.BUTTON_RELEASE_MASK)
         self.drawarea.connect('motion-notify-event', self.on_mouse)
         self.drawarea.connect('button-press-event', self.on_mouse)
         self.drawarea.connect('button-release-event', self.on_mouse)
 
-        self.drawimage = None
-        game.drawimage = None
+        # Frames are rasterized on a worker thread, and shown when they are finished.
+        self.renderer = FrameRenderer(self.on_frame_rendered)
+        self.rendersize = None
 
     def build_gamebox (self):
         self.pausebtn = toolbutton.ToolButton('media-playback-pause')
@@ -1383,6 +2257,14 @@ class BounceActivity(activity.Activity):
         self.gamebox.insert(sep, -1)
         self.gamebox.insert(self.editbtn, -1)
 
+        # Only there when profiling was asked for, see SequenceProfiler.
+        if profiler.available:
+            self.profilebtn = toggletoolbutton.ToggleToolButton('media-record')
+            self.profilebtn.set_tooltip(_("Profile Sequences"))
+            self.profilebtn.set_active(profiler.enabled)
+            self.profilebtn.connect('clicked', self.on_game_profile)
+            self.gamebox.insert(self.profilebtn, -1)
+
     def build_editbox (self):
         self.testbtn = toggletoolbutton.ToggleToolButton('zoom-in')
         self.testbtn.set_tooltip(_("Test Stage"))
@@ -1438,6 +2320,7 @@ class BounceActivity(activity.Activity):
 
     def build_scorepanel (self):
         self.scorepanel = ScorePanel()
+        game.scorepanel = self.scorepanel
         align = gtk.Alignment(0.0, 0.0, 1.0, 1.0)
         align.set_padding(50, 50, 100, 100)
         align.add(self.scorepanel)
@@ -1464,11 +2347,15 @@ class BounceActivity(activity.Activity):
 
     def on_game_showscores (self, button):
         if button.get_active():
-            self.scorepanel.rebuild()
+            # Let the panel come up before a history loaded from the journal is parsed.
+            gobject.idle_add(self.scorepanel.refresh)
             self.scorepanel.show_all()
         else:
             self.scorepanel.hide_all()
 
+    def on_game_profile (self, button):
+        profiler.set_enabled(button.get_active(), game.sequence)
+
     def on_game_clearscores (self, button):
         msg = alert.ConfirmationAlert()
         msg.props.title = _('Reset History?')
@@ -1477,7 +2364,7 @@ class BounceActivity(activity.Activity):
         def response(alert, response_id, self):
             self.remove_alert(alert)
             if response_id is gtk.RESPONSE_OK:
-                game.scores = []
+                game.scores.clear()
                 self.scorepanel.rebuild()
 
         msg.connect('response', response, self)
@@ -1539,6 +2426,9 @@ class BounceActivity(activity.Activity):
 
         self.vbox.set_size_request(rect[2], rect[3])
 
+        # The renderer must be idle before anything it uses changes.
+        self.renderer.wait()
+
         # Set 3D parameters.
         global screen_width
         global screen_height
@@ -1546,30 +2436,58 @@ class BounceActivity(activity.Activity):
         screen_height = rect[3]
         set_3d_params(screen_width, screen_height, viewport_scale)
 
-        # Rebuild drawimage.
-        self.drawimage = gtk.gdk.Image(gtk.gdk.IMAGE_FASTEST, gtk.gdk.visual_get_system(), rect[2], rect[3])
-        game.drawimage = self.drawimage
+        # The stage background must be rasterized again at the new size.
+        invalidate_background()
+
+        self.renderer.resize(rect[2], rect[3])
+        self.rendersize = (rect[2], rect[3])
 
         return True
 
+    def check_resize (self):
+        rect = self.drawarea.get_allocation()
+        if self.rendersize != (rect[2], rect[3]):
+            self.on_drawarea_resize()
+
+    def set_render_scale (self, scale):
+        # The images are reallocated at the new scale before the next frame.
+        self.renderer.wait()
+        set_render_scale(scale)
+        self.rendersize = None
+        self.drawarea.queue_draw()
+
+    def on_frame_rendered (self, area):
+        # Invalidate only what changed, including the overlays of this frame and the last one.
+        if area is None:
+            self.drawarea.queue_draw()
+        elif area[2] > 0 and area[3] > 0:
+            self.drawarea.queue_draw_area(*area)
+        return False
+
     def on_drawarea_expose (self, widget, event):
         if not self.drawarea.bin_window:
             return True
 
-        rect = self.drawarea.get_allocation()
-        if self.drawimage is None or (rect[2] != screen_width or rect[3] != screen_height):
-            self.on_drawarea_resize()
-
-        # Perform 3D rendering to the offscreen image and draw it to the screen.
-        clear_image(self.drawimage)
-        game.sequence.draw_3d()
-        gc = self.drawarea.get_style().fg_gc[gtk.STATE_NORMAL]
-        self.drawarea.bin_window.draw_image(gc, self.drawimage, 0, 0, 0, 0, -1, -1)
+        # Frames are rendered by the worker while the game runs, otherwise render the current state here.
+        self.check_resize()
+        if self.paused or self.renderer.frontframe is None:
+            self.renderer.render(game.snapshot())
 
-        # Perform Cairo rendering over the top.
-        game.cairo = self.drawarea.bin_window.cairo_create()
-        game.sequence.draw_cairo()
-        game.cairo = None
+        # Copy the exposed part of the last finished frame to the screen, with its Cairo overlay.
+        renderer = self.renderer
+        renderer.cond.acquire()
+        try:
+            x, y, w, h = event.area
+            w = min(w, screen_width - x)
+            h = min(h, screen_height - y)
+            if w > 0 and h > 0:
+                gc = self.drawarea.get_style().fg_gc[gtk.STATE_NORMAL]
+                t0 = time.time()
+                renderer.blit(self.drawarea.bin_window, gc, x, y, w, h)
+                timers.add('blit', time.time() - t0)
+                self.latency.shown(renderer.frontframe)
+        finally:
+            renderer.cond.release()
 
         # Hack to fix toolbox refresh.
         #self.tbox.queue_draw()
@@ -1595,7 +2513,7 @@ class BounceActivity(activity.Activity):
 
         if self.mode == BounceActivity.MODE_EDIT:
             self.showscoresbtn.set_active(False)
-            game.scores = []
+            game.scores.clear()
             self.scorepanel.rebuild()
 
             self.tbox.remove_toolbar(1)
@@ -1635,31 +2553,84 @@ class BounceActivity(activity.Activity):
             self.pausebtn.set_icon('media-playback-start')
         else:
             self.pausebtn.set_icon('media-playback-pause')
+        self.update_mainloop()
 
     def on_mouse (self, widget, event):
-        game.mousex = int(event.x)
-        game.mousey = int(event.y)
+        # Motion events are hints, so a burst of motion comes in as a single event, and the newest position is read
+        # from the pointer.  The game only gets it in tick, right before it is simulated.
+        if event.type == gtk.gdk.MOTION_NOTIFY and event.is_hint:
+            x, y, state = event.window.get_pointer()
+        else:
+            x, y = event.x, event.y
+        self.mousex = int(x)
+        self.mousey = int(y)
         if event.type == gtk.gdk.BUTTON_PRESS:
             # Simple cheat for testing.
             #if (game.paddle1.score < 5):
             #    game.paddle1.score += 1
-            game.mousedown = 1
+            self.mousedown = 1
         if event.type == gtk.gdk.BUTTON_RELEASE:
-            game.mousedown = 0
+            self.mousedown = 0
+        if self.inputtime is None:
+            self.inputtime = time.time()
 
     #-----------------------------------------------------------------------------------------------------------------
     # Main loop
 
     def on_destroy (self, widget):
         self.running = False
+        self.update_mainloop()
+        # Write the profile of the sequence that is running, which is never left otherwise.
+        profiler.set_enabled(False, game.sequence)
+        self.renderer.stop()
+
+    def on_visibility (self, widget, event):
+        # Switching to another activity or to the frame covers the window.
+        self.visible = event.state != gtk.gdk.VISIBILITY_FULLY_OBSCURED
+        self.update_mainloop()
 
     def tick (self):
         if self.paused:
+            self.steptime = 0.0
             return True
 
-        # Update current game sequence and animate.
-        game.sequence.update()
-        self.drawarea.queue_draw()
+        # Advance the game by as many steps as are due.  When frames take too long, the frames in between are
+        # skipped rather than the game slowed down, unless it falls more than max_step_lag behind, where it gives up
+        # catching up rather than spiral.
+        now = time.time()
+        if not self.steptime:
+            self.steptime = now
+
+        # Sample the pointer as late as possible.
+        game.mousex = self.mousex
+        game.mousey = self.mousey
+        game.mousedown = self.mousedown
+
+        steps = 0
+        while self.steptime <= now and steps < max_step_lag*step_rate:
+            t0 = time.time()
+            game.step()
+            timers.add('step', time.time() - t0)
+            self.steptime += 1.0/step_rate
+            steps += 1
+        if self.steptime <= now:
+            self.steptime = now + 1.0/step_rate
+
+        # The last step brought the game to the state due one step before self.steptime.  Frames drawn until the next
+        # one show the moving objects on their way there from the state before.
+        game.alpha = clamp(1.0 - (self.steptime - now)*step_rate, 0.0, 1.0)
+
+        # Hand a snapshot of the new frame to the renderer, which shows it when finished.  Meanwhile the next frame
+        # gets simulated.
+        if self.drawarea.bin_window:
+            self.check_resize()
+            frame = game.snapshot()
+            if steps:
+                frame.inputtime = self.inputtime
+                self.inputtime = None
+            t0 = time.time()
+            self.renderer.submit(frame)
+            timers.add('submit', time.time() - t0)
 
         # Compute framerate.
         diff = float(time.time() - self.lastclock)
@@ -1669,16 +2640,36 @@ class BounceActivity(activity.Activity):
 
         return True
 
+    def update_mainloop (self):
+        """Starts or stops the main loop timeout, depending on whether the game animates."""
+        animating = self.running and self.visible and not self.paused
+        if animating and self.mainloop_id is None:
+            # The game continues from now, rather than catching up on the time it was stopped.
+            self.steptime = 0.0
+            self.start_mainloop()
+        elif not animating and self.mainloop_id is not None:
+            gobject.source_remove(self.mainloop_id)
+            self.mainloop_id = None
+
+    def start_mainloop (self):
+        self.mainloop_fps = game.quality['fps']
+        self.mainloop_id = gobject.timeout_add(int(1000/self.mainloop_fps), self.mainloop)
+
     def mainloop (self):
-        """Runs the game loop.  Note that this doesn't actually return until the activity ends."""
-        self.running = True
-        clock = pygame.time.Clock()
-        while self.running:
-            clock.tick(self.limitfps)
-            self.tick()
-            while gtk.events_pending():
-                gtk.main_iteration(False)
-        return False
+        """Runs one frame of the game.  Called by a GLib timeout at the frame rate of the quality tier."""
+        # The time spent on each frame, without waiting for the next one, drives the quality governor.  The renderer
+        # draws the frame while the next one is simulated, so whichever of the two takes longer is what limits the
+        # frame rate.
+        t0 = time.time()
+        self.tick()
+        self.governor.frame(max(time.time() - t0, self.renderer.drawtime))
+        timers.dump_due(os.path.join(activity.get_activity_root(), 'instance', 'timers.txt'))
+
+        # Follow the frame rate of the quality tier, which the governor may just have changed.
+        if game.quality['fps'] != self.mainloop_fps:
+            self.start_mainloop()
+            return False
+        return True
 
     #-----------------------------------------------------------------------------------------------------------------
     # Journal integration
@@ -1692,14 +2683,39 @@ class BounceActivity(activity.Activity):
             finally:
                 fd.close()
 
-            storage = json.loads(data)
+            # From version 2 the first line holds the version.  Version 1 documents have none, and are a single JSON
+            # object, which may span several lines.
+            header, sep, rows = data.partition('\n')
+            try:
+                storage = json.loads(header)
+            except ValueError:
+                try:
+                    storage = json.loads(data)
+                except ValueError:
+                    log.error('cannot read journal document, leaving the game as it is')
+                    return
+            version = storage.get('Version', 1)
+            if version > JOURNAL_VERSION:
+                log.error('journal document version %d is newer than %d, leaving the game as it is' %
+                          (version, JOURNAL_VERSION))
+                return
 
             # Restore stages.
             game.stage_descs = storage['Stages']
-            game.scores = storage['Scores']
+
+            # Restore the score history.  Version 1 documents hold it parsed already; later ones leave it as text
+            # until the history panel is opened.
+            if version == 1:
+                game.scores.load(storage['Scores'])
+            else:
+                game.scores.load_rows(rows)
+            self.scorepanel.invalidate()
 
             # Restore activity state.
             game.set_level(storage.get('curlevel', 0))
+            for i in range(0, game.curlevel):
+                desc = game.stage_descs[i]
+                game.scores.stage_result(i, desc['Name'], desc.get('Paddle1Score', 0), desc.get('Paddle2Score', 0))
             self.set_mode(storage.get('mode', BounceActivity.MODE_GAME))
             self.showscoresbtn.set_active(storage.get('history_visible', False))
 
@@ -1715,19 +2731,23 @@ class BounceActivity(activity.Activity):
             self.metadata['mime_type'] = 'text/plain'
 
         storage = {}
+        storage['Version'] = JOURNAL_VERSION
 
         # Save stages.
         storage['Stages'] = game.stage_descs
-        storage['Scores'] = game.scores
 
         # Save activity state.
         storage['curlevel'] = game.curlevel
         storage['mode'] = self.mode
         storage['history_visible'] = self.showscoresbtn.get_active()
 
+        # The score history follows, one game per line.
+        lines = [json.dumps(storage, separators=(',', ':'))]
+        lines.extend(game.scores.rows())
+
         fd = open(file_path, 'w')
         try:
-            fd.write(json.dumps(storage))
+            fd.write('\n'.join(lines) + '\n')
         finally:
             fd.close()
 
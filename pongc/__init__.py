@@ -5,17 +5,50 @@ import logging
 _sys_path = sys.path
 _root_path = os.path.dirname(__file__)
 
+# PONGC_BACKEND=numpy in the environment skips the blobs, PONGC_BACKEND=native forbids falling back to NumPy.
+_backend = os.environ.get('PONGC_BACKEND', '')
+
+# Functions and constants bounce.py uses.  Blobs built before any of them was added only have the per-primitive
+# functions, which pongcompat builds the rest on.
+_api = ['draw_list', 'DRAW_END',
+        'set_raster_threads', 'get_raster_threads',
+        'set_render_scale', 'get_render_scale', 'upscale_image',
+        'set_projection_depth', 'project_points',
+        'draw_text_2x', 'draw_icon_2x', 'DRAW_TEXT_2X', 'DRAW_ICON_2X', 'HUD_CELL_WIDTH', 'HUD_ICON_X_OUTLINE',
+        'add_sprite', 'blit_sprite', 'DRAW_SPRITE_2X', 'SPRITE_DIGIT_0']
+
 for i in os.listdir(_root_path):
     path = os.path.join(_root_path, i)
-    if (os.path.isdir(path)):
+    if _backend != 'numpy' and os.path.isdir(path):
         sys.path = _sys_path + [os.path.join('.', path)]
         try:
-            from pongclib import *
-            logging.debug('use %s blobs' % path)
+            import pongclib
+            if [name for name in _api if not hasattr(pongclib, name)]:
+                from pongcompat import *
+                logging.debug('use %s blobs without draw lists' % path)
+                PONGC_BACKEND = 'legacy'
+            else:
+                from pongclib import *
+                logging.debug('use %s blobs' % path)
+                PONGC_BACKEND = 'native'
             _sys_path = None
             break
         except Exception, e:
+            # Forget the module, so the next blobs are really loaded.
+            sys.modules.pop('pongclib', None)
+            sys.modules.pop('_pongclib', None)
             logging.debug('skip %s blobs: %s' % (path, e))
 
 if _sys_path:
-    raise('cannot find proper binary blobs')
+    sys.path = _sys_path
+    if _backend == 'native':
+        raise ImportError('cannot find proper binary blobs')
+
+    # No blob matches this platform, fall back to the NumPy rasterizer.
+    try:
+        from pongnp import *
+        logging.debug('use numpy rasterizer')
+        PONGC_BACKEND = 'numpy'
+    except ImportError, e:
+        logging.debug('skip numpy rasterizer: %s' % e)
+        raise ImportError('cannot find proper binary blobs')
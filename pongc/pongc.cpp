@@ -17,9 +17,23 @@
 */
 #include "pongc.h"
 
+#include <vector>
+#include <pthread.h>
+
 typedef guint16 depth16_t;
 typedef guint32 depth24_t;
 
+// Guards all the state below, from the render scale to the projection table.  draw_list runs with the Python GIL
+// released, so another Python thread may call in meanwhile.  Every function of the API that reads or changes the
+// state holds the lock for as long as it runs.  Functions starting with an underscore expect it to be held already.
+pthread_mutex_t state_mutex = PTHREAD_MUTEX_INITIALIZER;
+
+struct state_lock_t
+{
+    state_lock_t() { pthread_mutex_lock(&state_mutex); }
+    ~state_lock_t() { pthread_mutex_unlock(&state_mutex); }
+};
+
 template <typename pixel_t> inline
 void _clear_image(GdkImage* img)
 {
@@ -37,6 +51,235 @@ void clear_image(GdkImage* img)
         _clear_image<depth24_t>(img);
 }
 
+// Screen pixels per image pixel.  At 1 the image is full size and every 2x pixel is written as a 2x2 block, 
+// otherwise coordinates are scaled down to the image, and each pixel is written once.
+int render_scale = 1;
+
+static void _invalidate_background();
+
+void set_render_scale(int scale)
+{
+    state_lock_t lock;
+    if (scale < 1) scale = 1;
+    if (scale > 4) scale = 4;
+    render_scale = scale;
+
+    // The cached background was drawn at the old scale.
+    _invalidate_background();
+}
+
+int get_render_scale()
+{
+    state_lock_t lock;
+    return render_scale;
+}
+
+// Converts 2x coordinates and radii to image pixels.
+inline
+int scale_coord(int c)
+{
+    if (render_scale <= 2)
+        return c;
+    int v = c*2;
+    return v >= 0 ? v/render_scale : -((-v + render_scale - 1)/render_scale);
+}
+
+inline
+int scale_radius(int r)
+{
+    return render_scale <= 2 ? r : r*2/render_scale;
+}
+
+guint8* background_mem = NULL;
+int background_size = 0;
+int background_key = 0;
+int background_width = 0;
+int background_height = 0;
+bool background_valid = false;
+
+void store_background(GdkImage* img, int key)
+{
+    state_lock_t lock;
+    int size = img->bpl*img->height;
+    if (size != background_size)
+    {
+        free(background_mem);
+        background_mem = (guint8*)malloc(size);
+        background_size = background_mem ? size : 0;
+        if (!background_mem)
+        {
+            background_valid = false;
+            return;
+        }
+    }
+
+    memcpy(background_mem, img->mem, size);
+    background_key = key;
+    background_width = img->width;
+    background_height = img->height;
+    background_valid = true;
+}
+
+int restore_background(GdkImage* img, int key)
+{
+    state_lock_t lock;
+    if (!background_valid || key != background_key || 
+        img->width != background_width || img->height != background_height || img->bpl*img->height != background_size)
+        return 0;
+
+    memcpy(img->mem, background_mem, background_size);
+    return 1;
+}
+
+static void _invalidate_background()
+{
+    background_valid = false;
+}
+
+void invalidate_background()
+{
+    state_lock_t lock;
+    _invalidate_background();
+}
+
+int restore_background_rect(GdkImage* img, int key, int x, int y, int w, int h)
+{
+    state_lock_t lock;
+    if (!background_valid || key != background_key || 
+        img->width != background_width || img->height != background_height || img->bpl*img->height != background_size)
+        return 0;
+
+    // The rectangle is in screen pixels.
+    int x1 = (x + w + render_scale - 1)/render_scale;
+    int y1 = (y + h + render_scale - 1)/render_scale;
+    x = x < 0 ? 0 : x/render_scale;
+    y = y < 0 ? 0 : y/render_scale;
+    if (x1 > img->width) x1 = img->width;
+    if (y1 > img->height) y1 = img->height;
+    w = x1 - x;
+    h = y1 - y;
+    if (w <= 0 || h <= 0)
+        return 1;
+
+    int bytes = img->depth == 16 ? sizeof(depth16_t) : sizeof(depth24_t);
+    for (int row = y; row < y + h; row++)
+    {
+        int ofs = row*img->bpl + x*bytes;
+        memcpy((guint8*)img->mem + ofs, background_mem + ofs, w*bytes);
+    }
+    return 1;
+}
+
+template <typename pixel_t, int scale>
+void _upscale_image(GdkImage* src, GdkImage* dst, int x, int y, int w, int h)
+{
+    pixel_t* spixels = (pixel_t*)src->mem;
+    pixel_t* dpixels = (pixel_t*)dst->mem;
+    int spitch = src->bpl/sizeof(pixel_t);
+    int dpitch = dst->bpl/sizeof(pixel_t);
+
+    // Screen columns [x, x1) are covered by whole image pixels from sx0 to sx1, with partial ones at either end.
+    int x1 = x + w;
+    int sx0 = (x + scale - 1)/scale;
+    int sx1 = x1/scale;
+    if (sx1 > src->width) sx1 = src->width;
+    if (sx0 > sx1) sx0 = sx1;
+
+    for (int dy = y; dy < y + h; dy++)
+    {
+        int sy = dy/scale;
+        if (sy >= src->height) sy = src->height-1;
+        pixel_t* drow = dpixels + dpitch*dy;
+
+        // Each image row is written once, and copied to the following screen rows.
+        if (dy > y && sy == (dy-1)/scale)
+        {
+            memcpy(drow + x, drow - dpitch + x, w*sizeof(pixel_t));
+            continue;
+        }
+
+        pixel_t* srow = spixels + spitch*sy;
+        int dx = x;
+        for (; dx < sx0*scale; dx++)
+            drow[dx] = srow[dx/scale];
+
+        if (sx0 < sx1)
+        {
+            pixel_t* d = drow + dx;
+            for (int sx = sx0; sx < sx1; sx++, d += scale)
+            {
+                pixel_t pix = srow[sx];
+                for (int i = 0; i < scale; i++)
+                    d[i] = pix;
+            }
+            dx = sx1*scale;
+        }
+
+        // Past the right edge of the image, the last column is repeated.
+        for (; dx < x1; dx++)
+        {
+            int sx = dx/scale;
+            drow[dx] = srow[sx < src->width ? sx : src->width-1];
+        }
+    }
+}
+
+template <typename pixel_t>
+void _upscale_image(GdkImage* src, GdkImage* dst, int x, int y, int w, int h)
+{
+    switch (render_scale)
+    {
+    case 2: _upscale_image<pixel_t, 2>(src, dst, x, y, w, h); break;
+    case 3: _upscale_image<pixel_t, 3>(src, dst, x, y, w, h); break;
+    case 4: _upscale_image<pixel_t, 4>(src, dst, x, y, w, h); break;
+    default: _upscale_image<pixel_t, 1>(src, dst, x, y, w, h); break;
+    }
+}
+
+void upscale_image(GdkImage* src, GdkImage* dst, int x, int y, int w, int h)
+{
+    state_lock_t lock;
+    if (x < 0) { w += x; x = 0; }
+    if (y < 0) { h += y; y = 0; }
+    if (x + w > dst->width) w = dst->width - x;
+    if (y + h > dst->height) h = dst->height - y;
+    if (w <= 0 || h <= 0 || src->width <= 0 || src->height <= 0)
+        return;
+
+    if (dst->depth == 16)
+        _upscale_image<depth16_t>(src, dst, x, y, w, h);
+    else
+        _upscale_image<depth24_t>(src, dst, x, y, w, h);
+}
+
+// Bounds of everything drawn since begin_dirty, in image coordinates.  Empty when dirty_x0 > dirty_x1.
+int dirty_x0 = 0;
+int dirty_y0 = 0;
+int dirty_x1 = -1;
+int dirty_y1 = -1;
+
+void begin_dirty()
+{
+    state_lock_t lock;
+    dirty_x0 = dirty_y0 = 0;
+    dirty_x1 = dirty_y1 = -1;
+}
+
+inline
+void mark_dirty(int x0, int y0, int x1, int y1)
+{
+    if (dirty_x0 > dirty_x1)
+    {
+        dirty_x0 = x0; dirty_y0 = y0;
+        dirty_x1 = x1; dirty_y1 = y1;
+        return;
+    }
+    if (x0 < dirty_x0) dirty_x0 = x0;
+    if (y0 < dirty_y0) dirty_y0 = y0;
+    if (x1 > dirty_x1) dirty_x1 = x1;
+    if (y1 > dirty_y1) dirty_y1 = y1;
+}
+
 inline
 void to_pixel(depth16_t *pixel, uint16_t c)
 {
@@ -50,167 +293,234 @@ void to_pixel(depth24_t *pixel, uint16_t c)
 	*pixel = p | p<<8 | p<<16;
 }
 
-template <typename pixel_t> inline
-void _draw_point_2x(GdkImage* img, int x, int y, uint16_t c)
+
+// Area of the image primitives may write to, in image coordinates.  The whole image, or one band of it when rasterizing
+// with several threads.
+struct clip_t
 {
-	if (x < 0 || y < 0 || x >= img->width/2-1 || y >= img->height/2-1)
-		return;
+    int minx, miny, maxx, maxy;
+};
 
-	pixel_t* pixels = (pixel_t*)img->mem;
-	int pitch = img->bpl/sizeof(pixel_t);
-	int ofs = pitch*y*2+x*2;
+inline
+clip_t image_clip(GdkImage* img)
+{
+    // The last row and column are never written, like the last 2x row and column at render scale 1, so the edges
+    // look the same at every scale.
+    if (render_scale == 1)
+    {
+        clip_t clip = { 0, 0, img->width/2-2, img->height/2-2 };
+        return clip;
+    }
+    clip_t clip = { 0, 0, img->width-2, img->height-2 };
+    return clip;
+}
+
+// Pixels are written as block x block squares, 2 at render scale 1 and 1 otherwise.
+template <typename pixel_t, int block> inline
+void put_pixel_2x(pixel_t* pixels, int pitch, int x, int y, pixel_t pix)
+{
+    pixel_t* p = pixels + pitch*y*block + x*block;
+    for (int j = 0; j < block; j++, p += pitch)
+        for (int i = 0; i < block; i++)
+            p[i] = pix;
+}
+
+template <typename pixel_t, int block> inline
+void fill_span_2x(pixel_t* pixels, int pitch, int x0, int x1, int y, pixel_t pix)
+{
+    pixel_t* row = pixels + pitch*y*block + x0*block;
+    int n = (x1 - x0 + 1)*block;
+    for (int j = 0; j < block; j++, row += pitch)
+        for (int i = 0; i < n; i++)
+            row[i] = pix;
+}
+
+template <typename pixel_t, int block> inline
+void _draw_point_2x(GdkImage* img, const clip_t& clip, int x, int y, uint16_t c)
+{
+	if (x < clip.minx || y < clip.miny || x > clip.maxx || y > clip.maxy)
+		return;
 
 	pixel_t pix;
     to_pixel(&pix, c);
 
-	pixels[ofs] = pix;
-	pixels[ofs+1] = pix;
-	pixels[ofs+pitch] = pix;
-	pixels[ofs+pitch+1] = pix;
+    put_pixel_2x<pixel_t, block>((pixel_t*)img->mem, img->bpl/sizeof(pixel_t), x, y, pix);
 }
 
-void draw_point_2x(GdkImage* img, int x, int y, uint16_t c)
+// Cohen-Sutherland outcodes, used to reject lines lying entirely to one side of the clip area.
+enum { OUT_LEFT = 1, OUT_RIGHT = 2, OUT_TOP = 4, OUT_BOTTOM = 8 };
+
+inline
+int outcode(int x, int y, const clip_t& clip)
 {
-    if (img->depth == 16)
-        _draw_point_2x<depth16_t>(img, x, y, c);
+    return (x < clip.minx ? OUT_LEFT : x > clip.maxx ? OUT_RIGHT : 0) | 
+           (y < clip.miny ? OUT_TOP : y > clip.maxy ? OUT_BOTTOM : 0);
+}
+
+// The line is clipped once, after which every pixel is written without checks.  Lines must run top to bottom 
+// (y0 <= y1).
+template <typename pixel_t, int block> inline
+void _draw_line_2x(GdkImage* img, const clip_t& clip, int x0, int y0, int x1, int y1, uint16_t c)
+{
+    int dx = x1 - x0;
+    int xdir = 1;
+    if (dx < 0)
+    {
+        xdir = -1;
+        dx = -dx;
+    }
+    int dy = y1 - y0;
+
+    // Lines steeper than 65536:1 on either axis leave their bounding box, see adj below, so they can't be rejected
+    // from their end points.
+    bool steep = dx != 0 && dy != 0 && (dy > dx ? dy/dx : dx/dy) >= 1<<16;
+    if (!steep && (outcode(x0, y0, clip) & outcode(x1, y1, clip)))
+        return;
+
+    pixel_t* pixels = (pixel_t*)img->mem;
+    int pitch = img->bpl/sizeof(pixel_t);
+
+    pixel_t pix;
+    to_pixel(&pix, c);
+
+    if (dy == 0) // Horizontal line, written as contiguous rows.
+    {
+        int lo = x0 < x1 ? x0 : x1;
+        int hi = x0 < x1 ? x1 : x0;
+        if (lo < clip.minx) lo = clip.minx;
+        if (hi > clip.maxx) hi = clip.maxx;
+        fill_span_2x<pixel_t, block>(pixels, pitch, lo, hi, y0, pix);
+        return;
+    }
+
+    if (dx == 0) // Vertical line, written as a contiguous column.
+    {
+        int lo = y0 < clip.miny ? clip.miny : y0;
+        int hi = y1 > clip.maxy ? clip.maxy : y1;
+        for (int y = lo; y <= hi; y++)
+            put_pixel_2x<pixel_t, block>(pixels, pitch, x0, y, pix);
+        return;
+    }
+
+    // Diagonal and other lines.  Pixel k (0 <= k < n) lies k steps along the major axis, and as many steps along the
+    // minor axis as a 16 bit error accumulator incremented by adj has turned over, which is (k*adj) >> 16.  Diagonal
+    // lines turn over every step.  The final pixel is always exactly the end point.
+    int n, adj;
+    if (dx == dy)
+    {
+        n = dy;
+        adj = 1<<16;
+    }
+    else if (dy > dx)
+    {
+        n = dy;
+        adj = (guint16)(((unsigned long)dx << 16) / (unsigned long)dy);
+    }
+    else
+    {
+        n = dx;
+        adj = (guint16)(((unsigned long)dy << 16) / (unsigned long)dx);
+    }
+
+    // When the minor axis advances by less than 1/65536 per step the adjustment truncates to 0, and the 16 bit
+    // accumulator of the original rasterizer then "turned over" on every step.  Keep drawing those lines the same.
+    if (adj == 0)
+        adj = 1<<16;
+
+    bool ymajor = dy >= dx;
+    int major0, majordir, majormin, majormax;
+    int minor0, minordir, minormin, minormax;
+    if (ymajor)
+    {
+        major0 = y0; majordir = 1; majormin = clip.miny; majormax = clip.maxy;
+        minor0 = x0; minordir = xdir; minormin = clip.minx; minormax = clip.maxx;
+    }
     else
-        _draw_point_2x<depth24_t>(img, x, y, c);
+    {
+        major0 = x0; majordir = xdir; majormin = clip.minx; majormax = clip.maxx;
+        minor0 = y0; minordir = 1; minormin = clip.miny; minormax = clip.maxy;
+    }
+
+    // Range of k keeping the major coordinate inside the clip area.
+    long long kmin = majordir > 0 ? majormin - major0 : major0 - majormax;
+    long long kmax = majordir > 0 ? majormax - major0 : major0 - majormin;
+    if (kmin < 0) kmin = 0;
+    if (kmax > n-1) kmax = n-1;
+
+    // Range of k keeping the minor coordinate inside the clip area.  Since (k*adj) >> 16 never decreases, this is 
+    // also a single interval.
+    long long flo = minordir > 0 ? minormin - minor0 : minor0 - minormax;
+    long long fhi = minordir > 0 ? minormax - minor0 : minor0 - minormin;
+    if (fhi < 0)
+        kmax = -1;
+    else if (((fhi + 1) << 16) - 1 < kmax*adj)
+        kmax = (((fhi + 1) << 16) - 1) / adj;
+    if (flo > 0 && (flo << 16) > kmin*adj)
+        kmin = ((flo << 16) + adj - 1) / adj;
+
+    long long acc = kmin*adj;
+    for (long long k = kmin; k <= kmax; k++, acc += adj)
+    {
+        int major = major0 + majordir*(int)k;
+        int minor = minor0 + minordir*(int)(acc >> 16);
+        if (ymajor)
+            put_pixel_2x<pixel_t, block>(pixels, pitch, minor, major, pix);
+        else
+            put_pixel_2x<pixel_t, block>(pixels, pitch, major, minor, pix);
+    }
+
+    if (!outcode(x1, y1, clip))
+        put_pixel_2x<pixel_t, block>(pixels, pitch, x1, y1, pix);
 }
 
-void draw_line_2x(GdkImage* img, int x0, int y0, int x1, int y1, int color)
+struct ellipse_shape_t
 {
-	// Make sure the line runs top to bottom.
-	if (y0 > y1) 
-	{
-		int ty = y0; y0 = y1; y1 = ty;
-		int tx = x0; x0 = x1; x1 = tx;
-	}
+    int rx, ry;
+    bool fill;
+    unsigned int used;
+    int minx, miny, maxx, maxy;
+    std::vector<int> data; // Outline: x, y pairs.  Fill: x0, x1, y triples with x0 <= x1.
+};
 
-	// Draw the initial pixel, which is always exactly intersected by the line and so needs no weighting.
-	draw_point_2x(img, x0, y0, color);
-	
-	int dx = x1 - x0;
-	int xdir;
-	if (dx >= 0)
-		xdir = 1;
-	else 
-	{
-		xdir = -1;
-		dx = -dx; // make dx positive.
-	}
-	
-	int dy = y1 - y0;
-	if (dy == 0) // Horizontal line
-	{
-		while (dx-- != 0) 
-		{
-			x0 += xdir;
-			draw_point_2x(img, x0, y0, color);
-		}
-	}
-	else if (dx == 0) // Vertical line
-	{
-		do 
-		{
-			y0++;
-			draw_point_2x(img, x0, y0, color);
-		} while (--dy != 0);
-	}
-	else if (dx == dy) // Diagonal line
-	{
-		do 
-		{
-			x0 += xdir;
-			y0++;
-			draw_point_2x(img, x0, y0, color);
-		} while (--dy != 0);
-	}
-	else // Line is not horizontal, diagonal, or vertical.
-	{
-		// Initialize the line error accumulator to 0 
-		uint16_t ErrorAcc = 0;  
-		
-		// # of bits by which to shift ErrorAcc to get intensity level 
-		uint16_t IntensityShift = 16 - 8;
-		
-		// Mask used to flip all bits in an intensity weighting, producing the result (1 - intensity weighting) 
-		uint16_t WeightingComplementMask = 256 - 1;
-		
-		// Is this an X-major or Y-major line?
-		if (dy > dx) 
-		{
-			// Y-major line; calculate 16-bit fixed-point fractional part of a pixel that X advances each time Y advances 
-			// 1 pixel, truncating the result so that we won't overrun the endpoint along the X axis
-			uint16_t ErrorAdj = ((unsigned long) dx << 16) / (unsigned long) dy;
-			// Draw all pixels other than the first and last
-			while (--dy) 
-			{
-				uint16_t ErrorAccTemp = ErrorAcc;   /* remember currrent accumulated error */
-				ErrorAcc += ErrorAdj;      /* calculate error for next pixel */
-				if (ErrorAcc <= ErrorAccTemp) 
-				{
-					// The error accumulator turned over, so advance the X coord
-					x0 += xdir;
-				}
-				y0++; // Y-major, so always advance Y
-				// The IntensityBits most significant bits of ErrorAcc give us the intensity weighting for this pixel, and the 
-				// complement of the weighting for the paired pixel
-				uint16_t Weighting = ErrorAcc >> IntensityShift;
-				//draw_point_2x(img, x0, y0, (color * Weighting) >> 8);
-				//draw_point_2x(img, x0 + xdir, y0, (color * (Weighting ^ WeightingComplementMask)) >> 8);
-				draw_point_2x(img, x0, y0, color);
-			}
-			// Draw the final pixel, which is always exactly intersected by the line and so needs no weighting
-			draw_point_2x(img, x1, y1, color);
-		}
-		else
-		{
-			// It's an X-major line; calculate 16-bit fixed-point fractional part of a pixel that Y advances each time X 
-			// advances 1 pixel, truncating the result to avoid overrunning the endpoint along the X axis
-			uint16_t ErrorAdj = ((unsigned long) dy << 16) / (unsigned long) dx;
-			// Draw all pixels other than the first and last
-			while (--dx) 
-			{
-				uint16_t ErrorAccTemp = ErrorAcc;   // remember currrent accumulated error
-				ErrorAcc += ErrorAdj;      // calculate error for next pixel
-				if (ErrorAcc <= ErrorAccTemp) 
-				{
-					// The error accumulator turned over, so advance the Y coord
-					y0++;
-				}
-				x0 += xdir; // X-major, so always advance X 
-				// The IntensityBits most significant bits of ErrorAcc give us the intensity weighting for this pixel, and the 
-				// complement of the weighting for the paired pixel
-				uint16_t Weighting = ErrorAcc >> IntensityShift;
-				//draw_point_2x(img, x0, y0, (color * Weighting) >> 8);
-				//draw_point_2x(img, x0, y0 + 1, (color * (Weighting ^ WeightingComplementMask)) >> 8);
-				draw_point_2x(img, x0, y0, color);
-			}
-			// Draw the final pixel, which is always exactly intersected by the line and so needs no weighting
-			draw_point_2x(img, x1, y1, color);
-		}
-	}
+inline
+void add_bounds(ellipse_shape_t* shape, int x0, int x1, int y)
+{
+    if (shape->data.empty())
+    {
+        shape->minx = x0; shape->maxx = x1;
+        shape->miny = shape->maxy = y;
+        return;
+    }
+    if (x0 < shape->minx) shape->minx = x0;
+    if (x1 > shape->maxx) shape->maxx = x1;
+    if (y < shape->miny) shape->miny = y;
+    if (y > shape->maxy) shape->maxy = y;
 }
 
-void draw_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
+inline
+void add_point(ellipse_shape_t* shape, int x, int y)
 {
-	if (rx==0 && ry==0) // Special case - draw a single pixel 
-	{  
-		draw_point_2x(img, x, y, color);
-		return;
-	}
-	if (rx==0)  // Special case for rx=0 - draw a vline
-	{ 
-		draw_line_2x(img, x, y-ry, x, y+ry, color);
-		return;
-	}
-	if (ry==0) // Special case for ry=0 - draw a hline
-	{ 
-		draw_line_2x(img, x-rx, y, x+rx, y, color);
-		return;
-	}
+    add_bounds(shape, x, x, y);
+    shape->data.push_back(x);
+    shape->data.push_back(y);
+}
+
+inline
+void add_span(ellipse_shape_t* shape, int x0, int x1, int y)
+{
+    // Spans are drawn as lines, which include both endpoints even when they are reversed.
+    if (x0 > x1) { int t = x0; x0 = x1; x1 = t; }
+    add_bounds(shape, x0, x1, y);
+    shape->data.push_back(x0);
+    shape->data.push_back(x1);
+    shape->data.push_back(y);
+}
+
+static void build_ellipse_outline(ellipse_shape_t* shape)
+{
+    int rx = shape->rx;
+    int ry = shape->ry;
 
-	// Draw
 	int oh = 0xffff;
 	int oi = 0xffff;
 	int oj = 0xffff;
@@ -229,31 +539,31 @@ void draw_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
 			int k = (i * ry) / rx;
 			if (((ok != k) && (oj != k)) || ((oj != j) && (ok != j)) || (k != j)) 
 			{
-				int xph = x+h-1;
-				int xmh = x-h;
+				int xph = h-1;
+				int xmh = -h;
 				if (k > 0) 
 				{
-					int ypk=y+k-1;
-					int ymk=y-k;
+					int ypk=k-1;
+					int ymk=-k;
 					if (h > 0) 
 					{
-						draw_point_2x(img, xmh, ypk, color);
-						draw_point_2x(img, xmh, ymk, color);
+						add_point(shape, xmh, ypk);
+						add_point(shape, xmh, ymk);
 					}
-					draw_point_2x(img, xph, ypk, color);
-					draw_point_2x(img, xph, ymk, color);
+					add_point(shape, xph, ypk);
+					add_point(shape, xph, ymk);
 				}
 				ok = k;
-				int xpi = x+i-1;
-				int xmi = x-i;
+				int xpi = i-1;
+				int xmi = -i;
 				if (j > 0) 
 				{
-					int ypj = y+j-1;
-					int ymj = y-j;
-					draw_point_2x(img, xmi, ypj, color);
-					draw_point_2x(img, xpi, ypj, color);
-					draw_point_2x(img, xmi, ymj, color);
-					draw_point_2x(img, xpi, ymj, color);
+					int ypj = j-1;
+					int ymj = -j;
+					add_point(shape, xmi, ypj);
+					add_point(shape, xpi, ypj);
+					add_point(shape, xmi, ymj);
+					add_point(shape, xpi, ymj);
 				}
 				oj = j;
 			}
@@ -274,31 +584,31 @@ void draw_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
 			int k = (i * rx) / ry;
 			if (((oi != i) && (oh != i)) || ((oh != h) && (oi != h) && (i != h))) 
 			{
-				int xmj = x-j;
-				int xpj = x+j-1;
+				int xmj = -j;
+				int xpj = j-1;
 				if (i > 0) 
 				{
-					int ypi = y+i-1;
-					int ymi = y-i;
+					int ypi = i-1;
+					int ymi = -i;
 					if (j > 0) 
 					{
-						draw_point_2x(img, xmj, ypi, color);
-						draw_point_2x(img, xmj, ymi, color);
+						add_point(shape, xmj, ypi);
+						add_point(shape, xmj, ymi);
 					}
-					draw_point_2x(img, xpj, ypi, color);
-					draw_point_2x(img, xpj, ymi, color);
+					add_point(shape, xpj, ypi);
+					add_point(shape, xpj, ymi);
 				}
 				oi = i;
-				int xmk = x-k;
-				int xpk = x+k-1;
+				int xmk = -k;
+				int xpk = k-1;
 				if (h > 0) 
 				{
-					int yph = y+h-1;
-					int ymh = y-h;
-					draw_point_2x(img, xmk, yph, color);
-					draw_point_2x(img, xpk, yph, color);
-					draw_point_2x(img, xmk, ymh, color);
-					draw_point_2x(img, xpk, ymh, color);
+					int yph = h-1;
+					int ymh = -h;
+					add_point(shape, xmk, yph);
+					add_point(shape, xpk, yph);
+					add_point(shape, xmk, ymh);
+					add_point(shape, xpk, ymh);
 				}
 				oh = h;
 			}
@@ -308,25 +618,11 @@ void draw_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
 	}
 }
 
-void fill_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
+static void build_ellipse_spans(ellipse_shape_t* shape)
 {
-	if (rx==0 && ry==0) // Special case - draw a single pixel 
-	{  
-		draw_point_2x(img, x, y, color);
-		return;
-	}
-	if (rx==0)  // Special case for rx=0 - draw a vline
-	{ 
-		draw_line_2x(img, x, y-ry, x, y+ry, color);
-		return;
-	}
-	if (ry==0) // Special case for ry=0 - draw a hline
-	{ 
-		draw_line_2x(img, x-rx, y, x+rx, y, color);
-		return;
-	}
+    int rx = shape->rx;
+    int ry = shape->ry;
 
-	// Draw
 	int oh = 0xffff;
 	int oi = 0xffff;
 	int oj = 0xffff;
@@ -345,14 +641,14 @@ void fill_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
 			int k = (i * ry) / rx;
 			if ((ok != k) && (oj != k) && (k < ry)) 
 			{
-				draw_line_2x(img, x-h, y-k-1, x+h-1, y-k-1, color);
-				draw_line_2x(img, x-h, y+k, x+h-1, y+k, color);
+				add_span(shape, -h, h-1, -k-1);
+				add_span(shape, -h, h-1, k);
 				ok = k;
 			}
 			if ((oj != j) && (ok != j) && (k != j))  
 			{
-				draw_line_2x(img, x-i, y+j, x+i-1, y+j, color);
-				draw_line_2x(img, x-i, y-j-1, x+i-1, y-j-1, color);
+				add_span(shape, -i, i-1, j);
+				add_span(shape, -i, i-1, -j-1);
 				oj = j;
 			}
 			ix = ix + iy / rx;
@@ -372,14 +668,14 @@ void fill_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
 			int k = (i * rx) / ry;
 			if ((oi != i) && (oh != i) && (i < ry)) 
 			{
-				draw_line_2x(img, x-j, y+i, x+j-1, y+i, color);
-				draw_line_2x(img, x-j, y-i-1, x+j-1, y-i-1, color);
+				add_span(shape, -j, j-1, i);
+				add_span(shape, -j, j-1, -i-1);
 				oi = i;
 			}
 			if ((oh != h) && (oi != h) && (i != h)) 
 			{
-				draw_line_2x(img, x-k, y+h, x+k-1, y+h, color);
-				draw_line_2x(img, x-k, y-h-1, x+k-1, y-h-1, color);
+				add_span(shape, -k, k-1, h);
+				add_span(shape, -k, k-1, -h-1);
 				oh = h;
 			}
 			ix = ix + iy / ry;
@@ -388,16 +684,871 @@ void fill_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
 	}
 }
 
+
+// Shapes are looked up and built while the raster ops are emitted, on the thread that holds state_mutex, so the
+// cache is filled before any band starts.  Bands only read the shapes the ops point to, and never touch the cache
+// or retired_shapes.  Shapes evicted from the cache may still be referenced by queued raster ops, so they are only
+// deleted once rasterization is finished.
+#define ELLIPSE_CACHE_SIZE 32
+
+ellipse_shape_t* ellipse_cache[ELLIPSE_CACHE_SIZE];
+unsigned int ellipse_cache_clock = 0;
+std::vector<ellipse_shape_t*> retired_shapes;
+
+static const ellipse_shape_t* get_ellipse_shape(int rx, int ry, bool fill)
+{
+    int lru = 0;
+    for (int i = 0; i < ELLIPSE_CACHE_SIZE; i++)
+    {
+        ellipse_shape_t* shape = ellipse_cache[i];
+        if (!shape)
+        {
+            lru = i;
+            break;
+        }
+        if (shape->rx == rx && shape->ry == ry && shape->fill == fill)
+        {
+            shape->used = ++ellipse_cache_clock;
+            return shape;
+        }
+        if (shape->used < ellipse_cache[lru]->used)
+            lru = i;
+    }
+
+    if (ellipse_cache[lru])
+        retired_shapes.push_back(ellipse_cache[lru]);
+
+    ellipse_shape_t* shape = new ellipse_shape_t;
+    shape->rx = rx;
+    shape->ry = ry;
+    shape->fill = fill;
+    shape->used = ++ellipse_cache_clock;
+    if (fill)
+        build_ellipse_spans(shape);
+    else
+        build_ellipse_outline(shape);
+    ellipse_cache[lru] = shape;
+    return shape;
+}
+
+static void release_retired_shapes()
+{
+    for (size_t i = 0; i < retired_shapes.size(); i++)
+        delete retired_shapes[i];
+    retired_shapes.clear();
+}
+
+template <typename pixel_t, int block> inline
+void _draw_ellipse_shape_2x(GdkImage* img, const clip_t& clip, int x, int y, const ellipse_shape_t* shape, uint16_t c)
+{
+    if (shape->data.empty())
+        return;
+
+    // Shapes entirely outside the clip area are skipped, and shapes entirely inside it need no clipping at all.
+    if (x + shape->maxx < clip.minx || x + shape->minx > clip.maxx || 
+        y + shape->maxy < clip.miny || y + shape->miny > clip.maxy)
+        return;
+    bool inside = x + shape->minx >= clip.minx && x + shape->maxx <= clip.maxx && 
+                  y + shape->miny >= clip.miny && y + shape->maxy <= clip.maxy;
+
+    pixel_t* pixels = (pixel_t*)img->mem;
+    int pitch = img->bpl/sizeof(pixel_t);
+
+    pixel_t pix;
+    to_pixel(&pix, c);
+
+    const int* d = &shape->data[0];
+    const int* end = d + shape->data.size();
+
+    if (shape->fill)
+    {
+        for (; d < end; d += 3)
+        {
+            int x0 = x + d[0];
+            int x1 = x + d[1];
+            int sy = y + d[2];
+            if (!inside)
+            {
+                if (sy < clip.miny || sy > clip.maxy) continue;
+                if (x0 < clip.minx) x0 = clip.minx;
+                if (x1 > clip.maxx) x1 = clip.maxx;
+                if (x0 > x1) continue;
+            }
+
+            fill_span_2x<pixel_t, block>(pixels, pitch, x0, x1, sy, pix);
+        }
+    }
+    else
+    {
+        for (; d < end; d += 2)
+        {
+            int px = x + d[0];
+            int py = y + d[1];
+            if (!inside && (px < clip.minx || py < clip.miny || px > clip.maxx || py > clip.maxy))
+                continue;
+
+            put_pixel_2x<pixel_t, block>(pixels, pitch, px, py, pix);
+        }
+    }
+}
+
+// Sprites are small pre-rendered grayscale images in 2x pixels, drawn through a brightness lookup.  Slots are never
+// freed or reused, so raster ops can refer to sprites while new ones are added.
+#define MAX_SPRITES 256
+
+struct sprite_t
+{
+    int width, height;
+    int originx, originy;
+    std::vector<guint8> pixels;
+};
+
+sprite_t* sprites[MAX_SPRITES];
+int sprite_count = 0;
+
+// brightness_lut[b][v] is v scaled by b/255.
+guint8 brightness_lut[256][256];
+
+// Zero pixels are transparent.  Below render scale 3 sprite pixels map to image pixels one to one, otherwise each image
+// pixel takes the sprite pixel nearest to its center.
+template <typename pixel_t, int block> inline
+void _draw_sprite_2x(GdkImage* img, const clip_t& clip, int x, int y, const sprite_t* sprite, int brightness)
+{
+    int x0 = scale_coord(x);
+    int y0 = scale_coord(y);
+    int x1 = scale_coord(x + sprite->width) - 1;
+    int y1 = scale_coord(y + sprite->height) - 1;
+    if (x0 < clip.minx) x0 = clip.minx;
+    if (y0 < clip.miny) y0 = clip.miny;
+    if (x1 > clip.maxx) x1 = clip.maxx;
+    if (y1 > clip.maxy) y1 = clip.maxy;
+    if (x0 > x1 || y0 > y1)
+        return;
+
+    pixel_t* pixels = (pixel_t*)img->mem;
+    int pitch = img->bpl/sizeof(pixel_t);
+    const guint8* lut = brightness_lut[brightness < 0 ? 0 : brightness > 255 ? 255 : brightness];
+
+    for (int iy = y0; iy <= y1; iy++)
+    {
+        int sy = render_scale <= 2 ? iy - y : (2*iy + 1)*render_scale/4 - y;
+        if (sy < 0) sy = 0;
+        if (sy >= sprite->height) sy = sprite->height-1;
+        const guint8* row = &sprite->pixels[sy*sprite->width];
+
+        for (int ix = x0; ix <= x1; ix++)
+        {
+            int sx = render_scale <= 2 ? ix - x : (2*ix + 1)*render_scale/4 - x;
+            if (sx < 0) sx = 0;
+            if (sx >= sprite->width) sx = sprite->width-1;
+            guint8 v = row[sx];
+            if (!v)
+                continue;
+
+            pixel_t pix;
+            to_pixel(&pix, lut[v]);
+            put_pixel_2x<pixel_t, block>(pixels, pitch, ix, iy, pix);
+        }
+    }
+}
+
+// Raster ops.  Primitives are first projected and converted to 2x points, lines and cached ellipse shapes, which are
+// then rasterized, possibly by several threads each drawing one band of the image.
+enum { RASTER_POINT, RASTER_LINE, RASTER_SHAPE, RASTER_SPRITE };
+
+struct raster_op_t
+{
+    int type;
+    int x0, y0, x1, y1;
+    const ellipse_shape_t* shape;
+    int color;
+};
+
+typedef std::vector<raster_op_t> raster_ops_t;
+
+inline
+void emit_op(raster_ops_t& ops, int type, int x0, int y0, int x1, int y1, const ellipse_shape_t* shape, int color)
+{
+    raster_op_t op = { type, x0, y0, x1, y1, shape, color };
+    ops.push_back(op);
+}
+
+// Emits a line already in image coordinates.
+static void emit_scaled_line(raster_ops_t& ops, int x0, int y0, int x1, int y1, int color)
+{
+    mark_dirty(x0 < x1 ? x0 : x1, y0 < y1 ? y0 : y1, x0 > x1 ? x0 : x1, y0 > y1 ? y0 : y1);
+
+	// Make sure the line runs top to bottom.
+	if (y0 > y1) 
+	{
+		int ty = y0; y0 = y1; y1 = ty;
+		int tx = x0; x0 = x1; x1 = tx;
+	}
+
+    emit_op(ops, RASTER_LINE, x0, y0, x1, y1, NULL, color);
+}
+
+static void emit_line_2x(raster_ops_t& ops, int x0, int y0, int x1, int y1, int color)
+{
+    emit_scaled_line(ops, scale_coord(x0), scale_coord(y0), scale_coord(x1), scale_coord(y1), color);
+}
+
+static void emit_ellipse_2x(raster_ops_t& ops, int x, int y, int rx, int ry, int color, bool fill)
+{
+    x = scale_coord(x);
+    y = scale_coord(y);
+    rx = scale_radius(rx);
+    ry = scale_radius(ry);
+
+    mark_dirty(x-rx-1, y-ry-1, x+rx, y+ry);
+
+	if (rx==0 && ry==0) // Special case - draw a single pixel 
+	{  
+        emit_op(ops, RASTER_POINT, x, y, x, y, NULL, color);
+		return;
+	}
+	if (rx==0)  // Special case for rx=0 - draw a vline
+	{ 
+		emit_scaled_line(ops, x, y-ry, x, y+ry, color);
+		return;
+	}
+	if (ry==0) // Special case for ry=0 - draw a hline
+	{ 
+		emit_scaled_line(ops, x-rx, y, x+rx, y, color);
+		return;
+	}
+
+    emit_op(ops, RASTER_SHAPE, x, y, x, y, get_ellipse_shape(rx, ry, fill), color);
+}
+
+template <typename pixel_t, int block>
+void _rasterize(GdkImage* img, const clip_t& clip, const raster_ops_t& ops)
+{
+    for (size_t i = 0; i < ops.size(); i++)
+    {
+        const raster_op_t& op = ops[i];
+        switch (op.type)
+        {
+        case RASTER_POINT: _draw_point_2x<pixel_t, block>(img, clip, op.x0, op.y0, op.color); break;
+        case RASTER_LINE:  _draw_line_2x<pixel_t, block>(img, clip, op.x0, op.y0, op.x1, op.y1, op.color); break;
+        case RASTER_SHAPE: _draw_ellipse_shape_2x<pixel_t, block>(img, clip, op.x0, op.y0, op.shape, op.color); break;
+        case RASTER_SPRITE: _draw_sprite_2x<pixel_t, block>(img, clip, op.x0, op.y0, sprites[op.x1], op.color); break;
+        }
+    }
+}
+
+static void rasterize(GdkImage* img, const clip_t& clip, const raster_ops_t& ops)
+{
+    if (render_scale == 1)
+    {
+        if (img->depth == 16)
+            _rasterize<depth16_t, 2>(img, clip, ops);
+        else
+            _rasterize<depth24_t, 2>(img, clip, ops);
+    }
+    else
+    {
+        if (img->depth == 16)
+            _rasterize<depth16_t, 1>(img, clip, ops);
+        else
+            _rasterize<depth24_t, 1>(img, clip, ops);
+    }
+}
+
+// Banded rasterization.  The calling thread draws the first band, and a pool of worker threads draws the others.
+// Every band draws all the ops in order, so the result is identical to drawing them in one go.  The ops are complete
+// before the bands start, so the bands share nothing but the read-only ops, shapes and sprites, and their own rows of
+// the image.
+#define MAX_RASTER_THREADS 16
+
+// Bands shorter than this many rows aren't worth a thread.
+#define MIN_BAND_ROWS 16
+
+int raster_threads = 1;
+pthread_t raster_workers[MAX_RASTER_THREADS];
+pthread_mutex_t raster_mutex = PTHREAD_MUTEX_INITIALIZER;
+pthread_cond_t raster_start = PTHREAD_COND_INITIALIZER;
+pthread_cond_t raster_done = PTHREAD_COND_INITIALIZER;
+unsigned int raster_generation = 0;
+int raster_pending = 0;
+bool raster_quit = false;
+
+// The current job, valid while raster_pending is nonzero.
+GdkImage* raster_img = NULL;
+const raster_ops_t* raster_ops = NULL;
+clip_t raster_clip;
+int raster_bands = 1;
+
+inline
+clip_t band_clip(const clip_t& clip, int band, int bands)
+{
+    int rows = clip.maxy - clip.miny + 1;
+    clip_t b = clip;
+    b.miny = clip.miny + rows*band/bands;
+    b.maxy = clip.miny + rows*(band+1)/bands - 1;
+    return b;
+}
+
+static void* raster_worker(void* arg)
+{
+    int band = (int)(long)arg;
+    unsigned int generation = 0;
+
+    pthread_mutex_lock(&raster_mutex);
+    for (;;)
+    {
+        while (raster_generation == generation && !raster_quit)
+            pthread_cond_wait(&raster_start, &raster_mutex);
+        if (raster_quit)
+            break;
+        generation = raster_generation;
+        pthread_mutex_unlock(&raster_mutex);
+
+        if (band < raster_bands)
+            rasterize(raster_img, band_clip(raster_clip, band, raster_bands), *raster_ops);
+
+        pthread_mutex_lock(&raster_mutex);
+        if (--raster_pending == 0)
+            pthread_cond_signal(&raster_done);
+    }
+    pthread_mutex_unlock(&raster_mutex);
+    return NULL;
+}
+
+void set_raster_threads(int n)
+{
+    state_lock_t lock;
+    if (n < 1) n = 1;
+    if (n > MAX_RASTER_THREADS) n = MAX_RASTER_THREADS;
+    if (n == raster_threads)
+        return;
+
+    // Stop the current workers.
+    pthread_mutex_lock(&raster_mutex);
+    raster_quit = true;
+    pthread_cond_broadcast(&raster_start);
+    pthread_mutex_unlock(&raster_mutex);
+    for (int i = 1; i < raster_threads; i++)
+        pthread_join(raster_workers[i], NULL);
+
+    raster_quit = false;
+    raster_generation = 0;
+    raster_threads = 1;
+    for (int i = 1; i < n; i++)
+    {
+        if (pthread_create(&raster_workers[i], NULL, raster_worker, (void*)(long)i) != 0)
+            break;
+        raster_threads = i+1;
+    }
+}
+
+int get_raster_threads()
+{
+    state_lock_t lock;
+    return raster_threads;
+}
+
+static void rasterize_banded(GdkImage* img, const raster_ops_t& ops)
+{
+    clip_t clip = image_clip(img);
+
+    int bands = raster_threads;
+    int rows = clip.maxy - clip.miny + 1;
+    if (rows < bands*MIN_BAND_ROWS)
+        bands = rows/MIN_BAND_ROWS;
+    if (bands <= 1)
+    {
+        rasterize(img, clip, ops);
+        return;
+    }
+
+    pthread_mutex_lock(&raster_mutex);
+    raster_img = img;
+    raster_ops = &ops;
+    raster_clip = clip;
+    raster_bands = bands;
+    raster_pending = raster_threads-1;
+    raster_generation++;
+    pthread_cond_broadcast(&raster_start);
+    pthread_mutex_unlock(&raster_mutex);
+
+    rasterize(img, band_clip(clip, 0, bands), ops);
+
+    pthread_mutex_lock(&raster_mutex);
+    while (raster_pending > 0)
+        pthread_cond_wait(&raster_done, &raster_mutex);
+    pthread_mutex_unlock(&raster_mutex);
+}
+
+// Draws a few ops immediately, for the single primitive entry points.
+static void draw_ops(GdkImage* img, const raster_ops_t& ops)
+{
+    rasterize(img, image_clip(img), ops);
+    release_retired_shapes();
+}
+
+void draw_point_2x(GdkImage* img, int x, int y, uint16_t c)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    x = scale_coord(x);
+    y = scale_coord(y);
+    emit_op(ops, RASTER_POINT, x, y, x, y, NULL, c);
+    draw_ops(img, ops);
+}
+
+void draw_line_2x(GdkImage* img, int x0, int y0, int x1, int y1, int color)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_line_2x(ops, x0, y0, x1, y1, color);
+    draw_ops(img, ops);
+}
+
+void draw_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_ellipse_2x(ops, x, y, rx, ry, color, false);
+    draw_ops(img, ops);
+}
+
+void fill_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_ellipse_2x(ops, x, y, rx, ry, color, true);
+    draw_ops(img, ops);
+}
+
+// HUD font, 5x7 glyphs for the printable ASCII characters.  One byte per column, with the top row in the low bit.
+static const guint8 hud_font[95][5] = {
+    { 0x00, 0x00, 0x00, 0x00, 0x00 }, // ' '
+    { 0x00, 0x00, 0x5f, 0x00, 0x00 }, // '!'
+    { 0x00, 0x07, 0x00, 0x07, 0x00 }, // '"'
+    { 0x14, 0x7f, 0x14, 0x7f, 0x14 }, // '#'
+    { 0x24, 0x2a, 0x7f, 0x2a, 0x12 }, // '$'
+    { 0x23, 0x13, 0x08, 0x64, 0x62 }, // '%'
+    { 0x36, 0x49, 0x55, 0x22, 0x50 }, // '&'
+    { 0x00, 0x05, 0x03, 0x00, 0x00 }, // "'"
+    { 0x00, 0x1c, 0x22, 0x41, 0x00 }, // '('
+    { 0x00, 0x41, 0x22, 0x1c, 0x00 }, // ')'
+    { 0x14, 0x08, 0x3e, 0x08, 0x14 }, // '*'
+    { 0x08, 0x08, 0x3e, 0x08, 0x08 }, // '+'
+    { 0x00, 0x50, 0x30, 0x00, 0x00 }, // ','
+    { 0x08, 0x08, 0x08, 0x08, 0x08 }, // '-'
+    { 0x00, 0x60, 0x60, 0x00, 0x00 }, // '.'
+    { 0x20, 0x10, 0x08, 0x04, 0x02 }, // '/'
+    { 0x3e, 0x51, 0x49, 0x45, 0x3e }, // '0'
+    { 0x00, 0x42, 0x7f, 0x40, 0x00 }, // '1'
+    { 0x42, 0x61, 0x51, 0x49, 0x46 }, // '2'
+    { 0x21, 0x41, 0x45, 0x4b, 0x31 }, // '3'
+    { 0x18, 0x14, 0x12, 0x7f, 0x10 }, // '4'
+    { 0x27, 0x45, 0x45, 0x45, 0x39 }, // '5'
+    { 0x3c, 0x4a, 0x49, 0x49, 0x30 }, // '6'
+    { 0x01, 0x71, 0x09, 0x05, 0x03 }, // '7'
+    { 0x36, 0x49, 0x49, 0x49, 0x36 }, // '8'
+    { 0x06, 0x49, 0x49, 0x29, 0x1e }, // '9'
+    { 0x00, 0x36, 0x36, 0x00, 0x00 }, // ':'
+    { 0x00, 0x56, 0x36, 0x00, 0x00 }, // ';'
+    { 0x08, 0x14, 0x22, 0x41, 0x00 }, // '<'
+    { 0x14, 0x14, 0x14, 0x14, 0x14 }, // '='
+    { 0x00, 0x41, 0x22, 0x14, 0x08 }, // '>'
+    { 0x02, 0x01, 0x51, 0x09, 0x06 }, // '?'
+    { 0x32, 0x49, 0x79, 0x41, 0x3e }, // '@'
+    { 0x7e, 0x11, 0x11, 0x11, 0x7e }, // 'A'
+    { 0x7f, 0x49, 0x49, 0x49, 0x36 }, // 'B'
+    { 0x3e, 0x41, 0x41, 0x41, 0x22 }, // 'C'
+    { 0x7f, 0x41, 0x41, 0x22, 0x1c }, // 'D'
+    { 0x7f, 0x49, 0x49, 0x49, 0x41 }, // 'E'
+    { 0x7f, 0x09, 0x09, 0x09, 0x01 }, // 'F'
+    { 0x3e, 0x41, 0x49, 0x49, 0x7a }, // 'G'
+    { 0x7f, 0x08, 0x08, 0x08, 0x7f }, // 'H'
+    { 0x00, 0x41, 0x7f, 0x41, 0x00 }, // 'I'
+    { 0x20, 0x40, 0x41, 0x3f, 0x01 }, // 'J'
+    { 0x7f, 0x08, 0x14, 0x22, 0x41 }, // 'K'
+    { 0x7f, 0x40, 0x40, 0x40, 0x40 }, // 'L'
+    { 0x7f, 0x02, 0x0c, 0x02, 0x7f }, // 'M'
+    { 0x7f, 0x04, 0x08, 0x10, 0x7f }, // 'N'
+    { 0x3e, 0x41, 0x41, 0x41, 0x3e }, // 'O'
+    { 0x7f, 0x09, 0x09, 0x09, 0x06 }, // 'P'
+    { 0x3e, 0x41, 0x51, 0x21, 0x5e }, // 'Q'
+    { 0x7f, 0x09, 0x19, 0x29, 0x46 }, // 'R'
+    { 0x46, 0x49, 0x49, 0x49, 0x31 }, // 'S'
+    { 0x01, 0x01, 0x7f, 0x01, 0x01 }, // 'T'
+    { 0x3f, 0x40, 0x40, 0x40, 0x3f }, // 'U'
+    { 0x1f, 0x20, 0x40, 0x20, 0x1f }, // 'V'
+    { 0x3f, 0x40, 0x38, 0x40, 0x3f }, // 'W'
+    { 0x63, 0x14, 0x08, 0x14, 0x63 }, // 'X'
+    { 0x07, 0x08, 0x70, 0x08, 0x07 }, // 'Y'
+    { 0x61, 0x51, 0x49, 0x45, 0x43 }, // 'Z'
+    { 0x00, 0x7f, 0x41, 0x41, 0x00 }, // '['
+    { 0x02, 0x04, 0x08, 0x10, 0x20 }, // '\\'
+    { 0x00, 0x41, 0x41, 0x7f, 0x00 }, // ']'
+    { 0x04, 0x02, 0x01, 0x02, 0x04 }, // '^'
+    { 0x40, 0x40, 0x40, 0x40, 0x40 }, // '_'
+    { 0x00, 0x01, 0x02, 0x04, 0x00 }, // '`'
+    { 0x20, 0x54, 0x54, 0x54, 0x78 }, // 'a'
+    { 0x7f, 0x48, 0x44, 0x44, 0x38 }, // 'b'
+    { 0x38, 0x44, 0x44, 0x44, 0x20 }, // 'c'
+    { 0x38, 0x44, 0x44, 0x48, 0x7f }, // 'd'
+    { 0x38, 0x54, 0x54, 0x54, 0x18 }, // 'e'
+    { 0x08, 0x7e, 0x09, 0x01, 0x02 }, // 'f'
+    { 0x0c, 0x52, 0x52, 0x52, 0x3e }, // 'g'
+    { 0x7f, 0x08, 0x04, 0x04, 0x78 }, // 'h'
+    { 0x00, 0x44, 0x7d, 0x40, 0x00 }, // 'i'
+    { 0x20, 0x40, 0x44, 0x3d, 0x00 }, // 'j'
+    { 0x7f, 0x10, 0x28, 0x44, 0x00 }, // 'k'
+    { 0x00, 0x41, 0x7f, 0x40, 0x00 }, // 'l'
+    { 0x7c, 0x04, 0x18, 0x04, 0x78 }, // 'm'
+    { 0x7c, 0x08, 0x04, 0x04, 0x78 }, // 'n'
+    { 0x38, 0x44, 0x44, 0x44, 0x38 }, // 'o'
+    { 0x7c, 0x14, 0x14, 0x14, 0x08 }, // 'p'
+    { 0x08, 0x14, 0x14, 0x18, 0x7c }, // 'q'
+    { 0x7c, 0x08, 0x04, 0x04, 0x08 }, // 'r'
+    { 0x48, 0x54, 0x54, 0x54, 0x20 }, // 's'
+    { 0x04, 0x3f, 0x44, 0x40, 0x20 }, // 't'
+    { 0x3c, 0x40, 0x40, 0x20, 0x7c }, // 'u'
+    { 0x1c, 0x20, 0x40, 0x20, 0x1c }, // 'v'
+    { 0x3c, 0x40, 0x30, 0x40, 0x3c }, // 'w'
+    { 0x44, 0x28, 0x10, 0x28, 0x44 }, // 'x'
+    { 0x0c, 0x50, 0x50, 0x50, 0x3c }, // 'y'
+    { 0x44, 0x64, 0x54, 0x4c, 0x44 }, // 'z'
+    { 0x00, 0x08, 0x36, 0x41, 0x00 }, // '{'
+    { 0x00, 0x00, 0x7f, 0x00, 0x00 }, // '|'
+    { 0x00, 0x41, 0x36, 0x08, 0x00 }, // '}'
+    { 0x08, 0x04, 0x08, 0x10, 0x08 }, // '~'
+};
+
+// HUD icons, one word per row with the leftmost column in the low bit.  The X is the polygon (0,0) (0.3,0) (0.5,0.3)
+// (0.7,0) (1,0) (0.7,0.5) (1,1) (0.7,1) (0.5,0.6) (0.3,1) (0,1) (0.3,0.5) sampled at pixel centers.
+static const guint16 hud_icons[HUD_ICON_MAX][HUD_ICON_SIZE] = {
+    { 0x387, 0x1ce, 0x0fe, 0x0fc, 0x078, 0x078, 0x0fc, 0x0ce, 0x1ce, 0x387 }, // HUD_ICON_X
+    { 0x387, 0x14a, 0x0b2, 0x084, 0x048, 0x048, 0x0b4, 0x0ca, 0x14a, 0x387 }, // HUD_ICON_X_OUTLINE
+};
+
+// Emits a bitmap as one horizontal span per run of set bits in each row.  Every bitmap pixel covers scale x scale 2x
+// pixels, and at least one image pixel.
+static void emit_bitmap_2x(raster_ops_t& ops, int x, int y, const guint16* rows, int height, int scale, int color)
+{
+    for (int r = 0; r < height; r++)
+    {
+        unsigned int bits = rows[r];
+        if (!bits)
+            continue;
+
+        int y0 = scale_coord(y + r*scale);
+        int y1 = scale_coord(y + (r+1)*scale) - 1;
+        if (y1 < y0) y1 = y0;
+
+        int c = 0;
+        while (bits >> c)
+        {
+            if (!(bits >> c & 1))
+            {
+                c++;
+                continue;
+            }
+            int end = c;
+            while (bits >> end & 1)
+                end++;
+
+            int x0 = scale_coord(x + c*scale);
+            int x1 = scale_coord(x + end*scale) - 1;
+            if (x1 < x0) x1 = x0;
+            for (int sy = y0; sy <= y1; sy++)
+                emit_scaled_line(ops, x0, sy, x1, sy, color);
+            c = end;
+        }
+    }
+}
+
+// Characters outside the font are drawn as '?'.
+static void emit_text_2x(raster_ops_t& ops, int x, int y, const int* chars, int length, int scale, int color)
+{
+    if (scale < 1)
+        return;
+
+    for (int i = 0; i < length; i++, x += HUD_CELL_WIDTH*scale)
+    {
+        int ch = chars[i];
+        if (ch == ' ')
+            continue;
+        if (ch < 32 || ch > 126)
+            ch = '?';
+
+        const guint8* cols = hud_font[ch - 32];
+        guint16 rows[HUD_GLYPH_HEIGHT];
+        for (int r = 0; r < HUD_GLYPH_HEIGHT; r++)
+        {
+            rows[r] = 0;
+            for (int c = 0; c < 5; c++)
+                rows[r] |= (cols[c] >> r & 1) << c;
+        }
+        emit_bitmap_2x(ops, x, y, rows, HUD_GLYPH_HEIGHT, scale, color);
+    }
+}
+
+static void emit_icon_2x(raster_ops_t& ops, int x, int y, int icon, int scale, int color)
+{
+    if (icon < 0 || icon >= HUD_ICON_MAX || scale < 1)
+        return;
+
+    emit_bitmap_2x(ops, x, y, hud_icons[icon], HUD_ICON_SIZE, scale, color);
+}
+
+void draw_text_2x(GdkImage* img, int x, int y, const char* text, int scale, int color)
+{
+    state_lock_t lock;
+    std::vector<int> chars;
+    for (const char* p = text; *p; p++)
+        chars.push_back((unsigned char)*p);
+
+    raster_ops_t ops;
+    emit_text_2x(ops, x, y, chars.empty() ? NULL : &chars[0], chars.size(), scale, color);
+    draw_ops(img, ops);
+}
+
+void draw_icon_2x(GdkImage* img, int x, int y, int icon, int scale, int color)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_icon_2x(ops, x, y, icon, scale, color);
+    draw_ops(img, ops);
+}
+
+// Adds a sprite and returns its id, or -1 when there are no free slots.  pixels must hold width*height values.
+static int new_sprite(const guint8* pixels, int width, int height, int originx, int originy)
+{
+    if (sprite_count >= MAX_SPRITES || width <= 0 || height <= 0)
+        return -1;
+
+    sprite_t* sprite = new sprite_t;
+    sprite->width = width;
+    sprite->height = height;
+    sprite->originx = originx;
+    sprite->originy = originy;
+    sprite->pixels.assign(pixels, pixels + width*height);
+    sprites[sprite_count] = sprite;
+    return sprite_count++;
+}
+
+static int new_ellipse_sprite(int r, bool fill)
+{
+    ellipse_shape_t shape;
+    shape.rx = shape.ry = r;
+    shape.fill = fill;
+    if (fill)
+        build_ellipse_spans(&shape);
+    else
+        build_ellipse_outline(&shape);
+
+    int w = shape.maxx - shape.minx + 1;
+    int h = shape.maxy - shape.miny + 1;
+    std::vector<guint8> pixels(w*h, 0);
+    const std::vector<int>& d = shape.data;
+    if (fill)
+    {
+        for (size_t i = 0; i < d.size(); i += 3)
+            for (int x = d[i]; x <= d[i+1]; x++)
+                pixels[(d[i+2] - shape.miny)*w + x - shape.minx] = 255;
+    }
+    else
+    {
+        for (size_t i = 0; i < d.size(); i += 2)
+            pixels[(d[i+1] - shape.miny)*w + d[i] - shape.minx] = 255;
+    }
+    return new_sprite(&pixels[0], w, h, -shape.minx, -shape.miny);
+}
+
+// Bitmap rows with the leftmost column in the low bit, each bit scale x scale sprite pixels.
+static int new_bitmap_sprite(const guint16* rows, int width, int height, int scale)
+{
+    int w = width*scale;
+    int h = height*scale;
+    std::vector<guint8> pixels(w*h, 0);
+    for (int y = 0; y < h; y++)
+        for (int x = 0; x < w; x++)
+            if (rows[y/scale] >> (x/scale) & 1)
+                pixels[y*w + x] = 255;
+    return new_sprite(&pixels[0], w, h, w/2, h/2);
+}
+
+static void build_sprites()
+{
+    for (int b = 0; b < 256; b++)
+        for (int v = 0; v < 256; v++)
+            brightness_lut[b][v] = (b*v + 127)/255;
+
+    // The built in sprites, in the order of their ids.
+    new_ellipse_sprite(SPRITE_PIP_RADIUS, true);
+    new_ellipse_sprite(SPRITE_PIP_RADIUS, false);
+    new_bitmap_sprite(hud_icons[HUD_ICON_X], HUD_ICON_SIZE, HUD_ICON_SIZE, 1);
+    new_bitmap_sprite(hud_icons[HUD_ICON_X_OUTLINE], HUD_ICON_SIZE, HUD_ICON_SIZE, 1);
+    for (int digit = 0; digit < 10; digit++)
+    {
+        const guint8* cols = hud_font['0' + digit - 32];
+        guint16 rows[HUD_GLYPH_HEIGHT];
+        for (int r = 0; r < HUD_GLYPH_HEIGHT; r++)
+        {
+            rows[r] = 0;
+            for (int c = 0; c < 5; c++)
+                rows[r] |= (cols[c] >> r & 1) << c;
+        }
+        new_bitmap_sprite(rows, 5, HUD_GLYPH_HEIGHT, SPRITE_DIGIT_SCALE);
+    }
+}
+
+// The atlas is built on first use, which may be on a rasterizing thread.
+pthread_once_t sprites_once = PTHREAD_ONCE_INIT;
+
+inline
+void init_sprites()
+{
+    pthread_once(&sprites_once, build_sprites);
+}
+
+int add_sprite(const unsigned char* pixels, int count, int width, int height, int originx, int originy)
+{
+    state_lock_t lock;
+    init_sprites();
+    if (width <= 0 || height <= 0 || count < width*height)
+        return -1;
+    return new_sprite(pixels, width, height, originx, originy);
+}
+
+int get_sprite_count()
+{
+    state_lock_t lock;
+    init_sprites();
+    return sprite_count;
+}
+
+static void emit_sprite_2x(raster_ops_t& ops, int x, int y, int id, int brightness)
+{
+    init_sprites();
+    if (id < 0 || id >= sprite_count)
+        return;
+
+    const sprite_t* sprite = sprites[id];
+    x -= sprite->originx;
+    y -= sprite->originy;
+    mark_dirty(scale_coord(x), scale_coord(y), scale_coord(x + sprite->width) - 1, scale_coord(y + sprite->height) - 1);
+    emit_op(ops, RASTER_SPRITE, x, y, id, 0, NULL, brightness);
+}
+
+void blit_sprite(GdkImage* img, int id, int x, int y, int brightness)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_sprite_2x(ops, x, y, id, brightness);
+    draw_ops(img, ops);
+}
+
 int actual_screen_width = 1200;
 int actual_screen_height = 825;
 
 int viewport_scale = to_fixed(100);
 
+// Perspective divides by z + viewport_scale, which only depends on depth.  For depths from 0 to projection_depth
+// the reciprocals are kept in a table, so projecting takes a multiply and a shift.  depth_recip[z] is
+// (2^32-1)/(z + viewport_scale), rounded down.
+#define MAX_PROJECTION_DEPTH (4000<<8)
+
+// The table is built by set_3d_params, and covers the deepest of the default stages until then.
+int projection_depth = 500<<8;
+std::vector<guint32> depth_recip;
+
+static void build_projection_table()
+{
+    depth_recip.resize(projection_depth+1);
+    for (int z = 0; z <= projection_depth; z++)
+    {
+        int d = z + viewport_scale;
+        depth_recip[z] = d > 0 ? 0xffffffffu / (guint32)d : 0;
+    }
+}
+
+void set_projection_depth(int depth)
+{
+    state_lock_t lock;
+    if (depth < 0) depth = 0;
+    if (depth > MAX_PROJECTION_DEPTH) depth = MAX_PROJECTION_DEPTH;
+    if (depth == projection_depth && (int)depth_recip.size() == depth+1)
+        return;
+
+    projection_depth = depth;
+    build_projection_table();
+}
+
+int get_projection_depth()
+{
+    state_lock_t lock;
+    return projection_depth;
+}
+
 void set_3d_params(int w, int h, int s)
 {
+    state_lock_t lock;
 	actual_screen_width = w;
 	actual_screen_height = h;
 	viewport_scale = s;
+    build_projection_table();
+
+    // The projection changed, so the cached background is stale.
+    _invalidate_background();
+}
+
+// a*viewport_scale/(z + viewport_scale), rounded towards zero like the division it replaces.
+inline
+int perspective(int a, int z)
+{
+    if (z >= 0 && z < (int)depth_recip.size() && viewport_scale > 0)
+    {
+        guint32 u = a < 0 ? -a : a;
+        guint64 n = (guint64)u * (guint32)viewport_scale;
+
+        // Products that fit an int are the ones the division handled.  The reciprocal is at most 2 too small 
+        // then, which is corrected exactly.
+        if (n <= 0x7fffffff)
+        {
+            guint32 d = z + viewport_scale;
+            guint32 q = (guint32)((n * depth_recip[z]) >> 32);
+            while ((guint64)(q+1)*d <= n)
+                q++;
+            return a < 0 ? -(int)q : (int)q;
+        }
+    }
+    return a * viewport_scale / (z + viewport_scale);
+}
+
+int projection_factor(int z)
+{
+    state_lock_t lock;
+    return perspective(1<<16, z);
+}
+
+void get_dirty_rect(int* x, int* y, int* w, int* h)
+{
+    state_lock_t lock;
+    *x = *y = *w = *h = 0;
+    if (dirty_x0 > dirty_x1)
+        return;
+
+    // Screen pixels per image coordinate.
+    int unit = render_scale == 1 ? 2 : render_scale;
+
+    int x0 = dirty_x0*unit < 0 ? 0 : dirty_x0*unit;
+    int y0 = dirty_y0*unit < 0 ? 0 : dirty_y0*unit;
+    int x1 = (dirty_x1+1)*unit > actual_screen_width ? actual_screen_width : (dirty_x1+1)*unit;
+    int y1 = (dirty_y1+1)*unit > actual_screen_height ? actual_screen_height : (dirty_y1+1)*unit;
+    if (x1 <= x0 || y1 <= y0)
+        return;
+
+    *x = x0;
+    *y = y0;
+    *w = x1 - x0;
+    *h = y1 - y0;
 }
 
 int to_fixed(int x)
@@ -405,70 +1556,198 @@ int to_fixed(int x)
 	return x<<8;
 }
 
+inline
+int _project_x(int x, int y, int z)
+{
+    return (to_fixed(50) + perspective(x - to_fixed(50), z)) * actual_screen_width/100 / 256;
+}
+
+inline
+int _project_y(int x, int y, int z)
+{
+    return (to_fixed(50) + perspective(y - to_fixed(50), z)) * actual_screen_height/100 / 256;
+}
+
 int project_x(int x, int y, int z)
 {
-    return (to_fixed(50) + ( x - to_fixed(50) ) * viewport_scale / ( z + viewport_scale )) * actual_screen_width/100 / 256;
+    state_lock_t lock;
+    return _project_x(x, y, z);
 }
 
 int project_y(int x, int y, int z)
 {
-    return (to_fixed(50) + ( y - to_fixed(50) ) * viewport_scale / ( z + viewport_scale )) * actual_screen_height/100 / 256;
+    state_lock_t lock;
+    return _project_y(x, y, z);
 }
 
-void draw_line_3d(GdkImage* img, int x0, int y0, int z0, int x1, int y1, int z1, float c)
+int project_points(const int* points, int count, int* out, int outcount)
 {
-    x0 = project_x(x0, y0, z0)/2;
-    y0 = project_y(x0, y0, z0)/2;
-    x1 = project_x(x1, y1, z1)/2;
-    y1 = project_y(x1, y1, z1)/2;
+    state_lock_t lock;
+    int n = count/3 < outcount/2 ? count/3 : outcount/2;
+    for (int i = 0; i < n; i++, points += 3, out += 2)
+    {
+        out[0] = _project_x(points[0], points[1], points[2]);
+        out[1] = _project_y(points[0], points[1], points[2]);
+    }
+    return n;
+}
+
 
-    draw_line_2x(img, x0, y0, x1, y1, int(c*255.0));
+static void emit_line_3d(raster_ops_t& ops, int x0, int y0, int z0, int x1, int y1, int z1, int color)
+{
+    x0 = _project_x(x0, y0, z0)/2;
+    y0 = _project_y(x0, y0, z0)/2;
+    x1 = _project_x(x1, y1, z1)/2;
+    y1 = _project_y(x1, y1, z1)/2;
+
+    emit_line_2x(ops, x0, y0, x1, y1, color);
 }
 
-void draw_rect_3d(GdkImage* img, int x0, int y0, int x1, int y1, int depth, float c)
+static void emit_rect_3d(raster_ops_t& ops, int x0, int y0, int x1, int y1, int depth, int color)
 {
-    x0 = (project_x(x0, y0, depth) + 1)/2;
-    y0 = (project_y(x0, y0, depth) + 1)/2;
-    x1 = (project_x(x1, y1, depth) - 1)/2;
-    y1 = (project_y(x1, y1, depth) - 1)/2;
+    x0 = (_project_x(x0, y0, depth) + 1)/2;
+    y0 = (_project_y(x0, y0, depth) + 1)/2;
+    x1 = (_project_x(x1, y1, depth) - 1)/2;
+    y1 = (_project_y(x1, y1, depth) - 1)/2;
 
-    draw_line_2x(img, x0, y0, x1, y0, int(c*255.0));
-    draw_line_2x(img, x1, y0, x1, y1, int(c*255.0));
-    draw_line_2x(img, x1, y1, x0, y1, int(c*255.0));
-    draw_line_2x(img, x0, y1, x0, y0, int(c*255.0));
+    emit_line_2x(ops, x0, y0, x1, y0, color);
+    emit_line_2x(ops, x1, y0, x1, y1, color);
+    emit_line_2x(ops, x1, y1, x0, y1, color);
+    emit_line_2x(ops, x0, y1, x0, y0, color);
 }
 
-void draw_circle_3d(GdkImage* img, int x, int y, int z, int radius, float c)
+static void emit_circle_3d(raster_ops_t& ops, int x, int y, int z, int radius, int color, bool fill)
 {
-    int r = (project_x(x+radius, y, z)-project_x(x, y, z))/2;
+    int r = (_project_x(x+radius, y, z)-_project_x(x, y, z))/2;
     if (r < 1) return;
 
-    x = project_x(x, y, z)/2;
-    y = project_y(x, y, z)/2;
+    x = _project_x(x, y, z)/2;
+    y = _project_y(x, y, z)/2;
 
-    draw_ellipse_2x(img, x, y, r, r, int(c*255.0));
+    emit_ellipse_2x(ops, x, y, r, r, color, fill);
 }
 
-void fill_circle_3d(GdkImage* img, int x, int y, int z, int radius, float c)
+static void emit_ellipse_3d(raster_ops_t& ops, int x, int y, int z, int rx, int ry, int color)
+{
+    rx = (_project_x(x+rx, y, z)-_project_x(x, y, z))/2;
+    ry = (_project_y(x, y+ry, z)-_project_y(x, y, z))/2;
+    if (rx < 1 || ry < 1) return;
+
+    x = _project_x(x, y, z)/2;
+    y = _project_y(x, y, z)/2;
+
+    emit_ellipse_2x(ops, x, y, rx, ry, color, false);
+}
+
+void draw_line_3d(GdkImage* img, int x0, int y0, int z0, int x1, int y1, int z1, float c)
 {
-    int r = (project_x(x+radius, y, z)-project_x(x, y, z))/2;
-	if (r < 1) return;
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_line_3d(ops, x0, y0, z0, x1, y1, z1, int(c*255.0));
+    draw_ops(img, ops);
+}
 
-    x = project_x(x, y, z)/2;
-    y = project_y(x, y, z)/2;
+void draw_rect_3d(GdkImage* img, int x0, int y0, int x1, int y1, int depth, float c)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_rect_3d(ops, x0, y0, x1, y1, depth, int(c*255.0));
+    draw_ops(img, ops);
+}
 
-    fill_ellipse_2x(img, x, y, r, r, int(c*255.0));
+void draw_circle_3d(GdkImage* img, int x, int y, int z, int radius, float c)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_circle_3d(ops, x, y, z, radius, int(c*255.0), false);
+    draw_ops(img, ops);
+}
+
+void fill_circle_3d(GdkImage* img, int x, int y, int z, int radius, float c)
+{
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_circle_3d(ops, x, y, z, radius, int(c*255.0), true);
+    draw_ops(img, ops);
 }
 
 void draw_ellipse_3d(GdkImage* img, int x, int y, int z, int rx, int ry, float c)
 {
-    rx = (project_x(x+rx, y, z)-project_x(x, y, z))/2;
-    ry = (project_y(x, y+ry, z)-project_y(x, y, z))/2;
-    if (rx < 1 || ry < 1) return;
+    state_lock_t lock;
+    raster_ops_t ops;
+    emit_ellipse_3d(ops, x, y, z, rx, ry, int(c*255.0));
+    draw_ops(img, ops);
+}
 
-    x = project_x(x, y, z)/2;
-    y = project_y(x, y, z)/2;
+// Number of arguments following each draw list opcode, indexed by opcode.
+static const int draw_list_args[DRAW_MAX] = {
+    0, // DRAW_END
+    5, // DRAW_LINE_2X
+    5, // DRAW_ELLIPSE_2X
+    5, // DRAW_FILL_ELLIPSE_2X
+    7, // DRAW_LINE_3D
+    6, // DRAW_RECT_3D
+    5, // DRAW_CIRCLE_3D
+    5, // DRAW_FILL_CIRCLE_3D
+    6, // DRAW_ELLIPSE_3D
+    5, // DRAW_TEXT_2X, followed by as many characters as its length
+    5, // DRAW_ICON_2X
+    4, // DRAW_SPRITE_2X
+};
+
+// Reused between frames to avoid reallocating.
+raster_ops_t draw_list_ops;
+
+static void _draw_list(GdkImage* img, const int* cmds, int count)
+{
+    raster_ops_t& ops = draw_list_ops;
+    ops.clear();
 
-    draw_ellipse_2x(img, x, y, rx, ry, int(c*255.0));
+    const int* end = cmds + count;
+    while (cmds < end)
+    {
+        int op = cmds[0];
+        if (op <= DRAW_END || op >= DRAW_MAX || cmds + 1 + draw_list_args[op] > end)
+            break;
+
+        const int* a = cmds + 1;
+        int args = draw_list_args[op];
+        if (op == DRAW_TEXT_2X)
+        {
+            if (a[4] < 0 || a[4] > end - (a + args))
+                break;
+            args += a[4];
+        }
+
+        switch (op)
+        {
+        case DRAW_LINE_2X:        emit_line_2x(ops, a[0], a[1], a[2], a[3], a[4]); break;
+        case DRAW_ELLIPSE_2X:     emit_ellipse_2x(ops, a[0], a[1], a[2], a[3], a[4], false); break;
+        case DRAW_FILL_ELLIPSE_2X: emit_ellipse_2x(ops, a[0], a[1], a[2], a[3], a[4], true); break;
+        case DRAW_LINE_3D:        emit_line_3d(ops, a[0], a[1], a[2], a[3], a[4], a[5], a[6]); break;
+        case DRAW_RECT_3D:        emit_rect_3d(ops, a[0], a[1], a[2], a[3], a[4], a[5]); break;
+        case DRAW_CIRCLE_3D:      emit_circle_3d(ops, a[0], a[1], a[2], a[3], a[4], false); break;
+        case DRAW_FILL_CIRCLE_3D: emit_circle_3d(ops, a[0], a[1], a[2], a[3], a[4], true); break;
+        case DRAW_ELLIPSE_3D:     emit_ellipse_3d(ops, a[0], a[1], a[2], a[3], a[4], a[5]); break;
+        case DRAW_TEXT_2X:        emit_text_2x(ops, a[0], a[1], a + 5, a[4], a[2], a[3]); break;
+        case DRAW_ICON_2X:        emit_icon_2x(ops, a[0], a[1], a[2], a[3], a[4]); break;
+        case DRAW_SPRITE_2X:      emit_sprite_2x(ops, a[0], a[1], a[2], a[3]); break;
+        }
+
+        cmds += 1 + args;
+    }
+
+    rasterize_banded(img, ops);
+    release_retired_shapes();
 }
 
+void draw_list(GdkImage* img, const int* cmds, int count)
+{
+    // No Python objects are touched from here on, so other Python threads may run meanwhile.  The lock is released
+    // before the GIL is taken back, as the other threads may be waiting for it while holding the GIL.
+    Py_BEGIN_ALLOW_THREADS
+    pthread_mutex_lock(&state_mutex);
+    _draw_list(img, cmds, count);
+    pthread_mutex_unlock(&state_mutex);
+    Py_END_ALLOW_THREADS
+}
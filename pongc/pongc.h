@@ -31,17 +31,113 @@ void draw_line_2x(GdkImage* img, int x0, int y0, int x1, int y1, int color);
 void draw_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color);
 void fill_ellipse_2x(GdkImage* img, int x, int y, int rx, int ry, int color);
 
+// HUD
+// A built in bitmap font and icons for in-game text and score displays.  Glyphs are 5x7 on a 6x8 cell and icons are
+// 10x10, all scaled up by a whole number of 2x pixels and drawn with their top left corner at (x, y).
+enum {
+    HUD_CELL_WIDTH = 6,
+    HUD_CELL_HEIGHT = 8,
+    HUD_GLYPH_HEIGHT = 7,
+    HUD_ICON_SIZE = 10
+};
+
+enum {
+    HUD_ICON_X,             // The X of the score screen, filled
+    HUD_ICON_X_OUTLINE,     // The X of the score screen, outlined
+    HUD_ICON_MAX
+};
+
+void draw_text_2x(GdkImage* img, int x, int y, const char* text, int scale, int color);
+void draw_icon_2x(GdkImage* img, int x, int y, int icon, int scale, int color);
+
+// Sprites
+// Small pre-rendered grayscale images in 2x pixels, drawn with their origin at (x, y) and their pixels scaled by a
+// brightness of 0-255, clamped to that range.  Zero pixels are transparent.  The built in sprites come first, and add_sprite adds one from
+// a buffer of width*height bytes, returning its id or -1.
+enum {
+    SPRITE_PIP,             // Score pips, as drawn by fill_ellipse_2x and draw_ellipse_2x
+    SPRITE_PIP_OUTLINE,
+    SPRITE_X,               // The HUD icons
+    SPRITE_X_OUTLINE,
+    SPRITE_DIGIT_0,         // Digits 0-9 of the HUD font, in order
+    SPRITE_BUILTIN_MAX = SPRITE_DIGIT_0 + 10,
+
+    SPRITE_PIP_RADIUS = 6,
+    SPRITE_DIGIT_SCALE = 2
+};
+
+int add_sprite(const unsigned char* pixels, int count, int width, int height, int originx, int originy);
+int get_sprite_count();
+void blit_sprite(GdkImage* img, int id, int x, int y, int brightness);
+
+// Render scale
+// Screen pixels per image pixel, from 1 to 4.  Above 1, images are that many times smaller than the screen and
+// primitives scale their 2x coordinates down to them.  upscale_image then scales an area of the screen back up.
+void set_render_scale(int scale);
+int get_render_scale();
+void upscale_image(GdkImage* src, GdkImage* dst, int x, int y, int w, int h);
+
+// Background cache
+// Keeps a copy of a fully rendered static layer, so frames can start from a copy instead of redrawing it.
+// Rectangles are in screen pixels.
+void store_background(GdkImage* img, int key);
+int restore_background(GdkImage* img, int key);
+void invalidate_background();
+int restore_background_rect(GdkImage* img, int key, int x, int y, int w, int h);
+
+// Dirty rectangles
+// Tracks the screen space bounds of everything drawn since the last begin_dirty call.
+void begin_dirty();
+void get_dirty_rect(int* x, int* y, int* w, int* h);
+
 // 3D primitives
 void set_3d_params(int actual_screen_width, int actual_screen_height, int viewport_scale);
 
 int to_fixed(int x);
 int project_x(int x, int y, int z);
 int project_y(int x, int y, int z);
+
+// Projection is fastest for depths from 0 to the projection depth, which should cover the stage.
+void set_projection_depth(int depth);
+int get_projection_depth();
+// viewport_scale/(z + viewport_scale) in 16.16 fixed point.
+int projection_factor(int z);
+
+// Projects packed (x, y, z) triples to (x, y) screen pixel pairs, as project_x and project_y do.  Returns the number
+// of points written, which is limited by both buffers.
+int project_points(const int* points, int count, int* out, int outcount);
+
 void draw_line_3d(GdkImage* img, int x0, int y0, int z0, int x1, int y1, int z1, float c);
 void draw_rect_3d(GdkImage* img, int x0, int y0, int x1, int y1, int depth, float c);
 void draw_circle_3d(GdkImage* img, int x, int y, int z, int radius, float c);
 void fill_circle_3d(GdkImage* img, int x, int y, int z, int radius, float c);
 void draw_ellipse_3d(GdkImage* img, int x, int y, int z, int rx, int ry, float c);
 
+// Draw lists
+// A draw list is a packed int array of commands, each an opcode followed by its arguments.  Colors are 0-255.
+// The whole list is rasterized with a single call, avoiding the per-primitive cost of going through the wrapper.
+enum {
+    DRAW_END = 0,
+    DRAW_LINE_2X,           // x0, y0, x1, y1, color
+    DRAW_ELLIPSE_2X,        // x, y, rx, ry, color
+    DRAW_FILL_ELLIPSE_2X,   // x, y, rx, ry, color
+    DRAW_LINE_3D,           // x0, y0, z0, x1, y1, z1, color
+    DRAW_RECT_3D,           // x0, y0, x1, y1, depth, color
+    DRAW_CIRCLE_3D,         // x, y, z, radius, color
+    DRAW_FILL_CIRCLE_3D,    // x, y, z, radius, color
+    DRAW_ELLIPSE_3D,        // x, y, z, rx, ry, color
+    DRAW_TEXT_2X,           // x, y, scale, color, length, then one character code per int
+    DRAW_ICON_2X,           // x, y, icon, scale, color
+    DRAW_SPRITE_2X,         // x, y, id, brightness
+    DRAW_MAX
+};
+
+void draw_list(GdkImage* img, const int* cmds, int count);
+
+// Rasterization threads
+// Draw lists are rasterized in horizontal bands, one per thread, with the Python GIL released.  Defaults to 1.
+void set_raster_threads(int n);
+int get_raster_threads();
+
 #endif
 
@@ -19,7 +19,17 @@
 
 %{
 #include <pygobject.h>
+#include <pycairo.h>
 #include "pongc.h"
+
+static Pycairo_CAPI_t* Pycairo_CAPI;
+%}
+
+%init %{
+        // Without pycairo only gtk.gdk.Images can be drawn into.
+        Pycairo_IMPORT;
+        if (!Pycairo_CAPI)
+                PyErr_Clear();
 %}
 
 // Testing facility.
@@ -35,13 +45,66 @@
         $1 = buf;
 }
 
-// Pass a gtk.gdk.Image as a GdkImage*.
-%typemap(in) GdkImage* {
-        // todo- Error checking would be nice.
-        PyGObject* pygo = (PyGObject*)$input;
-        GdkImage* img = (GdkImage*)pygo->obj;
-        $1 = img;
+// Pass a gtk.gdk.Image as a GdkImage*.  A cairo.ImageSurface in FORMAT_RGB24 may be passed instead, and is drawn
+// into directly as a 24 bit image.  Callers must flush the surface before and mark it dirty after.
+%typemap(in) GdkImage* (GdkImage surfaceimg) {
+        if (Pycairo_CAPI && PyObject_TypeCheck($input, &PycairoImageSurface_Type)) {
+                cairo_surface_t* surface = ((PycairoImageSurface*)$input)->surface;
+                if (cairo_image_surface_get_format(surface) != CAIRO_FORMAT_RGB24) {
+                        PyErr_SetString(PyExc_TypeError, "image surfaces must be in FORMAT_RGB24");
+                        SWIG_fail;
+                }
+                memset(&surfaceimg, 0, sizeof(surfaceimg));
+                surfaceimg.mem = cairo_image_surface_get_data(surface);
+                surfaceimg.width = cairo_image_surface_get_width(surface);
+                surfaceimg.height = cairo_image_surface_get_height(surface);
+                surfaceimg.bpl = cairo_image_surface_get_stride(surface);
+                surfaceimg.bpp = 4;
+                surfaceimg.depth = 24;
+                $1 = &surfaceimg;
+        } else {
+                // todo- Error checking would be nice.
+                PyGObject* pygo = (PyGObject*)$input;
+                GdkImage* img = (GdkImage*)pygo->obj;
+                $1 = img;
+        }
+}
+
+// Pass any object supporting the buffer protocol (such as an array.array('i')) as a packed int array.
+%typemap(in) (const int* cmds, int count) {
+        const void* buf;
+        Py_ssize_t len;
+        if (PyObject_AsReadBuffer($input, &buf, &len) < 0)
+                SWIG_fail;
+        $1 = (const int*)buf;
+        $2 = len/sizeof(int);
 }
 
+%apply (const int* cmds, int count) { (const int* points, int count) };
+
+// Pass any object supporting the buffer protocol (such as a str) as bytes.
+%typemap(in) (const unsigned char* pixels, int count) {
+        const void* buf;
+        Py_ssize_t len;
+        if (PyObject_AsReadBuffer($input, &buf, &len) < 0)
+                SWIG_fail;
+        $1 = (const unsigned char*)buf;
+        $2 = len;
+}
+
+// Pass any object supporting the writable buffer protocol as a packed int array to write into.
+%typemap(in) (int* out, int outcount) {
+        void* buf;
+        Py_ssize_t len;
+        if (PyObject_AsWriteBuffer($input, &buf, &len) < 0)
+                SWIG_fail;
+        $1 = (int*)buf;
+        $2 = len/sizeof(int);
+}
+
+// Return the dirty rectangle as an (x, y, w, h) tuple.
+%include "typemaps.i"
+%apply int* OUTPUT { int* x, int* y, int* w, int* h };
+
 %include "pongc.h"
 
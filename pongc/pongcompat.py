@@ -0,0 +1,275 @@
+# Copyright 2009 by Wade Brainerd.
+# This file is part of Bounce.
+#
+# Bounce is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bounce is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bounce.  If not, see <http://www.gnu.org/licenses/>.
+"""The pongc API on top of binary blobs built before draw lists were added.
+
+Those blobs only have the per-primitive functions, which draw into a gtk.gdk.Image.  Draw lists are decoded here and
+each primitive is handed to the blob on its own, with text, icons and sprites drawn as runs of lines.  Images are
+always drawn at render scale 1 and there is no background cache, so every frame is drawn in full."""
+
+from pongclib import clear_image, draw_line_2x, draw_ellipse_2x, fill_ellipse_2x, to_fixed, project_x, project_y, \
+                     draw_line_3d, draw_rect_3d, draw_circle_3d, fill_circle_3d, draw_ellipse_3d
+import pongclib
+
+from pongdefs import *
+from pongdefs import _draw_list_args, _hud_icons, _glyph_rows, _bitmap_runs
+
+def _div(a, b):
+    """Integer division truncating towards zero, like C."""
+    q = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        return -q
+    return q
+
+def new_image(width, height):
+    import gtk
+    return gtk.gdk.Image(gtk.gdk.IMAGE_FASTEST, gtk.gdk.visual_get_system(), width, height)
+
+#---------------------------------------------------------------------------------------------------------------------
+# Render scale.  The blobs only draw 2x pixels.
+
+def set_render_scale(scale):
+    pass
+
+def get_render_scale():
+    return 1
+
+def upscale_image(src, dst, x, y, w, h):
+    pass
+
+#---------------------------------------------------------------------------------------------------------------------
+# HUD
+
+# Runs of each glyph and icon, see _bitmap_runs.
+_glyph_runs = {}
+_icon_runs = [_bitmap_runs(rows) for rows in _hud_icons]
+
+def _draw_runs(img, x, y, runs, scale, color):
+    for r, c, end in runs:
+        for sy in range(y + r*scale, y + (r+1)*scale):
+            draw_line_2x(img, x + c*scale, sy, x + end*scale - 1, sy, color)
+
+def draw_text_2x(img, x, y, text, scale, color):
+    _draw_text(img, x, y, [ord(ch) for ch in text], scale, color)
+
+def _draw_text(img, x, y, chars, scale, color):
+    if scale < 1:
+        return
+    for ch in chars:
+        if ch != 32:
+            runs = _glyph_runs.get(ch)
+            if runs is None:
+                runs = _glyph_runs[ch] = _bitmap_runs(_glyph_rows(ch))
+            _draw_runs(img, x, y, runs, scale, color)
+        x += HUD_CELL_WIDTH*scale
+
+def draw_icon_2x(img, x, y, icon, scale, color):
+    if icon < 0 or icon >= HUD_ICON_MAX or scale < 1:
+        return
+    _draw_runs(img, x, y, _icon_runs[icon], scale, color)
+
+#---------------------------------------------------------------------------------------------------------------------
+# Sprites
+
+# Each sprite is a function drawing it centered on a 2x pixel with a brightness.
+_sprites = []
+
+def _ellipse_sprite(r, fill):
+    draw = fill and fill_ellipse_2x or draw_ellipse_2x
+    def sprite(img, x, y, brightness):
+        draw(img, x, y, r, r, brightness)
+    return sprite
+
+def _bitmap_sprite(rows, originx, originy):
+    """rows holds the values of the 2x pixels of each row.  Runs of the same value are drawn as lines, except for
+    the transparent runs of zeros."""
+    runs = []
+    for y, row in enumerate(rows):
+        x = 0
+        while x < len(row):
+            end = x + 1
+            while end < len(row) and row[end] == row[x]:
+                end += 1
+            if row[x]:
+                runs.append((x - originx, end - 1 - originx, y - originy, row[x]))
+            x = end
+    def sprite(img, x, y, brightness):
+        for x0, x1, dy, value in runs:
+            draw_line_2x(img, x + x0, y + dy, x + x1, y + dy, (brightness*value + 127)//255)
+    return sprite
+
+def _scaled_rows(rows, width, scale):
+    pixels = []
+    for bits in rows:
+        row = []
+        for x in range(width):
+            row += [255*((bits >> x) & 1)]*scale
+        pixels += [row]*scale
+    return pixels
+
+def _init_sprites():
+    if _sprites:
+        return
+    _sprites.append(_ellipse_sprite(SPRITE_PIP_RADIUS, True))
+    _sprites.append(_ellipse_sprite(SPRITE_PIP_RADIUS, False))
+    for icon in (HUD_ICON_X, HUD_ICON_X_OUTLINE):
+        rows = _scaled_rows(_hud_icons[icon], HUD_ICON_SIZE, 1)
+        _sprites.append(_bitmap_sprite(rows, HUD_ICON_SIZE//2, HUD_ICON_SIZE//2))
+    for digit in range(10):
+        rows = _scaled_rows(_glyph_rows(ord('0') + digit), 5, SPRITE_DIGIT_SCALE)
+        _sprites.append(_bitmap_sprite(rows, 5*SPRITE_DIGIT_SCALE//2, HUD_GLYPH_HEIGHT*SPRITE_DIGIT_SCALE//2))
+
+def add_sprite(pixels, width, height, originx, originy):
+    _init_sprites()
+    data = [ord(p) for p in str(buffer(pixels))[:width*height]]
+    if width <= 0 or height <= 0 or len(data) < width*height or len(_sprites) >= 256:
+        return -1
+    _sprites.append(_bitmap_sprite([data[y*width:(y+1)*width] for y in range(height)], originx, originy))
+    return len(_sprites) - 1
+
+def get_sprite_count():
+    _init_sprites()
+    return len(_sprites)
+
+def blit_sprite(img, id, x, y, brightness):
+    _init_sprites()
+    if id < 0 or id >= len(_sprites):
+        return
+    _sprites[id](img, x, y, max(0, min(brightness, 255)))
+
+#---------------------------------------------------------------------------------------------------------------------
+# Background cache.  Nothing is ever cached, so callers draw the whole background.
+
+def store_background(img, key):
+    pass
+
+def restore_background(img, key):
+    return 0
+
+def invalidate_background():
+    pass
+
+def restore_background_rect(img, key, x, y, w, h):
+    return 0
+
+#---------------------------------------------------------------------------------------------------------------------
+# Dirty rectangles.  The whole screen is always redrawn.
+
+def begin_dirty():
+    pass
+
+def get_dirty_rect():
+    return (0, 0, _actual_screen_width, _actual_screen_height)
+
+#---------------------------------------------------------------------------------------------------------------------
+# 3D primitives
+
+_actual_screen_width = 1200
+_actual_screen_height = 825
+_viewport_scale = 100<<8
+
+def set_3d_params(w, h, s):
+    global _actual_screen_width, _actual_screen_height, _viewport_scale
+    _actual_screen_width = w
+    _actual_screen_height = h
+    _viewport_scale = s
+    pongclib.set_3d_params(w, h, s)
+
+_projection_depth = 500<<8
+
+def set_projection_depth(depth):
+    global _projection_depth
+    _projection_depth = max(0, min(depth, 4000<<8))
+
+def get_projection_depth():
+    return _projection_depth
+
+def projection_factor(z):
+    return _div((1<<16) * _viewport_scale, z + _viewport_scale)
+
+def project_points(points, out):
+    """Projects (x, y, z) triples from an int array to (x, y) pairs in another.  Returns the number of points
+    written."""
+    n = min(len(points)//3, len(out)//2)
+    for i in range(n):
+        x, y, z = points[i*3:i*3+3]
+        out[i*2] = project_x(x, y, z)
+        out[i*2+1] = project_y(x, y, z)
+    return n
+
+#---------------------------------------------------------------------------------------------------------------------
+# Draw lists
+
+def draw_list(img, cmds):
+    """Rasterizes a packed draw list one primitive at a time."""
+    pos = 0
+    while pos < len(cmds):
+        op = cmds[pos]
+        if op <= DRAW_END or op >= DRAW_MAX or pos + 1 + _draw_list_args[op] > len(cmds):
+            break
+        args = _draw_list_args[op]
+        if op == DRAW_TEXT_2X:
+            length = cmds[pos+5]
+            if length < 0 or pos + 1 + args + length > len(cmds):
+                break
+            args += length
+        a = cmds[pos+1:pos+1+args]
+        pos += 1 + args
+
+        if op == DRAW_LINE_2X:
+            draw_line_2x(img, a[0], a[1], a[2], a[3], a[4])
+        elif op == DRAW_ELLIPSE_2X:
+            draw_ellipse_2x(img, a[0], a[1], a[2], a[3], a[4])
+        elif op == DRAW_FILL_ELLIPSE_2X:
+            fill_ellipse_2x(img, a[0], a[1], a[2], a[3], a[4])
+        elif op == DRAW_LINE_3D:
+            draw_line_2x(img, _div(project_x(a[0], a[1], a[2]), 2), _div(project_y(a[0], a[1], a[2]), 2),
+                         _div(project_x(a[3], a[4], a[5]), 2), _div(project_y(a[3], a[4], a[5]), 2), a[6])
+        elif op == DRAW_RECT_3D:
+            px0 = _div(project_x(a[0], a[1], a[4]) + 1, 2)
+            py0 = _div(project_y(a[0], a[1], a[4]) + 1, 2)
+            px1 = _div(project_x(a[2], a[3], a[4]) - 1, 2)
+            py1 = _div(project_y(a[2], a[3], a[4]) - 1, 2)
+            draw_line_2x(img, px0, py0, px1, py0, a[5])
+            draw_line_2x(img, px1, py0, px1, py1, a[5])
+            draw_line_2x(img, px1, py1, px0, py1, a[5])
+            draw_line_2x(img, px0, py1, px0, py0, a[5])
+        elif op in (DRAW_CIRCLE_3D, DRAW_FILL_CIRCLE_3D, DRAW_ELLIPSE_3D):
+            x, y, z = a[0], a[1], a[2]
+            px = project_x(x, y, z)
+            rx = _div(project_x(x+a[3], y, z) - px, 2)
+            if op == DRAW_ELLIPSE_3D:
+                py = project_y(x, y, z)
+                ry = _div(project_y(x, y+a[4], z) - py, 2)
+            else:
+                ry = rx
+            if rx >= 1 and ry >= 1:
+                draw = op == DRAW_FILL_CIRCLE_3D and fill_ellipse_2x or draw_ellipse_2x
+                draw(img, _div(px, 2), _div(project_y(x, y, z), 2), rx, ry, a[-1])
+        elif op == DRAW_TEXT_2X:
+            _draw_text(img, a[0], a[1], a[5:], a[2], a[3])
+        elif op == DRAW_ICON_2X:
+            draw_icon_2x(img, a[0], a[1], a[2], a[3], a[4])
+        elif op == DRAW_SPRITE_2X:
+            blit_sprite(img, a[2], a[0], a[1], a[3])
+
+#---------------------------------------------------------------------------------------------------------------------
+# Rasterization threads.  The blobs draw on the calling thread.
+
+def set_raster_threads(n):
+    pass
+
+def get_raster_threads():
+    return 1
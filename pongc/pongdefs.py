@@ -0,0 +1,122 @@
+# Copyright 2009 by Wade Brainerd.
+# This file is part of Bounce.
+#
+# Bounce is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bounce is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bounce.  If not, see <http://www.gnu.org/licenses/>.
+"""Draw list layout, constants and HUD bitmaps shared by the Python rasterizers.  They have to match pongc.h and
+pongc.cpp."""
+
+# Draw list opcodes, see pongc.h.
+DRAW_END = 0
+DRAW_LINE_2X = 1
+DRAW_ELLIPSE_2X = 2
+DRAW_FILL_ELLIPSE_2X = 3
+DRAW_LINE_3D = 4
+DRAW_RECT_3D = 5
+DRAW_CIRCLE_3D = 6
+DRAW_FILL_CIRCLE_3D = 7
+DRAW_ELLIPSE_3D = 8
+DRAW_TEXT_2X = 9
+DRAW_ICON_2X = 10
+DRAW_SPRITE_2X = 11
+DRAW_MAX = 12
+
+_draw_list_args = [0, 5, 5, 5, 7, 6, 5, 5, 6, 5, 5, 4]
+
+# HUD constants, see pongc.h.
+HUD_CELL_WIDTH = 6
+HUD_CELL_HEIGHT = 8
+HUD_GLYPH_HEIGHT = 7
+HUD_ICON_SIZE = 10
+
+HUD_ICON_X = 0
+HUD_ICON_X_OUTLINE = 1
+HUD_ICON_MAX = 2
+
+# Built in sprites, see pongc.h.
+SPRITE_PIP = 0
+SPRITE_PIP_OUTLINE = 1
+SPRITE_X = 2
+SPRITE_X_OUTLINE = 3
+SPRITE_DIGIT_0 = 4
+SPRITE_BUILTIN_MAX = 14
+SPRITE_PIP_RADIUS = 6
+SPRITE_DIGIT_SCALE = 2
+
+#---------------------------------------------------------------------------------------------------------------------
+# HUD bitmaps
+
+# 5x7 glyphs for the printable ASCII characters, one byte per column with the top row in the low bit.
+_hud_font = [
+    (0x00, 0x00, 0x00, 0x00, 0x00), (0x00, 0x00, 0x5f, 0x00, 0x00), (0x00, 0x07, 0x00, 0x07, 0x00),
+    (0x14, 0x7f, 0x14, 0x7f, 0x14), (0x24, 0x2a, 0x7f, 0x2a, 0x12), (0x23, 0x13, 0x08, 0x64, 0x62),
+    (0x36, 0x49, 0x55, 0x22, 0x50), (0x00, 0x05, 0x03, 0x00, 0x00), (0x00, 0x1c, 0x22, 0x41, 0x00),
+    (0x00, 0x41, 0x22, 0x1c, 0x00), (0x14, 0x08, 0x3e, 0x08, 0x14), (0x08, 0x08, 0x3e, 0x08, 0x08),
+    (0x00, 0x50, 0x30, 0x00, 0x00), (0x08, 0x08, 0x08, 0x08, 0x08), (0x00, 0x60, 0x60, 0x00, 0x00),
+    (0x20, 0x10, 0x08, 0x04, 0x02), (0x3e, 0x51, 0x49, 0x45, 0x3e), (0x00, 0x42, 0x7f, 0x40, 0x00),
+    (0x42, 0x61, 0x51, 0x49, 0x46), (0x21, 0x41, 0x45, 0x4b, 0x31), (0x18, 0x14, 0x12, 0x7f, 0x10),
+    (0x27, 0x45, 0x45, 0x45, 0x39), (0x3c, 0x4a, 0x49, 0x49, 0x30), (0x01, 0x71, 0x09, 0x05, 0x03),
+    (0x36, 0x49, 0x49, 0x49, 0x36), (0x06, 0x49, 0x49, 0x29, 0x1e), (0x00, 0x36, 0x36, 0x00, 0x00),
+    (0x00, 0x56, 0x36, 0x00, 0x00), (0x08, 0x14, 0x22, 0x41, 0x00), (0x14, 0x14, 0x14, 0x14, 0x14),
+    (0x00, 0x41, 0x22, 0x14, 0x08), (0x02, 0x01, 0x51, 0x09, 0x06), (0x32, 0x49, 0x79, 0x41, 0x3e),
+    (0x7e, 0x11, 0x11, 0x11, 0x7e), (0x7f, 0x49, 0x49, 0x49, 0x36), (0x3e, 0x41, 0x41, 0x41, 0x22),
+    (0x7f, 0x41, 0x41, 0x22, 0x1c), (0x7f, 0x49, 0x49, 0x49, 0x41), (0x7f, 0x09, 0x09, 0x09, 0x01),
+    (0x3e, 0x41, 0x49, 0x49, 0x7a), (0x7f, 0x08, 0x08, 0x08, 0x7f), (0x00, 0x41, 0x7f, 0x41, 0x00),
+    (0x20, 0x40, 0x41, 0x3f, 0x01), (0x7f, 0x08, 0x14, 0x22, 0x41), (0x7f, 0x40, 0x40, 0x40, 0x40),
+    (0x7f, 0x02, 0x0c, 0x02, 0x7f), (0x7f, 0x04, 0x08, 0x10, 0x7f), (0x3e, 0x41, 0x41, 0x41, 0x3e),
+    (0x7f, 0x09, 0x09, 0x09, 0x06), (0x3e, 0x41, 0x51, 0x21, 0x5e), (0x7f, 0x09, 0x19, 0x29, 0x46),
+    (0x46, 0x49, 0x49, 0x49, 0x31), (0x01, 0x01, 0x7f, 0x01, 0x01), (0x3f, 0x40, 0x40, 0x40, 0x3f),
+    (0x1f, 0x20, 0x40, 0x20, 0x1f), (0x3f, 0x40, 0x38, 0x40, 0x3f), (0x63, 0x14, 0x08, 0x14, 0x63),
+    (0x07, 0x08, 0x70, 0x08, 0x07), (0x61, 0x51, 0x49, 0x45, 0x43), (0x00, 0x7f, 0x41, 0x41, 0x00),
+    (0x02, 0x04, 0x08, 0x10, 0x20), (0x00, 0x41, 0x41, 0x7f, 0x00), (0x04, 0x02, 0x01, 0x02, 0x04),
+    (0x40, 0x40, 0x40, 0x40, 0x40), (0x00, 0x01, 0x02, 0x04, 0x00), (0x20, 0x54, 0x54, 0x54, 0x78),
+    (0x7f, 0x48, 0x44, 0x44, 0x38), (0x38, 0x44, 0x44, 0x44, 0x20), (0x38, 0x44, 0x44, 0x48, 0x7f),
+    (0x38, 0x54, 0x54, 0x54, 0x18), (0x08, 0x7e, 0x09, 0x01, 0x02), (0x0c, 0x52, 0x52, 0x52, 0x3e),
+    (0x7f, 0x08, 0x04, 0x04, 0x78), (0x00, 0x44, 0x7d, 0x40, 0x00), (0x20, 0x40, 0x44, 0x3d, 0x00),
+    (0x7f, 0x10, 0x28, 0x44, 0x00), (0x00, 0x41, 0x7f, 0x40, 0x00), (0x7c, 0x04, 0x18, 0x04, 0x78),
+    (0x7c, 0x08, 0x04, 0x04, 0x78), (0x38, 0x44, 0x44, 0x44, 0x38), (0x7c, 0x14, 0x14, 0x14, 0x08),
+    (0x08, 0x14, 0x14, 0x18, 0x7c), (0x7c, 0x08, 0x04, 0x04, 0x08), (0x48, 0x54, 0x54, 0x54, 0x20),
+    (0x04, 0x3f, 0x44, 0x40, 0x20), (0x3c, 0x40, 0x40, 0x20, 0x7c), (0x1c, 0x20, 0x40, 0x20, 0x1c),
+    (0x3c, 0x40, 0x30, 0x40, 0x3c), (0x44, 0x28, 0x10, 0x28, 0x44), (0x0c, 0x50, 0x50, 0x50, 0x3c),
+    (0x44, 0x64, 0x54, 0x4c, 0x44), (0x00, 0x08, 0x36, 0x41, 0x00), (0x00, 0x00, 0x7f, 0x00, 0x00),
+    (0x00, 0x41, 0x36, 0x08, 0x00), (0x08, 0x04, 0x08, 0x10, 0x08),
+]
+
+# Icons, one word per row with the leftmost column in the low bit.
+_hud_icons = [
+    (0x387, 0x1ce, 0x0fe, 0x0fc, 0x078, 0x078, 0x0fc, 0x0ce, 0x1ce, 0x387),
+    (0x387, 0x14a, 0x0b2, 0x084, 0x048, 0x048, 0x0b4, 0x0ca, 0x14a, 0x387),
+]
+
+def _glyph_rows(ch):
+    """Returns the rows of the glyph for a character code, one word per row like the icons."""
+    if ch < 32 or ch > 126:
+        ch = ord('?')
+    cols = _hud_font[ch - 32]
+    return [sum(((cols[c] >> r) & 1) << c for c in range(5)) for r in range(HUD_GLYPH_HEIGHT)]
+
+def _bitmap_runs(rows):
+    """Returns the runs of set bits of a bitmap as (row, first column, column past the end) triples."""
+    runs = []
+    for r, bits in enumerate(rows):
+        c = 0
+        while bits >> c:
+            if not (bits >> c) & 1:
+                c += 1
+                continue
+            end = c
+            while (bits >> end) & 1:
+                end += 1
+            runs.append((r, c, end))
+            c = end
+    return runs
@@ -0,0 +1,747 @@
+# Copyright 2009 by Wade Brainerd.
+# This file is part of Bounce.
+#
+# Bounce is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bounce is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bounce.  If not, see <http://www.gnu.org/licenses/>.
+"""NumPy reference implementation of the pongc rasterizer.
+
+Used when no binary blobs match the platform.  Images are grayscale NumPy arrays and every primitive produces
+pixel coordinates in bulk, which are then written with a single fancy-indexing operation.  The output matches
+pongc.cpp pixel for pixel."""
+
+import numpy
+
+from pongdefs import *
+from pongdefs import _draw_list_args, _hud_icons, _glyph_rows, _bitmap_runs
+
+_empty = numpy.zeros(0, numpy.intc)
+
+def _div(a, b):
+    """Integer division truncating towards zero, like C."""
+    q = abs(a) // abs(b)
+    if (a < 0) != (b < 0):
+        return -q
+    return q
+
+class Image(object):
+    """Grayscale framebuffer taking the place of a gtk.gdk.Image."""
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.depth = 8
+        self.bpl = width
+        self.mem = numpy.zeros((height, width), numpy.uint8)
+
+def new_image(width, height):
+    return Image(width, height)
+
+#---------------------------------------------------------------------------------------------------------------------
+# Render scale
+
+_render_scale = 1
+
+def set_render_scale(scale):
+    global _render_scale
+    _render_scale = max(1, min(scale, 4))
+
+    # The cached background was drawn at the old scale.
+    invalidate_background()
+
+def get_render_scale():
+    return _render_scale
+
+def _scale_coord(c):
+    """Converts a 2x coordinate to image pixels."""
+    if _render_scale <= 2:
+        return c
+    return (c*2) // _render_scale
+
+def _scale_radius(r):
+    if _render_scale <= 2:
+        return r
+    return r*2 // _render_scale
+
+def upscale_image(src, dst, x, y, w, h):
+    """Scales the (x, y, w, h) area of the screen up from src into dst."""
+    x0 = max(x, 0)
+    y0 = max(y, 0)
+    x1 = min(x + w, dst.width)
+    y1 = min(y + h, dst.height)
+    if x1 <= x0 or y1 <= y0 or src.width <= 0 or src.height <= 0:
+        return
+    s = _render_scale
+    sx0, sy0 = x0 // s, y0 // s
+    sx1, sy1 = (x1 - 1) // s + 1, (y1 - 1) // s + 1
+    if sx1 <= src.width and sy1 <= src.height:
+        block = src.mem[sy0:sy1, sx0:sx1].repeat(s, 0).repeat(s, 1)
+        dst.mem[y0:y1, x0:x1] = block[y0-sy0*s:y1-sy0*s, x0-sx0*s:x1-sx0*s]
+        return
+
+    # The area reaches past the scaled up image, so repeat its last row and column.
+    xs = numpy.minimum(numpy.arange(x0, x1) // s, src.width-1)
+    ys = numpy.minimum(numpy.arange(y0, y1) // s, src.height-1)
+    dst.mem[y0:y1, x0:x1] = src.mem[ys][:, xs]
+
+#---------------------------------------------------------------------------------------------------------------------
+# Pixel generation.  Each function returns (xs, ys) arrays of 2x pixel coordinates.
+
+def _outcode(x, y, clip):
+    maxx, maxy = clip
+    return (1 if x < 0 else 2 if x > maxx else 0) | (4 if y < 0 else 8 if y > maxy else 0)
+
+def _line_points(x0, y0, x1, y1, clip):
+    """Returns the pixels of a line inside clip, the last column and row from _clip_max.  Like pongc.cpp only the
+    steps inside clip are generated, so lines reaching far outside the image stay cheap."""
+    maxx, maxy = clip
+
+    # Make sure the line runs top to bottom.
+    if y0 > y1:
+        x0, y0, x1, y1 = x1, y1, x0, y0
+
+    dx = x1 - x0
+    xdir = 1
+    if dx < 0:
+        xdir = -1
+        dx = -dx
+    dy = y1 - y0
+
+    # Lines steeper than 65536:1 leave their bounding box, see adj below, so they can't be rejected from their end
+    # points.
+    steep = dx != 0 and dy != 0 and (dy // dx if dy > dx else dx // dy) >= 1 << 16
+    if not steep and _outcode(x0, y0, clip) & _outcode(x1, y1, clip):
+        return _empty, _empty
+
+    if dy == 0: # Horizontal line
+        xs = numpy.arange(max(min(x0, x1), 0), min(max(x0, x1), maxx) + 1)
+        return xs, numpy.repeat(y0, len(xs))
+    if dx == 0: # Vertical line
+        ys = numpy.arange(max(y0, 0), min(y1, maxy) + 1)
+        return numpy.repeat(x0, len(ys)), ys
+
+    # Pixel k (0 <= k < n) lies k steps along the major axis, and as many steps along the minor axis as the 16 bit
+    # error accumulator has turned over, which is (k*adj) >> 16.  An adjustment that truncates to 0 makes it turn over
+    # on every step.  The last pixel is always the end point.
+    if dx == dy:
+        n, adj = dy, 1 << 16
+    elif dy > dx:
+        n, adj = dy, (dx << 16) // dy or 1 << 16
+    else:
+        n, adj = dx, (dy << 16) // dx or 1 << 16
+
+    ymajor = dy >= dx
+    if ymajor:
+        major0, majordir, majormax, minor0, minordir, minormax = y0, 1, maxy, x0, xdir, maxx
+    else:
+        major0, majordir, majormax, minor0, minordir, minormax = x0, xdir, maxx, y0, 1, maxy
+
+    # Range of k keeping both coordinates inside clip.
+    kmin = max(-major0 if majordir > 0 else major0 - majormax, 0)
+    kmax = min(majormax - major0 if majordir > 0 else major0, n-1)
+    flo = -minor0 if minordir > 0 else minor0 - minormax
+    fhi = minormax - minor0 if minordir > 0 else minor0
+    if fhi < 0:
+        kmax = -1
+    elif ((fhi + 1) << 16) - 1 < kmax*adj:
+        kmax = (((fhi + 1) << 16) - 1) // adj
+    if flo > 0 and (flo << 16) > kmin*adj:
+        kmin = ((flo << 16) + adj - 1) // adj
+
+    k = numpy.arange(kmin, max(kmax + 1, kmin), dtype=numpy.int64)
+    major = major0 + majordir*k
+    minor = minor0 + minordir*((k*adj) >> 16)
+    if ymajor:
+        xs, ys = minor, major
+    else:
+        xs, ys = major, minor
+    if not _outcode(x1, y1, clip):
+        xs, ys = numpy.append(xs, x1), numpy.append(ys, y1)
+    return xs, ys
+
+def _span_points(spans):
+    """Expands a list of (x0, x1, y) horizontal lines into pixels."""
+    if not spans:
+        return _empty, _empty
+    s = numpy.array(spans, numpy.intc)
+    lo = numpy.minimum(s[:,0], s[:,1])
+    counts = numpy.abs(s[:,1] - s[:,0]) + 1
+    starts = numpy.cumsum(counts) - counts
+    k = numpy.arange(counts.sum()) - numpy.repeat(starts, counts)
+    return numpy.repeat(lo, counts) + k, numpy.repeat(s[:,2], counts)
+
+# Ellipse shapes by (rx, ry, fill), along with the clock value of their last use.  Like the cache in pongc.cpp it
+# holds up to 32 shapes, and the least recently used one makes room for a new one.
+_SHAPE_CACHE_SIZE = 32
+_shape_cache = {}
+_shape_clock = 0
+
+def _cached_shape(key):
+    global _shape_clock
+    entry = _shape_cache.get(key)
+    if entry is None:
+        return None
+    _shape_clock += 1
+    entry[1] = _shape_clock
+    return entry[0]
+
+def _cache_shape(key, offsets):
+    global _shape_clock
+    if len(_shape_cache) >= _SHAPE_CACHE_SIZE:
+        del _shape_cache[min(_shape_cache, key=lambda k: _shape_cache[k][1])]
+    _shape_clock += 1
+    _shape_cache[key] = [offsets, _shape_clock]
+    return offsets
+
+def _ellipse_offsets(rx, ry):
+    """Outline pixels of an ellipse centered on the origin, from the midpoint walk in pongc.cpp."""
+    key = (rx, ry, False)
+    offsets = _cached_shape(key)
+    if offsets is not None:
+        return offsets
+
+    pts = []
+    oh = oi = oj = ok = 0xffff
+    if rx >= ry:
+        ix = 0
+        iy = rx * 64
+        while True:
+            h = (ix + 8) >> 6
+            i = (iy + 8) >> 6
+            j = _div(h * ry, rx)
+            k = _div(i * ry, rx)
+            if ((ok != k) and (oj != k)) or ((oj != j) and (ok != j)) or (k != j):
+                if k > 0:
+                    if h > 0:
+                        pts += [(-h, k-1), (-h, -k)]
+                    pts += [(h-1, k-1), (h-1, -k)]
+                ok = k
+                if j > 0:
+                    pts += [(-i, j-1), (i-1, j-1), (-i, -j), (i-1, -j)]
+                oj = j
+            ix = ix + _div(iy, rx)
+            iy = iy - _div(ix, rx)
+            if not i > h:
+                break
+    else:
+        ix = 0
+        iy = ry * 64
+        while True:
+            h = (ix + 8) >> 6
+            i = (iy + 8) >> 6
+            j = _div(h * rx, ry)
+            k = _div(i * rx, ry)
+            if ((oi != i) and (oh != i)) or ((oh != h) and (oi != h) and (i != h)):
+                if i > 0:
+                    if j > 0:
+                        pts += [(-j, i-1), (-j, -i)]
+                    pts += [(j-1, i-1), (j-1, -i)]
+                oi = i
+                if h > 0:
+                    pts += [(-k, h-1), (k-1, h-1), (-k, -h), (k-1, -h)]
+                oh = h
+            ix = ix + _div(iy, ry)
+            iy = iy - _div(ix, ry)
+            if not i > h:
+                break
+
+    a = numpy.array(pts, numpy.intc).reshape(-1, 2)
+    return _cache_shape(key, (a[:,0], a[:,1]))
+
+def _fill_offsets(rx, ry):
+    """Pixels of a filled ellipse centered on the origin, from the span walk in pongc.cpp."""
+    key = (rx, ry, True)
+    offsets = _cached_shape(key)
+    if offsets is not None:
+        return offsets
+
+    spans = []
+    oh = oi = oj = ok = 0xffff
+    if rx >= ry:
+        ix = 0
+        iy = rx * 64
+        while True:
+            h = (ix + 8) >> 6
+            i = (iy + 8) >> 6
+            j = _div(h * ry, rx)
+            k = _div(i * ry, rx)
+            if (ok != k) and (oj != k) and (k < ry):
+                spans += [(-h, h-1, -k-1), (-h, h-1, k)]
+                ok = k
+            if (oj != j) and (ok != j) and (k != j):
+                spans += [(-i, i-1, j), (-i, i-1, -j-1)]
+                oj = j
+            ix = ix + _div(iy, rx)
+            iy = iy - _div(ix, rx)
+            if not i > h:
+                break
+    else:
+        ix = 0
+        iy = ry * 64
+        while True:
+            h = (ix + 8) >> 6
+            i = (iy + 8) >> 6
+            j = _div(h * rx, ry)
+            k = _div(i * rx, ry)
+            if (oi != i) and (oh != i) and (i < ry):
+                spans += [(-j, j-1, i), (-j, j-1, -i-1)]
+                oi = i
+            if (oh != h) and (oi != h) and (i != h):
+                spans += [(-k, k-1, h), (-k, k-1, -h-1)]
+                oh = h
+            ix = ix + _div(iy, ry)
+            iy = iy - _div(ix, ry)
+            if not i > h:
+                break
+
+    return _cache_shape(key, _span_points(spans))
+
+def _ellipse_points(x, y, rx, ry, fill, clip):
+    if rx == 0 and ry == 0: # Special case - draw a single pixel
+        return numpy.array([x]), numpy.array([y])
+    if rx == 0: # Special case for rx=0 - draw a vline
+        return _line_points(x, y-ry, x, y+ry, clip)
+    if ry == 0: # Special case for ry=0 - draw a hline
+        return _line_points(x-rx, y, x+rx, y, clip)
+    if fill:
+        xs, ys = _fill_offsets(rx, ry)
+    else:
+        xs, ys = _ellipse_offsets(rx, ry)
+    return xs + x, ys + y
+
+#---------------------------------------------------------------------------------------------------------------------
+# 2D primitives
+
+def _clip_max(img):
+    """Returns the last column and row that may be written, in image coordinates.  The last row and column of the
+    image are never written, like the last 2x row and column at render scale 1."""
+    if _render_scale == 1:
+        return img.width//2 - 2, img.height//2 - 2
+    return img.width - 2, img.height - 2
+
+def _plot(img, xs, ys, color):
+    """Writes pixels in image coordinates, discarding the ones outside the image.  At render scale 1 these are
+    2x pixels."""
+    c = color & 0xff
+    mem = img.mem
+    maxx, maxy = _clip_max(img)
+    mask = (xs >= 0) & (ys >= 0) & (xs <= maxx) & (ys <= maxy)
+    if _render_scale != 1:
+        mem[ys[mask], xs[mask]] = c
+        return
+
+    xs = xs[mask]*2
+    ys = ys[mask]*2
+    mem[ys, xs] = c
+    mem[ys, xs+1] = c
+    mem[ys+1, xs] = c
+    mem[ys+1, xs+1] = c
+
+def _plot_values(img, xs, ys, values):
+    """Like _plot, with a value for each pixel."""
+    mem = img.mem
+    maxx, maxy = _clip_max(img)
+    mask = (xs >= 0) & (ys >= 0) & (xs <= maxx) & (ys <= maxy)
+    if _render_scale != 1:
+        mem[ys[mask], xs[mask]] = values[mask]
+        return
+
+    xs = xs[mask]*2
+    ys = ys[mask]*2
+    values = values[mask]
+    mem[ys, xs] = values
+    mem[ys, xs+1] = values
+    mem[ys+1, xs] = values
+    mem[ys+1, xs+1] = values
+
+def clear_image(img):
+    img.mem.fill(0)
+
+def draw_line_2x(img, x0, y0, x1, y1, color):
+    draw_list(img, [DRAW_LINE_2X, x0, y0, x1, y1, color])
+
+def draw_ellipse_2x(img, x, y, rx, ry, color):
+    draw_list(img, [DRAW_ELLIPSE_2X, x, y, rx, ry, color])
+
+def fill_ellipse_2x(img, x, y, rx, ry, color):
+    draw_list(img, [DRAW_FILL_ELLIPSE_2X, x, y, rx, ry, color])
+
+#---------------------------------------------------------------------------------------------------------------------
+# HUD
+
+def _bitmap_lines(x, y, rows, scale):
+    """Returns a bitmap as horizontal lines in image coordinates, one per run of set bits in each row and image row."""
+    lines = []
+    for r, c, end in _bitmap_runs(rows):
+        y0 = _scale_coord(y + r*scale)
+        y1 = max(_scale_coord(y + (r+1)*scale) - 1, y0)
+        x0 = _scale_coord(x + c*scale)
+        x1 = max(_scale_coord(x + end*scale) - 1, x0)
+        for sy in range(y0, y1+1):
+            lines.append((x0, sy, x1, sy))
+    return lines
+
+def _text_lines(x, y, chars, scale):
+    lines = []
+    if scale < 1:
+        return lines
+    for ch in chars:
+        if ch != 32:
+            lines.extend(_bitmap_lines(x, y, _glyph_rows(ch), scale))
+        x += HUD_CELL_WIDTH*scale
+    return lines
+
+def _icon_lines(x, y, icon, scale):
+    if icon < 0 or icon >= HUD_ICON_MAX or scale < 1:
+        return []
+    return _bitmap_lines(x, y, _hud_icons[icon], scale)
+
+def draw_text_2x(img, x, y, text, scale, color):
+    draw_list(img, [DRAW_TEXT_2X, x, y, scale, color, len(text)] + [ord(ch) for ch in text])
+
+def draw_icon_2x(img, x, y, icon, scale, color):
+    draw_list(img, [DRAW_ICON_2X, x, y, icon, scale, color])
+
+#---------------------------------------------------------------------------------------------------------------------
+# Sprites
+
+# Each sprite is a 2D array of 2x pixels and its origin.
+_sprites = []
+
+def _new_sprite(pixels, originx, originy):
+    _sprites.append((pixels, originx, originy))
+    return len(_sprites) - 1
+
+def _new_ellipse_sprite(r, fill):
+    if fill:
+        xs, ys = _fill_offsets(r, r)
+    else:
+        xs, ys = _ellipse_offsets(r, r)
+    minx, miny = xs.min(), ys.min()
+    pixels = numpy.zeros((ys.max() - miny + 1, xs.max() - minx + 1), numpy.uint8)
+    pixels[ys - miny, xs - minx] = 255
+    return _new_sprite(pixels, -minx, -miny)
+
+def _new_bitmap_sprite(rows, width, height, scale):
+    bits = numpy.array([[(rows[y] >> x) & 1 for x in range(width)] for y in range(height)], numpy.uint8)
+    pixels = bits.repeat(scale, 0).repeat(scale, 1)*255
+    return _new_sprite(pixels, width*scale//2, height*scale//2)
+
+def _init_sprites():
+    if _sprites:
+        return
+    _new_ellipse_sprite(SPRITE_PIP_RADIUS, True)
+    _new_ellipse_sprite(SPRITE_PIP_RADIUS, False)
+    _new_bitmap_sprite(_hud_icons[HUD_ICON_X], HUD_ICON_SIZE, HUD_ICON_SIZE, 1)
+    _new_bitmap_sprite(_hud_icons[HUD_ICON_X_OUTLINE], HUD_ICON_SIZE, HUD_ICON_SIZE, 1)
+    for digit in range(10):
+        _new_bitmap_sprite(_glyph_rows(ord('0') + digit), 5, HUD_GLYPH_HEIGHT, SPRITE_DIGIT_SCALE)
+
+def add_sprite(pixels, width, height, originx, originy):
+    _init_sprites()
+    data = numpy.frombuffer(pixels, numpy.uint8)
+    if width <= 0 or height <= 0 or len(data) < width*height or len(_sprites) >= 256:
+        return -1
+    return _new_sprite(data[:width*height].reshape(height, width).copy(), originx, originy)
+
+def get_sprite_count():
+    _init_sprites()
+    return len(_sprites)
+
+def _sprite_pixels(img, x, y, id, brightness):
+    """Returns the image coordinates and values of the visible pixels of a sprite, and marks its area dirty."""
+    _init_sprites()
+    if id < 0 or id >= len(_sprites):
+        return None
+    pixels, originx, originy = _sprites[id]
+    h, w = pixels.shape
+    x -= originx
+    y -= originy
+    x0, y0 = _scale_coord(x), _scale_coord(y)
+    x1, y1 = _scale_coord(x + w) - 1, _scale_coord(y + h) - 1
+    _mark_dirty(x0, y0, x1, y1)
+
+    maxx, maxy = _clip_max(img)
+    ixs = numpy.arange(max(x0, 0), min(x1, maxx) + 1)
+    iys = numpy.arange(max(y0, 0), min(y1, maxy) + 1)
+    if _render_scale <= 2:
+        sx, sy = ixs - x, iys - y
+    else:
+        sx, sy = (2*ixs + 1)*_render_scale//4 - x, (2*iys + 1)*_render_scale//4 - y
+    sx = numpy.clip(sx, 0, w-1)
+    sy = numpy.clip(sy, 0, h-1)
+
+    v = pixels[sy[:,None], sx[None,:]].astype(numpy.int32)
+    ys, xs = numpy.nonzero(v)
+    b = max(0, min(brightness, 255))
+    values = ((b*v[ys, xs] + 127)//255).astype(numpy.uint8)
+    return ixs[xs], iys[ys], values
+
+def blit_sprite(img, id, x, y, brightness):
+    draw_list(img, [DRAW_SPRITE_2X, x, y, id, brightness])
+
+#---------------------------------------------------------------------------------------------------------------------
+# Background cache
+
+_background = None
+_background_key = 0
+
+def store_background(img, key):
+    global _background, _background_key
+    _background = img.mem.copy()
+    _background_key = key
+
+def restore_background(img, key):
+    if _background is None or key != _background_key or _background.shape != img.mem.shape:
+        return 0
+    img.mem[...] = _background
+    return 1
+
+def invalidate_background():
+    global _background
+    _background = None
+
+def restore_background_rect(img, key, x, y, w, h):
+    if _background is None or key != _background_key or _background.shape != img.mem.shape:
+        return 0
+    # The rectangle is in screen pixels.
+    s = _render_scale
+    x0 = max(x // s, 0)
+    y0 = max(y // s, 0)
+    x1 = min((x + w + s - 1) // s, img.width)
+    y1 = min((y + h + s - 1) // s, img.height)
+    if x1 > x0 and y1 > y0:
+        img.mem[y0:y1, x0:x1] = _background[y0:y1, x0:x1]
+    return 1
+
+#---------------------------------------------------------------------------------------------------------------------
+# Dirty rectangles
+
+_dirty = None
+
+def begin_dirty():
+    global _dirty
+    _dirty = None
+
+def _mark_dirty(x0, y0, x1, y1):
+    global _dirty
+    if _dirty is None:
+        _dirty = [x0, y0, x1, y1]
+    else:
+        _dirty[0] = min(_dirty[0], x0)
+        _dirty[1] = min(_dirty[1], y0)
+        _dirty[2] = max(_dirty[2], x1)
+        _dirty[3] = max(_dirty[3], y1)
+
+def get_dirty_rect():
+    if _dirty is None:
+        return (0, 0, 0, 0)
+    # Screen pixels per image coordinate.
+    unit = 2 if _render_scale == 1 else _render_scale
+    x0 = max(_dirty[0]*unit, 0)
+    y0 = max(_dirty[1]*unit, 0)
+    x1 = min((_dirty[2]+1)*unit, _actual_screen_width)
+    y1 = min((_dirty[3]+1)*unit, _actual_screen_height)
+    if x1 <= x0 or y1 <= y0:
+        return (0, 0, 0, 0)
+    return (x0, y0, x1-x0, y1-y0)
+
+#---------------------------------------------------------------------------------------------------------------------
+# 3D primitives
+
+_actual_screen_width = 1200
+_actual_screen_height = 825
+_viewport_scale = 100<<8
+
+def set_3d_params(w, h, s):
+    global _actual_screen_width, _actual_screen_height, _viewport_scale
+    _actual_screen_width = w
+    _actual_screen_height = h
+    _viewport_scale = s
+
+    # The projection changed, so the cached background is stale.
+    invalidate_background()
+
+def to_fixed(x):
+    return x<<8
+
+def project_x(x, y, z):
+    return _div(_div((to_fixed(50) + _div((x - to_fixed(50)) * _viewport_scale, z + _viewport_scale)) * _actual_screen_width, 100), 256)
+
+def project_y(x, y, z):
+    return _div(_div((to_fixed(50) + _div((y - to_fixed(50)) * _viewport_scale, z + _viewport_scale)) * _actual_screen_height, 100), 256)
+
+# Python ints don't need the reciprocal table pongc.cpp uses, but the depth is kept for get_projection_depth.
+_projection_depth = 500<<8
+
+def set_projection_depth(depth):
+    global _projection_depth
+    _projection_depth = max(0, min(depth, 4000<<8))
+
+def get_projection_depth():
+    return _projection_depth
+
+def projection_factor(z):
+    return _div((1<<16) * _viewport_scale, z + _viewport_scale)
+
+def _trunc_div(a, b):
+    """Elementwise _div for int64 arrays."""
+    q = numpy.abs(a) // numpy.abs(b)
+    return numpy.where((a < 0) != (b < 0), -q, q)
+
+def project_points(points, out):
+    """Projects packed (x, y, z) triples from a buffer to (x, y) pairs in a writable buffer.  Returns the number of
+    points written."""
+    src = numpy.frombuffer(points, numpy.intc)
+    dst = numpy.frombuffer(out, numpy.intc)
+    n = min(len(src)//3, len(dst)//2)
+    p = src[:n*3].reshape(n, 3).astype(numpy.int64)
+    z = p[:,2] + _viewport_scale
+    for axis, size in ((0, _actual_screen_width), (1, _actual_screen_height)):
+        v = to_fixed(50) + _trunc_div((p[:,axis] - to_fixed(50)) * _viewport_scale, z)
+        dst[axis:n*2:2] = _trunc_div(_trunc_div(v * size, 100), 256)
+    return n
+
+def _rect_3d_lines(x0, y0, x1, y1, depth):
+    px0 = _div(project_x(x0, y0, depth) + 1, 2)
+    py0 = _div(project_y(x0, y0, depth) + 1, 2)
+    px1 = _div(project_x(x1, y1, depth) - 1, 2)
+    py1 = _div(project_y(x1, y1, depth) - 1, 2)
+    return [(px0, py0, px1, py0), (px1, py0, px1, py1), (px1, py1, px0, py1), (px0, py1, px0, py0)]
+
+def _circle_3d_params(x, y, z, radius):
+    r = _div(project_x(x+radius, y, z) - project_x(x, y, z), 2)
+    if r < 1:
+        return None
+    return _div(project_x(x, y, z), 2), _div(project_y(x, y, z), 2), r, r
+
+def _ellipse_3d_params(x, y, z, rx, ry):
+    rx = _div(project_x(x+rx, y, z) - project_x(x, y, z), 2)
+    ry = _div(project_y(x, y+ry, z) - project_y(x, y, z), 2)
+    if rx < 1 or ry < 1:
+        return None
+    return _div(project_x(x, y, z), 2), _div(project_y(x, y, z), 2), rx, ry
+
+def draw_line_3d(img, x0, y0, z0, x1, y1, z1, c):
+    draw_list(img, [DRAW_LINE_3D, x0, y0, z0, x1, y1, z1, int(c*255.0)])
+
+def draw_rect_3d(img, x0, y0, x1, y1, depth, c):
+    draw_list(img, [DRAW_RECT_3D, x0, y0, x1, y1, depth, int(c*255.0)])
+
+def draw_circle_3d(img, x, y, z, radius, c):
+    draw_list(img, [DRAW_CIRCLE_3D, x, y, z, radius, int(c*255.0)])
+
+def fill_circle_3d(img, x, y, z, radius, c):
+    draw_list(img, [DRAW_FILL_CIRCLE_3D, x, y, z, radius, int(c*255.0)])
+
+def draw_ellipse_3d(img, x, y, z, rx, ry, c):
+    draw_list(img, [DRAW_ELLIPSE_3D, x, y, z, rx, ry, int(c*255.0)])
+
+#---------------------------------------------------------------------------------------------------------------------
+# Draw lists
+
+def draw_list(img, cmds):
+    """Rasterizes a packed draw list.  Pixels of consecutive primitives with the same color are written in one batch."""
+    batch_xs = []
+    batch_ys = []
+    batch_color = None
+    clip = _clip_max(img)
+
+    cmds = list(cmds)
+    pos = 0
+    while pos < len(cmds):
+        op = cmds[pos]
+        if op <= DRAW_END or op >= DRAW_MAX or pos + 1 + _draw_list_args[op] > len(cmds):
+            break
+        args = _draw_list_args[op]
+        if op == DRAW_TEXT_2X:
+            length = cmds[pos+5]
+            if length < 0 or pos + 1 + args + length > len(cmds):
+                break
+            args += length
+        a = cmds[pos+1:pos+1+args]
+        pos += 1 + args
+
+        # Sprites have a value for each pixel, so they are written right away.
+        if op == DRAW_SPRITE_2X:
+            if batch_xs:
+                _plot(img, numpy.concatenate(batch_xs), numpy.concatenate(batch_ys), batch_color)
+            batch_xs = []
+            batch_ys = []
+            batch_color = None
+            sprite = _sprite_pixels(img, a[0], a[1], a[2], a[3])
+            if sprite is not None:
+                _plot_values(img, *sprite)
+            continue
+
+        color = a[3] if op == DRAW_TEXT_2X else a[-1]
+        if color != batch_color:
+            if batch_xs:
+                _plot(img, numpy.concatenate(batch_xs), numpy.concatenate(batch_ys), batch_color)
+            batch_xs = []
+            batch_ys = []
+            batch_color = color
+
+        if op == DRAW_LINE_2X:
+            lines = [a[0:4]]
+        elif op == DRAW_LINE_3D:
+            lines = [(_div(project_x(a[0], a[1], a[2]), 2), _div(project_y(a[0], a[1], a[2]), 2),
+                      _div(project_x(a[3], a[4], a[5]), 2), _div(project_y(a[3], a[4], a[5]), 2))]
+        elif op == DRAW_RECT_3D:
+            lines = _rect_3d_lines(a[0], a[1], a[2], a[3], a[4])
+        elif op in (DRAW_TEXT_2X, DRAW_ICON_2X):
+            # Already in image coordinates.
+            lines = []
+            if op == DRAW_TEXT_2X:
+                scaled = _text_lines(a[0], a[1], a[5:], a[2])
+            else:
+                scaled = _icon_lines(a[0], a[1], a[2], a[3])
+            for x0, y0, x1, y1 in scaled:
+                _mark_dirty(x0, y0, x1, y1)
+                xs, ys = _line_points(x0, y0, x1, y1, clip)
+                batch_xs.append(xs)
+                batch_ys.append(ys)
+        else:
+            lines = []
+            fill = op in (DRAW_FILL_ELLIPSE_2X, DRAW_FILL_CIRCLE_3D)
+            if op in (DRAW_ELLIPSE_2X, DRAW_FILL_ELLIPSE_2X):
+                e = a[0:4]
+            elif op in (DRAW_CIRCLE_3D, DRAW_FILL_CIRCLE_3D):
+                e = _circle_3d_params(a[0], a[1], a[2], a[3])
+            else:
+                e = _ellipse_3d_params(a[0], a[1], a[2], a[3], a[4])
+            if e is not None:
+                x, y, rx, ry = e
+                x, y, rx, ry = _scale_coord(x), _scale_coord(y), _scale_radius(rx), _scale_radius(ry)
+                _mark_dirty(x-rx-1, y-ry-1, x+rx, y+ry)
+                xs, ys = _ellipse_points(x, y, rx, ry, fill, clip)
+                batch_xs.append(xs)
+                batch_ys.append(ys)
+
+        for x0, y0, x1, y1 in lines:
+            x0, y0, x1, y1 = _scale_coord(x0), _scale_coord(y0), _scale_coord(x1), _scale_coord(y1)
+            _mark_dirty(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+            xs, ys = _line_points(x0, y0, x1, y1, clip)
+            batch_xs.append(xs)
+            batch_ys.append(ys)
+
+    if batch_xs:
+        _plot(img, numpy.concatenate(batch_xs), numpy.concatenate(batch_ys), batch_color)
+
+#---------------------------------------------------------------------------------------------------------------------
+# Rasterization threads
+# NumPy does the heavy lifting here, so draw lists are always rasterized by the calling thread.
+
+def set_raster_threads(n):
+    pass
+
+def get_raster_threads():
+    return 1
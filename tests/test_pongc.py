@@ -0,0 +1,201 @@
+# Copyright 2009 by Wade Brainerd.
+# This file is part of Bounce.
+#
+# Bounce is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Bounce is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Bounce.  If not, see <http://www.gnu.org/licenses/>.
+"""Checks that the rasterizers agree with each other.
+
+Draw lists must give the same pixels as the primitives drawn one at a time, pongcompat must give the same pixels as
+pongnp, and pongnp must give the same pixels as the native blobs.  Tests that need something not installed here are
+skipped.
+
+    python tests/test_pongc.py"""
+
+import os, sys, types, random, array, unittest
+
+_root_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(_root_path, 'pongc'))
+
+try:
+    import numpy
+    import pongnp
+except ImportError:
+    pongnp = None
+
+WIDTH = 600
+HEIGHT = 450
+
+# Per-primitive functions of the blobs built before draw lists, which pongcompat is built on.
+LEGACY_API = ['clear_image', 'draw_line_2x', 'draw_ellipse_2x', 'fill_ellipse_2x', 'set_3d_params', 'to_fixed',
+              'project_x', 'project_y', 'draw_line_3d', 'draw_rect_3d', 'draw_circle_3d', 'fill_circle_3d',
+              'draw_ellipse_3d']
+
+def random_primitives(rnd, count):
+    """Returns count random primitives as (opcode, args, per-primitive function name, its args) tuples.  Some of
+    them reach outside the image."""
+    def fixed(lo, hi):
+        return rnd.randint(lo<<8, hi<<8)
+    prims = []
+    for i in range(count):
+        op = rnd.choice(range(1, 12))
+        color = rnd.randint(0, 255)
+        c = color/255.0
+        if op == 1:
+            a = [rnd.randint(-100, 400), rnd.randint(-100, 300), rnd.randint(-100, 400), rnd.randint(-100, 300)]
+            prims.append((op, a + [color], 'draw_line_2x', a + [color]))
+        elif op in (2, 3):
+            a = [rnd.randint(-20, 320), rnd.randint(-20, 240), rnd.randint(0, 40), rnd.randint(0, 40)]
+            prims.append((op, a + [color], op == 2 and 'draw_ellipse_2x' or 'fill_ellipse_2x', a + [color]))
+        elif op == 4:
+            a = [fixed(0, 99), fixed(0, 99), fixed(0, 160), fixed(0, 99), fixed(0, 99), fixed(0, 160)]
+            prims.append((op, a + [int(c*255.0)], 'draw_line_3d', a + [c]))
+        elif op == 5:
+            a = [fixed(0, 50), fixed(0, 50), fixed(50, 99), fixed(50, 99), fixed(0, 160)]
+            prims.append((op, a + [int(c*255.0)], 'draw_rect_3d', a + [c]))
+        elif op in (6, 7):
+            a = [fixed(0, 99), fixed(0, 99), fixed(0, 160), fixed(1, 10)]
+            prims.append((op, a + [int(c*255.0)], op == 6 and 'draw_circle_3d' or 'fill_circle_3d', a + [c]))
+        elif op == 8:
+            a = [fixed(0, 99), fixed(0, 99), fixed(0, 160), fixed(1, 10), fixed(1, 10)]
+            prims.append((op, a + [int(c*255.0)], 'draw_ellipse_3d', a + [c]))
+        elif op == 9:
+            text = ''.join([chr(rnd.randint(32, 126)) for j in range(rnd.randint(0, 6))])
+            x, y, scale = rnd.randint(-10, 300), rnd.randint(-10, 220), rnd.randint(1, 3)
+            prims.append((op, [x, y, scale, color, len(text)] + [ord(ch) for ch in text], 'draw_text_2x',
+                          [x, y, text, scale, color]))
+        elif op == 10:
+            a = [rnd.randint(-10, 300), rnd.randint(-10, 220), rnd.randint(0, 1), rnd.randint(1, 3), color]
+            prims.append((op, a, 'draw_icon_2x', a))
+        else:
+            x, y, id = rnd.randint(-10, 300), rnd.randint(-10, 220), rnd.randint(0, 13)
+            prims.append((op, [x, y, id, color], 'blit_sprite', [id, x, y, color]))
+    return prims
+
+def draw_list_of(prims):
+    cmds = array.array('i')
+    for op, args, name, fargs in prims:
+        cmds.append(op)
+        cmds.extend(args)
+    return cmds
+
+class PongnpTest(unittest.TestCase):
+    def setUp(self):
+        if pongnp is None:
+            self.skipTest('NumPy is not installed')
+        pongnp.set_render_scale(1)
+        pongnp.set_3d_params(WIDTH, HEIGHT, 100<<8)
+
+    def test_draw_list_matches_primitives(self):
+        rnd = random.Random(1)
+        for scale in (1, 2, 3):
+            pongnp.set_render_scale(scale)
+            for i in range(20):
+                prims = random_primitives(rnd, 20)
+                listed = pongnp.new_image(WIDTH, HEIGHT)
+                pongnp.draw_list(listed, draw_list_of(prims))
+                single = pongnp.new_image(WIDTH, HEIGHT)
+                for op, args, name, fargs in prims:
+                    getattr(pongnp, name)(single, *fargs)
+                self.assertTrue((listed.mem == single.mem).all(), 'render scale %d, list %d' % (scale, i))
+
+    def test_compat_matches_pongnp(self):
+        # Stand in for a blob without draw lists with the per-primitive functions of pongnp.
+        blob = types.ModuleType('pongclib')
+        for name in LEGACY_API:
+            setattr(blob, name, getattr(pongnp, name))
+        saved = sys.modules.get('pongclib')
+        sys.modules['pongclib'] = blob
+        try:
+            sys.modules.pop('pongcompat', None)
+            import pongcompat
+            pongcompat.set_3d_params(WIDTH, HEIGHT, 100<<8)
+            rnd = random.Random(2)
+            for i in range(20):
+                cmds = draw_list_of(random_primitives(rnd, 20))
+                expected = pongnp.new_image(WIDTH, HEIGHT)
+                pongnp.draw_list(expected, cmds)
+                actual = pongnp.new_image(WIDTH, HEIGHT)
+                pongcompat.draw_list(actual, cmds)
+                self.assertTrue((expected.mem == actual.mem).all(), 'list %d' % i)
+        finally:
+            sys.modules.pop('pongcompat', None)
+            if saved is None:
+                sys.modules.pop('pongclib', None)
+            else:
+                sys.modules['pongclib'] = saved
+
+    def test_far_lines_are_clipped(self):
+        # Lines reaching far outside the image give the same pixels as short lines along them.
+        for far, near in [((-10**8, 100, 10**8, 100), (-1000, 100, 1000, 100)),
+                          ((100, -10**8, 100, 10**8), (100, -1000, 100, 1000)),
+                          ((-10**8, -10**8, 10**8, 10**8), (-1000, -1000, 1000, 1000)),
+                          ((10**8, -10**8, -10**8, 10**8), (1000, -1000, -1000, 1000))]:
+            far_img = pongnp.new_image(WIDTH, HEIGHT)
+            pongnp.draw_line_2x(far_img, *(far + (255,)))
+            near_img = pongnp.new_image(WIDTH, HEIGHT)
+            pongnp.draw_line_2x(near_img, *(near + (255,)))
+            self.assertTrue(near_img.mem.any())
+            self.assertTrue((far_img.mem == near_img.mem).all(), str(far))
+
+def load_native():
+    """Returns the pongc package when it uses blobs with draw lists, or None."""
+    os.environ.pop('PONGC_BACKEND', None)
+    sys.path.insert(0, _root_path)
+    try:
+        try:
+            import pongc
+        except ImportError:
+            return None
+    finally:
+        sys.path.remove(_root_path)
+    if pongc.PONGC_BACKEND != 'native':
+        return None
+    return pongc
+
+class NativeTest(unittest.TestCase):
+    def setUp(self):
+        if pongnp is None:
+            self.skipTest('NumPy is not installed')
+        try:
+            import cairo
+        except ImportError:
+            self.skipTest('pycairo is not installed')
+        self.cairo = cairo
+        self.pongc = load_native()
+        if self.pongc is None:
+            self.skipTest('no blobs with draw lists load here')
+        for module in (self.pongc, pongnp):
+            module.set_render_scale(1)
+            module.set_3d_params(WIDTH, HEIGHT, 100<<8)
+
+    def gray(self, surface):
+        surface.flush()
+        pixels = numpy.frombuffer(surface.get_data(), numpy.uint32).reshape(HEIGHT, surface.get_stride()/4)
+        return (pixels[:, :WIDTH] & 0xff).astype(numpy.uint8)
+
+    def test_pongnp_matches_native(self):
+        rnd = random.Random(3)
+        for scale in (1, 2, 3):
+            self.pongc.set_render_scale(scale)
+            pongnp.set_render_scale(scale)
+            for i in range(20):
+                cmds = draw_list_of(random_primitives(rnd, 20))
+                surface = self.cairo.ImageSurface(self.cairo.FORMAT_RGB24, WIDTH, HEIGHT)
+                self.pongc.clear_image(surface)
+                self.pongc.draw_list(surface, cmds)
+                img = pongnp.new_image(WIDTH, HEIGHT)
+                pongnp.draw_list(img, cmds)
+                self.assertTrue((self.gray(surface) == img.mem).all(), 'render scale %d, list %d' % (scale, i))
+
+if __name__ == '__main__':
+    unittest.main()